@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+cliutil.DatelineFormatterと従来のeval_dateline()の速度比較
+
+5000ジョブ分のジョブ情報を生成し、開始時刻の表示用文字列の作成と
+print_joblist()全体の処理時間を計測する
+
+usage: python3 benchmarks/bench_dateline.py [-n JOBS] [-r REPEAT]
+"""
+from contextlib import redirect_stdout
+from datetime import timedelta
+from timeit import repeat
+import argparse
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import cliutil
+import fixtures
+from run_benchmarks import CONFIG, load_rj
+from rjsched import RecordJobOpenpbs
+
+def eval_dateline(time, dateline):
+    """
+    従来のeval_dateline()
+    """
+    if time.hour >= dateline:
+        wday = time.strftime("%a")
+        year = time.strftime("%Y")
+        mon  = time.strftime("%m")
+        day  = time.strftime("%d")
+        hour = time.strftime("%H")
+    else:
+        wday = (time - timedelta(days=1)).strftime("%a")
+        year = (time - timedelta(days=1)).strftime("%Y")
+        mon  = (time - timedelta(days=1)).strftime("%m")
+        day  = (time - timedelta(days=1)).strftime("%d")
+        hour = str(int(time.strftime("%H")) + 24)
+    return wday, year, mon, day, hour
+
+def str_w_ymd_hms(time, dateline=0, year=False, sec=False):
+    """
+    従来のstr_w_ymd_hms()
+    """
+    _wday, _year, _mon, _day, _hour = eval_dateline(time, dateline)
+
+    if year:
+        w_ymd = '{} {:0>4}/{:0>2}/{:0>2}'.format(_wday, _year, _mon, _day)
+    else:
+        w_ymd = '{} {:>2}/{:<2}'.format(_wday, _mon, _day)
+
+    if sec:
+        hms = '{:0>2}:{:0>2}:{:0>2}'.format(_hour, time.minute, time.second)
+    else:
+        hms = '{:0>2}:{:0>2}'.format(_hour, time.minute)
+
+    return w_ymd + ' ' + hms
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--jobs', type=int, default=5000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rec = RecordJobOpenpbs.RecordJobOpenpbs(CONFIG)
+    chlist = fixtures.channel_list()
+    rec.get_channel_list = lambda: chlist
+    rec._build_joblist(fixtures.make_qstat(args.jobs))
+    joblist = list(rec.joblist)
+    begins = [i['rec_begin'] for i in joblist]
+    dateline = CONFIG['day_change_hour']
+
+    # 従来の表示と同じ文字列になることを確認する
+    formatter = cliutil.DatelineFormatter(dateline)
+    for i in begins:
+        assert formatter.format(i, sec=True) == \
+            str_w_ymd_hms(i, dateline, sec=True)
+
+    def legacy():
+        prev_wday = ''
+        for i in begins:
+            wday = str_w_ymd_hms(i, dateline, False, True).split()[0]
+            if wday != prev_wday:
+                prev_wday = wday
+
+    def formatter_fields():
+        formatter = cliutil.DatelineFormatter(dateline)
+        prev_date = None
+        for i in begins:
+            fields = formatter.fields(i)
+            formatter.format_fields(fields, sec=True)
+            if fields.date != prev_date:
+                prev_date = fields.date
+
+    rj = load_rj()
+
+    def render_list():
+        with redirect_stdout(io.StringIO()):
+            rj.print_joblist(joblist, CONFIG)
+
+    print('{} jobs'.format(args.jobs))
+    results = [
+        ('eval_dateline', legacy),
+        ('DatelineFormatter', formatter_fields),
+        ('print_joblist', render_list),
+    ]
+    for name, func in results:
+        best = min(repeat(func, number=1, repeat=args.repeat))
+        print('{:<28} {:8.1f} ms'.format(name, best * 1000))
+
+if __name__ == '__main__':
+    main()
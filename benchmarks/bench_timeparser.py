@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+rjsched.TimeParserとdatetime.strptime()の速度比較
+
+10000ジョブ分のqstat -f -F jsonの出力を生成し、
+時刻文字列の変換と_build_joblist()全体の処理時間を計測する
+
+usage: python3 benchmarks/bench_timeparser.py [-n JOBS] [-r REPEAT]
+"""
+from datetime import datetime, timedelta
+from timeit import repeat
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import fixtures
+from rjsched import RecordJobOpenpbs, TimeParser
+
+ASCTIME = "%a %b %d %H:%M:%S %Y"
+
+def strptime_asctime(text):
+    return datetime.strptime(text, ASCTIME)
+
+def strptime_walltime(text):
+    h, m, s = [int(i) for i in text.split(':')]
+    return timedelta(hours=h, minutes=m, seconds=s)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--jobs', type=int, default=10000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    stdout = fixtures.make_qstat(args.jobs)
+    jobs = json.loads(stdout)['Jobs'].values()
+    stamps = [
+        j[k] for j in jobs
+            for k in ('Execution_Time', 'etime', 'qtime', 'ctime', 'mtime')
+                if k in j]
+
+    def cold():
+        TimeParser.parse_asctime.cache_clear()
+        for i in stamps:
+            TimeParser.parse_asctime(i)
+
+    def warm():
+        for i in stamps:
+            TimeParser.parse_asctime(i)
+
+    def strptime():
+        for i in stamps:
+            strptime_asctime(i)
+
+    rec = RecordJobOpenpbs.RecordJobOpenpbs({
+        'recpt1_path': 'recpt1',
+        'recpt1ctl_path': 'recpt1ctl',
+        'pbsexec_dir': '/usr/bin',})
+    rec.get_channel_list = lambda: {}
+
+    def build():
+        TimeParser.parse_asctime.cache_clear()
+        TimeParser.parse_walltime.cache_clear()
+        rec._build_joblist(stdout)
+
+    def build_strptime():
+        saved = (RecordJobOpenpbs.parse_asctime, RecordJobOpenpbs.parse_walltime)
+        RecordJobOpenpbs.parse_asctime = strptime_asctime
+        RecordJobOpenpbs.parse_walltime = strptime_walltime
+        try:
+            rec._build_joblist(stdout)
+        finally:
+            RecordJobOpenpbs.parse_asctime, RecordJobOpenpbs.parse_walltime = saved
+
+    print('{} jobs, {} timestamps'.format(args.jobs, len(stamps)))
+    results = [
+        ('strptime', strptime),
+        ('parse_asctime (cold)', cold),
+        ('parse_asctime (warm)', warm),
+        ('_build_joblist strptime', build_strptime),
+        ('_build_joblist TimeParser', build),
+    ]
+    for name, func in results:
+        best = min(repeat(func, number=1, repeat=args.repeat))
+        print('{:<28} {:8.1f} ms'.format(name, best * 1000))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+ベンチマーク用のスケジューラー出力を生成する
+
+qstat -f -F json, pbsnodes -a -F json, systemctl --user show、
+Torqueのqstat -f -1, pbsnodes -a の出力とsystemdのユニットファイルを任意のジョブ数で生成する。
+録画予約は番組表からまとめて登録されることを想定し、
+30分ごとの枠に地上波2件、衛星放送1件を割り当てる。
+"""
+from datetime import datetime, timedelta
+import json
+import os
+
+ASCTIME = "%a %b %d %H:%M:%S %Y"
+SYSTEMD_TIME = "%a %Y-%m-%d %H:%M:%S JST"
+BASE = datetime(2020, 8, 16, 20, 0, 0)
+CHANNELS_TT = ['15', '16', '18', '21', '22', '23', '24', '25', '26', '27']
+CHANNELS_BS = ['101', '103', '141', '151', '161', '171', '181', '191', '211']
+
+def channel_list():
+    """
+    channel.ymlに相当するチャンネル番号と局名の対応表
+    """
+    chlist = {ch: 'TT{}'.format(ch) for ch in CHANNELS_TT}
+    chlist.update({ch: 'BS{}'.format(ch) for ch in CHANNELS_BS})
+    return chlist
+
+def schedule(num):
+    """
+    num件の録画予約の(番号, チャンネル, チューナー, 開始時刻)を返す
+    """
+    for i in range(num):
+        begin = BASE + timedelta(minutes=30 * (i // 3))
+        if i % 3 == 2:
+            ch = CHANNELS_BS[i % len(CHANNELS_BS)]
+            tuner = 'bs'
+        else:
+            ch = CHANNELS_TT[i % len(CHANNELS_TT)]
+            tuner = 'tt'
+        yield i, ch, tuner, begin
+
+def make_qstat(num, running=3):
+    """
+    num件のジョブを持つqstat -f -F jsonの出力を返す
+    先頭のrunning件は録画中のジョブとする
+    """
+    jobs = {}
+    for i, ch, tuner, begin in schedule(num):
+        # 100件ずつまとめて登録されたものとする
+        submit = BASE - timedelta(days=1) + timedelta(minutes=i // 100)
+        job = {
+            'Job_Name': 'title{}.{}'.format(i, ch),
+            'Job_Owner': 'autumn@example.org',
+            'job_state': 'W',
+            'queue': 'workq',
+            'server': 'example.org',
+            'Checkpoint': 'u',
+            'ctime': submit.strftime(ASCTIME),
+            'Error_Path': 'example.org:/home/autumn/log/',
+            'Execution_Time': begin.strftime(ASCTIME),
+            'Hold_Types': 'n',
+            'Join_Path': 'oe',
+            'Keep_Files': 'n',
+            'Mail_Points': 'a',
+            'mtime': submit.strftime(ASCTIME),
+            'Output_Path': 'example.org:/home/autumn/log/',
+            'Priority': 0,
+            'qtime': submit.strftime(ASCTIME),
+            'Rerunable': 'True',
+            'Resource_List': {
+                'ncpus': 1,
+                'nodect': 1,
+                'place': 'pack',
+                'select': '1:{}=1'.format(tuner),
+                tuner: 1,
+                'walltime': '00:29:30',
+            },
+            'substate': 41,
+            'Variable_List': {
+                'PBS_O_HOME': '/home/autumn',
+                'PBS_O_LANG': 'ja_JP.UTF-8',
+                'PBS_O_LOGNAME': 'autumn',
+                'PBS_O_SHELL': '/bin/bash',
+                'PBS_O_WORKDIR': '/home/autumn',
+                'PBS_O_SYSTEM': 'Linux',
+                'PBS_O_QUEUE': 'workq',
+                'PBS_O_HOST': 'example.org',
+            },
+            'euser': 'autumn',
+            'egroup': 'autumn',
+            'queue_type': 'E',
+            'umask': 222,
+            'etime': submit.strftime(ASCTIME),
+            'Submit_arguments': '-N title{}.{} -'.format(i, ch),
+            'project': '_pbs_project_default',
+        }
+        if i < running:
+            job['job_state'] = 'R'
+            job['etime'] = begin.strftime(ASCTIME)
+            job['exec_host'] = 'node{}/0'.format(i % 4)
+            del job['Execution_Time']
+        jobs['{}.example.org'.format(i)] = job
+
+    return json.dumps({
+        'timestamp': 1597575600,
+        'pbs_version': '20.0.1',
+        'pbs_server': 'example.org',
+        'Jobs': jobs}, indent=4)
+
+def make_pbsnodes(num=4, tt=1, bs=1):
+    """
+    num台のノードを持つpbsnodes -a -F jsonの出力を返す
+    """
+    nodes = {}
+    for i in range(num):
+        nodes['node{}'.format(i)] = {
+            'Mom': 'node{}.example.org'.format(i),
+            'Port': 15002,
+            'pbs_version': '20.0.1',
+            'ntype': 'PBS',
+            'state': 'free',
+            'pcpus': 4,
+            'resources_available': {
+                'arch': 'linux',
+                'host': 'node{}'.format(i),
+                'mem': '8064700kb',
+                'ncpus': 4,
+                'tt': tt,
+                'bs': bs,
+                'vnode': 'node{}'.format(i),
+            },
+            'resources_assigned': {},
+            'resv_enable': 'True',
+            'sharing': 'default_shared',
+            'license': 'l',
+            'last_state_change_time': 1597575600,
+        }
+    return json.dumps({
+        'timestamp': 1597575600,
+        'pbs_version': '20.0.1',
+        'pbs_server': 'example.org',
+        'nodes': nodes}, indent=4)
+
+def make_torque_qstat(num, running=3):
+    """
+    num件のジョブを持つTorqueのqstat -f -1の出力を返す
+    先頭のrunning件は録画中のジョブとする
+    """
+    blocks = []
+    for i, ch, tuner, begin in schedule(num):
+        submit = BASE - timedelta(days=1) + timedelta(minutes=i // 100)
+        lines = [
+            'Job Id: {}.torque.example.org'.format(i),
+            '    Job_Name = {}.title{}'.format(ch, i),
+            '    Job_Owner = autumn@torque.example.org',
+            '    job_state = {}'.format('R' if i < running else 'W'),
+            '    queue = {}'.format(tuner),
+            '    server = torque.example.org',
+            '    Checkpoint = u',
+            '    ctime = {}'.format(submit.strftime(ASCTIME)),
+            '    Error_Path = torque.example.org:/home/autumn/log/',
+        ]
+        if i < running:
+            lines.append('    exec_host = node{}/0'.format(i % 4))
+        else:
+            lines.append(
+                '    Execution_Time = {}'.format(begin.strftime(ASCTIME)))
+        lines += [
+            '    Hold_Types = n',
+            '    Join_Path = oe',
+            '    Keep_Files = n',
+            '    Mail_Points = a',
+            '    mtime = {}'.format(submit.strftime(ASCTIME)),
+            '    Output_Path = torque.example.org:/home/autumn/log/',
+            '    Priority = 0',
+            '    qtime = {}'.format(submit.strftime(ASCTIME)),
+            '    Rerunable = True',
+            '    Resource_List.nodect = 1',
+            '    Resource_List.nodes = 1',
+            '    Resource_List.walltime = 00:29:30',
+            '    Shell_Path_List = /bin/sh',
+            '    euser = autumn',
+            '    egroup = autumn',
+            '    queue_type = E',
+            '    etime = {}'.format(submit.strftime(ASCTIME)),
+            '    submit_args = /home/autumn/jobsh/title{}.sh'.format(i),
+            '    Variable_List = PBS_O_QUEUE={},PBS_O_HOME=/home/autumn,'
+                'PBS_O_LOGNAME=autumn,PBS_O_SHELL=/bin/bash'.format(tuner),
+        ]
+        if i < running:
+            lines.append(
+                '    start_time = {}'.format(begin.strftime(ASCTIME)))
+        blocks.append('\n'.join(lines))
+    return '\n\n'.join(blocks) + '\n'
+
+def make_torque_pbsnodes(num=4, np=1):
+    """
+    num台のノードを持つTorqueのpbsnodes -aの出力を返す
+    偶数番目のノードは地上波(tt)、奇数番目は衛星放送(bs)のキューに所属する
+    """
+    blocks = []
+    for i in range(num):
+        blocks.append('\n'.join([
+            'node{}'.format(i),
+            '     state = free',
+            '     np = {}'.format(np),
+            '     properties = {}'.format('tt' if i % 2 == 0 else 'bs'),
+            '     ntype = cluster',
+            '     status = rectime=1597575600,ncpus=4',
+        ]))
+    return '\n\n'.join(blocks) + '\n\n'
+
+def make_systemctl_show(num, unitdir='/home/autumn/.config/systemd/user'):
+    """
+    num件のジョブを持つsystemctl --user --all --no-pager showの出力を返す
+    ジョブごとにtimerユニットとserviceユニットの情報を出力する
+    """
+    blocks = []
+    for i, ch, tuner, begin in schedule(num):
+        unit = 'RJ.{}.title{}.{}.{}'.format(
+            ch, i, begin.strftime('%Y%m%d%H%M%S'), tuner)
+        timer = [
+            'Id={}.timer'.format(unit),
+            'Names={}.timer'.format(unit),
+            'Description=RJ:ONESHOT: timer unit for title{}'.format(i),
+            'LoadState=loaded',
+            'ActiveState=active',
+            'SubState=waiting',
+            'FragmentPath={}/{}.timer'.format(unitdir, unit),
+            'UnitFileState=enabled',
+            'NextElapseUSecRealtime={}'.format(begin.strftime(SYSTEMD_TIME)),
+            'NextElapseUSecMonotonic=0',
+            'LastTriggerUSec=n/a',
+            'LastTriggerUSecMonotonic=0',
+            'Result=success',
+            'AccuracyUSec=1s',
+            'RandomizedDelayUSec=0',
+            'Persistent=no',
+            'WakeSystem=no',
+            'RemainAfterElapse=no',
+            'Unit={}.service'.format(unit),
+            'CollectMode=inactive-or-failed',
+        ]
+        service = [
+            'Id={}.service'.format(unit),
+            'Names={}.service'.format(unit),
+            'Description=RJ: service unit for title{}'.format(i),
+            'LoadState=loaded',
+            'ActiveState=inactive',
+            'SubState=dead',
+            'FragmentPath={}/{}.service'.format(unitdir, unit),
+            'UnitFileState=static',
+            'Type=simple',
+            'Restart=no',
+            'MainPID=0',
+            'ControlPID=0',
+            'Environment=RJ_ch={} RJ_walltime=1770'.format(ch),
+            'ExecStart={ path=/bin/bash ; argv[]=/bin/bash -c ... }',
+            'Result=success',
+            'UID=[not set]',
+            'GID=[not set]',
+            'MemoryCurrent=[not set]',
+            'TasksCurrent=[not set]',
+            'CollectMode=inactive-or-failed',
+        ]
+        blocks.append('\n'.join(timer))
+        blocks.append('\n'.join(service))
+    return '\n\n'.join(blocks) + '\n'
+
+def _unit_name(i, ch, tuner, begin):
+    return 'RJ.{}.title{}.{}.{}'.format(
+        ch, i, begin.strftime('%Y%m%d%H%M%S'), tuner)
+
+def write_unit_files(num, unitdir):
+    """
+    num件のジョブのtimer/serviceユニットファイルをunitdirに書き込む
+    内容はRecordJobSystemdのテンプレートと同じ形式にする
+    """
+    for i, ch, tuner, begin in schedule(num):
+        unit = os.path.join(unitdir, _unit_name(i, ch, tuner, begin))
+        with open(unit + '.timer', 'w') as f:
+            f.write(
+                '# created programmatically via rj. Do not edit.\n'
+                '[Unit]\n'
+                'Description=RJ:ONESHOT: timer unit for title{}\n'
+                'CollectMode=inactive-or-failed\n\n'
+                '[Timer]\n'
+                'AccuracySec=1s\n'
+                'OnCalendar={}\n'
+                'RemainAfterElapse=no\n\n'
+                '[Install]\n'
+                'WantedBy=timers.target\n'.format(
+                    i, begin.strftime('%Y-%m-%d %H:%M:%S')))
+        with open(unit + '.service', 'w') as f:
+            f.write(
+                '# created programmatically via rj. Do not edit.\n'
+                '[Unit]\n'
+                'Description=RJ: service unit for title{}\n'
+                'CollectMode=inactive-or-failed\n\n'
+                '[Service]\n'
+                'Environment="RJ_ch={}" "RJ_walltime=1770"\n'
+                'ExecStart=@/bin/bash "/bin/bash" "-c" "recpt1 $$RJ_ch '
+                '$$RJ_walltime /home/autumn/rec/title{}.{}.ts"\n'.format(
+                    i, ch, i, ch))
+
+def make_systemctl_show_state(num):
+    """
+    num件のジョブを持つsystemctl --user --no-pager show
+    --property=Id,ActiveState,NextElapseUSecRealtime,LastTriggerUSec,MainPID
+    の出力を返す
+    """
+    blocks = []
+    for i, ch, tuner, begin in schedule(num):
+        unit = _unit_name(i, ch, tuner, begin)
+        blocks.append('\n'.join([
+            'Id={}.timer'.format(unit),
+            'ActiveState=active',
+            'NextElapseUSecRealtime={}'.format(begin.strftime(SYSTEMD_TIME)),
+            'LastTriggerUSec=n/a',
+        ]))
+        blocks.append('\n'.join([
+            'Id={}.service'.format(unit),
+            'ActiveState=inactive',
+            'MainPID=0',
+        ]))
+    return '\n\n'.join(blocks) + '\n'
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+rjのホットパスのベンチマーク
+
+fixtures.pyで生成したスケジューラーの出力を使い、
+ジョブ数ごとに下記の各段階の処理時間を個別に計測する。
+
+    OpenPBS: qstatのJSONパース、ジョブ情報の組み立て、
+             pbsnodesのパース、チューナー数チェック(合計、ホストごと)
+    Torque:  qstat -f -1の読み込みとジョブ情報の組み立て、
+             pbsnodes -aのパース、チューナー数チェック
+    Systemd: systemctl showのパース、ユニットファイルの読み込み、
+             ジョブ情報の組み立て、チューナー数チェック
+    共通:    print_joblistの日付での絞り込み、一覧表示、詳細表示
+
+結果は標準出力に表示し、JSONファイルに書き出す。
+
+usage: python3 benchmarks/run_benchmarks.py [-s 10,1000,100000] [-r 3]
+                                            [-o benchmarks/results.json]
+"""
+from contextlib import redirect_stdout
+from datetime import datetime
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from subprocess import CompletedProcess
+from unittest.mock import patch
+import argparse
+import atexit
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+TOPDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, TOPDIR)
+
+import fixtures
+from rjsched import (
+    RecordJobOpenpbs, RecordJobSystemd, RecordJobTorque, TimeParser)
+
+CONFIG = {
+    'recpt1_path': '/usr/local/bin/recpt1',
+    'recpt1ctl_path': '/usr/local/bin/recpt1ctl',
+    'recdir': '/home/autumn/rec',
+    'channel_file': '/home/autumn/.rj/channel.yml',
+    'pbsexec_dir': '/opt/pbs/bin',
+    'joblog_dir': '/home/autumn/log',
+    'day_change_hour': 5,
+    'warmup_sec': 10,
+}
+
+def load_rj():
+    """
+    拡張子のないrjスクリプトをモジュールとして読み込む
+    """
+    loader = SourceFileLoader('rj', os.path.join(TOPDIR, 'rj'))
+    module = module_from_spec(spec_from_loader('rj', loader))
+    loader.exec_module(module)
+    return module
+
+def measure(func, setup=None, repeat=3):
+    """
+    funcをrepeat回実行し、各回の処理時間(秒)のリストを返す
+    setupが指定された場合は各回の前に実行し、その戻り値をfuncに渡す
+    setupの処理時間は含めない
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        begin = time.perf_counter()
+        if setup:
+            func(arg)
+        else:
+            func()
+        times.append(time.perf_counter() - begin)
+    return times
+
+def clear_time_cache():
+    TimeParser.parse_asctime.cache_clear()
+    TimeParser.parse_oncalendar.cache_clear()
+    TimeParser.parse_systemd_time.cache_clear()
+    TimeParser.parse_walltime.cache_clear()
+
+def render_stages(rj, joblist):
+    """
+    rjの表示処理の各段階
+    """
+    date = joblist[len(joblist) // 2]['rec_begin']
+    out = io.StringIO()
+
+    def filter_date():
+        rj.filter_joblist(joblist, date, CONFIG['day_change_hour'])
+
+    def render_list():
+        out.seek(0)
+        with redirect_stdout(out):
+            rj.print_joblist(joblist, CONFIG)
+
+    def render_show():
+        out.seek(0)
+        with redirect_stdout(out):
+            rj.print_job_information(joblist, CONFIG)
+
+    return [
+        ('filter_date', filter_date, None),
+        ('render_list', render_list, None),
+        ('render_show', render_show, None),
+    ]
+
+def openpbs_stages(rj, num):
+    """
+    OpenPBSバックエンドの各段階
+    """
+    qstat = fixtures.make_qstat(num)
+    pbsnodes = fixtures.make_pbsnodes()
+    rec = RecordJobOpenpbs.RecordJobOpenpbs(CONFIG)
+    chlist = fixtures.channel_list()
+    rec.get_channel_list = lambda: chlist
+
+    rec._build_joblist(qstat)
+    joblist = list(rec.joblist)
+    nodes = rec._parse_tuner_nodes(pbsnodes)
+    tuners = rec._sum_tuners(nodes)
+
+    def build_joblist():
+        clear_time_cache()
+        rec._build_joblist(qstat)
+
+    def tuner_check(jobs):
+        rec.joblist = jobs
+        rec._check_tuner_resource(tuners)
+
+    def tuner_check_nodes(jobs):
+        rec.joblist = jobs
+        rec._check_tuner_resource(tuners, nodes)
+
+    rec._check_tuner_resource(tuners)
+    checked = list(rec.joblist)
+
+    return [
+        ('qstat_json_parse', lambda: json.loads(qstat), None),
+        ('build_joblist', build_joblist, None),
+        ('pbsnodes_parse', lambda: rec._parse_tuner_num(pbsnodes), None),
+        ('tuner_check', tuner_check, lambda: list(joblist)),
+        ('tuner_check_nodes', tuner_check_nodes, lambda: list(joblist)),
+    ] + render_stages(rj, checked)
+
+def torque_stages(rj, num):
+    """
+    Torqueバックエンドの各段階
+    qstat、pbsnodesの出力は行ごとに渡す
+    """
+    qstat = fixtures.make_torque_qstat(num).splitlines(True)
+    pbsnodes = fixtures.make_torque_pbsnodes().splitlines(True)
+    rec = RecordJobTorque.RecordJobTorque(CONFIG)
+    chlist = fixtures.channel_list()
+    rec.get_channel_list = lambda: chlist
+
+    rec._build_joblist(qstat)
+    joblist = list(rec.joblist)
+    tuners = rec._parse_pbsnodes(pbsnodes)
+
+    def build_joblist():
+        clear_time_cache()
+        rec._build_joblist(qstat)
+
+    def tuner_check(jobs):
+        rec.joblist = jobs
+        rec._check_tuner_resource(tuners)
+
+    rec._check_tuner_resource(tuners)
+    checked = list(rec.joblist)
+
+    return [
+        ('qstat_parse', lambda: list(rec._parse_qstat(qstat)), None),
+        ('build_joblist', build_joblist, None),
+        ('pbsnodes_parse', lambda: rec._parse_pbsnodes(pbsnodes), None),
+        ('tuner_check', tuner_check, lambda: list(joblist)),
+    ] + render_stages(rj, checked)
+
+def systemd_stages(rj, num):
+    """
+    Systemdバックエンドの各段階
+    systemctlの実行はfixturesの出力を返すものに置き換える
+    ユニットファイルは一時ディレクトリに書き込む
+    """
+    show = fixtures.make_systemctl_show(num)
+    state = fixtures.make_systemctl_show_state(num)
+    rec = RecordJobSystemd.RecordJobSystemd(CONFIG)
+    rec.unitdir = tempfile.mkdtemp(prefix='rj-bench-')
+    atexit.register(shutil.rmtree, rec.unitdir, True)
+    fixtures.write_unit_files(num, rec.unitdir)
+    chlist = fixtures.channel_list()
+    rec.get_channel_list = lambda: chlist
+    proc = CompletedProcess([], 0, show, '')
+
+    blocks = {
+        i.split('\n', 1)[0][len('Id='):]: i for i in state.split('\n\n')}
+
+    def run_state(command, **kwargs):
+        # --property指定のsystemctl showは指定したユニットの出力のみ返す
+        stdout = '\n\n'.join(blocks[i] for i in command if i in blocks)
+        return CompletedProcess(command, 0, stdout + '\n', '')
+
+    with patch.object(RecordJobSystemd, 'run', side_effect=run_state):
+        joblist = rec._get_job_info_systemd()
+
+    def systemctl_show_parse():
+        with patch.object(RecordJobSystemd, 'run', return_value=proc):
+            rec._systemctl_show(rec.prefix + '.*')
+
+    def base_show():
+        with patch.object(RecordJobSystemd, 'run', return_value=proc):
+            return rec._create_job_info_base_show()
+
+    def base():
+        # _append_job_info()はジョブ情報を書き換えるため毎回作り直す
+        with patch.object(RecordJobSystemd, 'run', side_effect=run_state):
+            return rec._create_job_info_base()
+
+    def append_job_info(jobs):
+        clear_time_cache()
+        rec._append_job_info(jobs)
+
+    def tuner_check(jobs):
+        rec._check_channel_resource(jobs)
+
+    return [
+        ('systemctl_show_parse', systemctl_show_parse, None),
+        ('job_info_base_show', base_show, None),
+        ('scan_unit_files', rec._scan_unit_files, None),
+        ('job_info_base', base, None),
+        ('append_job_info', append_job_info, base),
+        ('tuner_check', tuner_check, lambda: list(joblist)),
+    ] + render_stages(rj, joblist)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '-s', '--scales', default='10,1000,100000',
+        help='comma separated number of jobs')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument(
+        '-b', '--backend', action='append', choices=['openpbs', 'torque', 'systemd'],
+        help='backend to benchmark (default: all)')
+    parser.add_argument(
+        '-o', '--output', default=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'results.json'))
+    args = parser.parse_args()
+
+    rj = load_rj()
+    scales = [int(i) for i in args.scales.split(',')]
+    backends = args.backend or ['openpbs', 'torque', 'systemd']
+    stages = {
+        'openpbs': openpbs_stages,
+        'torque': torque_stages,
+        'systemd': systemd_stages}
+
+    results = []
+    print('{:8} {:>7} {:22} {:>12} {:>12}'.format(
+        'backend', 'jobs', 'stage', 'best(ms)', 'median(ms)'))
+    for backend in backends:
+        for num in scales:
+            for stage, func, setup in stages[backend](rj, num):
+                times = measure(func, setup, args.repeat)
+                result = {
+                    'backend': backend,
+                    'jobs': num,
+                    'stage': stage,
+                    'best': min(times),
+                    'median': statistics.median(times),
+                    'times': times,
+                }
+                results.append(result)
+                print('{:8} {:>7} {:22} {:>12.3f} {:>12.3f}'.format(
+                    backend, num, stage,
+                    result['best'] * 1000, result['median'] * 1000))
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'results': results}, f, indent=2)
+    print('results written to {}'.format(args.output))
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
+from collections import namedtuple
 from datetime import datetime, timedelta
+import json
 import re
 import sys
 
@@ -199,3 +201,254 @@ def parse_time_delta(timestr_delta):
         time_ *= -1
 
     return time_
+
+def parse_schedule(lines, warmup_sec=0, day_change_hour=0, default_rectime=''):
+    """
+    lines: schedule.txt形式の行の並び (iterable of str)
+        'ch title weekday|date HH:MM[:SS] [rectime]'
+        空行、'#'で始まる行は無視する
+    warmup_sec: (int)
+    day_change_hour: (int)
+    default_rectime: rectime省略時の録画時間 (str)
+
+    各行を解析し、(録画予約のリスト, エラーのリスト)を返す
+    録画予約: {'lineno', 'ch', 'name', 'begin', 'rectime'} (dict)
+    エラー:   (行番号, メッセージ) (tuple)
+
+    曜日指定の行で開始時刻を過ぎている場合は翌週の同時刻とする
+    """
+    re_weekday = re.compile(r'^sun$|^mon$|^tue$|^wed$|^thu$|^fri$|^sat$', re.I)
+    jobs = []
+    errors = []
+
+    for lineno, line in enumerate(lines, 1):
+        fields = line.split()
+        if not fields or fields[0].startswith('#'):
+            continue
+
+        if len(fields) not in (4, 5):
+            errors.append((lineno, 'invalid format: {}'.format(line.strip())))
+            continue
+
+        ch, name, datestr, timestr = fields[:4]
+        if not ch.isdecimal():
+            errors.append((lineno, 'invalid Channel: {}'.format(ch)))
+            continue
+
+        begin = parse_start_time(
+            datestr, timestr, warmup_sec, day_change_hour)
+        if not begin:
+            errors.append((lineno, 'Invalid date, time: {} {}'.format(
+                datestr, timestr)))
+            continue
+
+        if not is_future(begin) and re_weekday.match(datestr):
+            # 今週の放送は終了しているので翌週分を予約
+            begin += timedelta(days=7)
+        if not is_future(begin):
+            errors.append((lineno, 'Start in the past.'))
+            continue
+
+        rectimestr = fields[4] if len(fields) == 5 else str(default_rectime)
+        rectime = parse_time(rectimestr)
+        if not rectime:
+            errors.append((lineno, 'Invalid recording time: {}'.format(
+                rectimestr)))
+            continue
+
+        jobs.append({
+            'lineno': lineno,
+            'ch': ch,
+            'name': name,
+            'begin': begin,
+            'rectime': rectime})
+
+    return jobs, errors
+
+# --formatで出力するジョブ情報の項目
+RECORD_FIELDS = (
+    'rj_id',
+    'rj_title',
+    'channel',
+    'station_name',
+    'rec_begin',
+    'rec_end',
+    'walltime',
+    'elapse',
+    'record_state',
+    'alert',
+    'tuner',
+    'user',
+    'group',
+    'exec_host',
+)
+RECORD_FORMATS = ('json', 'ndjson', 'tsv')
+
+def job_record(job, fields=RECORD_FIELDS):
+    """
+    ジョブ情報を機械可読な出力用のdictにして返す
+    時刻はISO 8601形式の文字列、walltime, elapseは秒数(int)とする
+    値がない項目はNoneとする
+    """
+    record = {}
+    for k in fields:
+        v = job.get(k)
+        if isinstance(v, datetime):
+            v = v.isoformat()
+        elif isinstance(v, timedelta):
+            v = int(v.total_seconds())
+        elif v == '':
+            v = None
+        record[k] = v
+    return record
+
+def format_records(joblist, format_, fields=RECORD_FIELDS):
+    """
+    ジョブ情報リストをformat_形式で1行ずつ返すジェネレーター
+
+    format_: 'json'   全ジョブを1つの配列にしたJSON
+             'ndjson' 1行1ジョブのJSON
+             'tsv'    項目名のヘッダー行とタブ区切りの1行1ジョブ
+    """
+    if format_ not in RECORD_FORMATS:
+        raise ValueError('unknown format: {}'.format(format_))
+
+    if format_ == 'tsv':
+        yield '\t'.join(fields)
+        for job in joblist:
+            record = job_record(job, fields)
+            yield '\t'.join(
+                '' if record[k] is None else
+                    re.sub(r'[\t\r\n]', ' ', str(record[k]))
+                        for k in fields)
+        return
+
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    if format_ == 'ndjson':
+        for job in joblist:
+            yield dumps(job_record(job, fields))
+        return
+
+    # json: 全ジョブを保持せずに配列を1要素ずつ出力する
+    sep = '['
+    for job in joblist:
+        yield sep + dumps(job_record(job, fields))
+        sep = ','
+    yield '[]' if sep == '[' else ']'
+
+# datelineを加味した日付と時刻
+# hourはdatelineより前の場合24を加算した値
+Dateline = namedtuple(
+    'Dateline', ('date', 'wday', 'year', 'mon', 'day', 'hour', 'minute',
+        'second'))
+
+class DatelineFormatter:
+    """
+    datelineを加味した日付と時刻の表示用の文字列を作る
+
+    曜日と年月日の文字列は日付ごとに一度だけ作成し、キャッシュする
+    """
+    def __init__(self, dateline=0):
+        self.dateline = dateline
+        self.days = {}
+
+    def _day(self, date):
+        """
+        dateの(曜日, 年, 月, 日)の文字列を返す
+        """
+        day = self.days.get(date)
+        if day is None:
+            day = (
+                date.strftime('%a'),
+                '{:04}'.format(date.year),
+                '{:02}'.format(date.month),
+                '{:02}'.format(date.day))
+            self.days[date] = day
+        return day
+
+    def fields(self, time):
+        """
+        datetimeオブジェクトtimeに対し、datelineを加味した
+        Datelineを返す
+        """
+        date = time.date()
+        hour = time.hour
+        if hour < self.dateline:
+            # 24時以降、datelineまでを当日扱いに
+            date -= timedelta(days=1)
+            hour += 24
+        wday, year, mon, day = self._day(date)
+        return Dateline(
+            date, wday, year, mon, day, '{:02}'.format(hour),
+            '{:02}'.format(time.minute), '{:02}'.format(time.second))
+
+    def format(self, time, year=False, sec=False):
+        """
+        datelineを加味した"Wday yyyy/mm/dd HH:MM:SS"を返す
+        """
+        return self.format_fields(self.fields(time), year, sec)
+
+    def format_fields(self, fields, year=False, sec=False):
+        """
+        Datelineを"Wday yyyy/mm/dd HH:MM:SS"形式の文字列にして返す
+
+        year: Falseの場合は年を省略する (bool)
+        sec:  Falseの場合は秒を省略する (bool)
+        """
+        if year:
+            w_ymd = '{} {}/{}/{}'.format(
+                fields.wday, fields.year, fields.mon, fields.day)
+        else:
+            w_ymd = '{} {}/{}'.format(fields.wday, fields.mon, fields.day)
+
+        if sec:
+            hms = '{}:{}:{}'.format(fields.hour, fields.minute, fields.second)
+        else:
+            hms = '{}:{}'.format(fields.hour, fields.minute)
+
+        return w_ymd + ' ' + hms
+
+# rj list --watchで行を再描画する項目
+WATCH_FIELDS = ('record_state', 'elapse', 'alert')
+
+def diff_joblist(prev, curr, fields=WATCH_FIELDS):
+    """
+    2つのジョブ情報リストをrj_idで比較し、
+    (追加されたrj_idのリスト, 削除されたrj_idのリスト,
+    fieldsのいずれかが変化したrj_idのリスト)を返す
+    """
+    before = {i.get('rj_id'): i for i in prev}
+    after = set()
+    added = []
+    changed = []
+    for job in curr:
+        jid = job.get('rj_id')
+        after.add(jid)
+        old = before.get(jid)
+        if old is None:
+            added.append(jid)
+        elif any(old.get(k) != job.get(k) for k in fields):
+            changed.append(jid)
+    removed = [i.get('rj_id') for i in prev if i.get('rj_id') not in after]
+    return added, removed, changed
+
+def watch_interval(joblist, now, fast=2, slow=30, window=60):
+    """
+    rj list --watchで次にジョブ情報を取得するまでの秒数を返す
+
+    いずれかのジョブの開始時刻、終了時刻の前後window秒以内はfast秒、
+    それ以外はslow秒を上限に、次の開始時刻、終了時刻の
+    window秒前までの秒数とする
+    """
+    interval = slow
+    for job in joblist:
+        for k in ('rec_begin', 'rec_end'):
+            t = job.get(k)
+            if not t:
+                continue
+            delta = (t - now).total_seconds()
+            if abs(delta) <= window:
+                return fast
+            if delta > 0:
+                interval = min(interval, delta - window)
+    return max(fast, interval)
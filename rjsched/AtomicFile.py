@@ -0,0 +1,25 @@
+import os
+
+def write_atomic(path, data, mode=None):
+    """
+    dataを一時ファイルに書き込んでからリネームし、pathを置き換える
+    読み込む側が書き込み途中のファイルを読まないようにする
+    失敗した場合は一時ファイルを削除してOSErrorを送出する
+
+    path: 書き込み先のファイル (str)
+    data: 書き込む内容 (str または bytes)
+    mode: 書き込み先のパーミッション。Noneの場合はumaskに従う (int)
+    """
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,91 @@
+from collections.abc import Mapping
+
+_MISSING = object()
+
+class Job(Mapping):
+    """
+    ジョブ情報を保持する変更不可のレコード
+
+    dictと同様にjob['rj_id']、job.get('rj_id')で参照できる。
+    各バックエンド共通のキーは__slots__に保持し、
+    バックエンド固有のキー('timer', 'service'など)のみdictに保持する。
+    値を変更する場合はreplace()で新しいレコードを作成する。
+    """
+    FIELDS = (
+        'rj_id',
+        'channel',
+        'station_name',
+        'rj_title',
+        'record_state',
+        'tuner',
+        'user',
+        'group',
+        'exec_host',
+        'rec_begin',
+        'rec_end',
+        'walltime',
+        'elapse',
+        'qtime',
+        'ctime',
+        'mtime',
+        'alert',
+    )
+    _FIELD_SET = frozenset(FIELDS)
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, *args, **kwargs):
+        """
+        dictと同じ引数で作成する
+        ex. Job({'rj_id': '1'}, alert='')
+        """
+        data = dict(*args, **kwargs)
+        for key in self.FIELDS:
+            object.__setattr__(self, key, data.pop(key, _MISSING))
+        object.__setattr__(self, '_extra', data)
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = object.__getattribute__(self, key)
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        return self._extra[key]
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if object.__getattribute__(self, key) is not _MISSING:
+                yield key
+        yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, key):
+        if key in self._FIELD_SET:
+            return object.__getattribute__(self, key) is not _MISSING
+        return key in self._extra
+
+    def __setattr__(self, key, value):
+        raise AttributeError('Job is immutable')
+
+    def __delattr__(self, key):
+        raise AttributeError('Job is immutable')
+
+    def __reduce__(self):
+        # __slots__と__setattr__の制限があるため、dictを経由してpickleする
+        return (Job, (self.to_dict(),))
+
+    def __repr__(self):
+        return 'Job({!r})'.format(self.to_dict())
+
+    def replace(self, **changes):
+        """
+        指定したキーの値を変更した新しいレコードを返す
+        """
+        return Job(self, **changes)
+
+    def to_dict(self):
+        """
+        dictに変換して返す
+        """
+        return dict(self.items())
@@ -0,0 +1,97 @@
+import os
+import pickle
+import time
+from rjsched.AtomicFile import write_atomic
+
+class JobCache:
+    """
+    スケジューラーから取得したジョブ情報のスナップショットを
+    ファイルにキャッシュする
+
+    キャッシュファイルの最終更新時刻からttl秒以内であれば
+    スナップショットを有効とみなす。
+    ttlが0の場合はキャッシュを使用しない。
+    有効期間切れのスナップショット(load(stale=True))も読み込まないため、
+    ジョブID指定の取得でも全ジョブを取得することになる。
+
+    有効期間切れのスナップショットは、スケジューラーから取得した時刻から
+    stale_max秒以内のもののみ読み込む。
+    無効化しても取得した時刻は変わらないため、古いスナップショットが
+    使われ続けることはない。
+    """
+    def __init__(self, path, ttl=0, stale_max=600):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.stale_max = stale_max
+        # 最後に読み込んだスナップショットをスケジューラーから取得した時刻
+        self.fetched = None
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def load(self, stale=False):
+        """
+        キャッシュからスナップショットを読み込んで返す
+        有効なスナップショットがない場合はNoneを返す
+
+        stale: Trueの場合はttlを超過したスナップショットも返す (bool)
+               ただし取得からstale_max秒を超過したものは返さない
+        """
+        if not self.enabled:
+            return None
+        try:
+            if not stale:
+                age = time.time() - os.stat(self.path).st_mtime
+                if age < 0 or age >= self.ttl:
+                    return None
+            with open(self.path, 'rb') as f:
+                fetched, snapshot = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, AttributeError,
+                ImportError, TypeError, ValueError):
+            return None
+        age = time.time() - fetched
+        if age < 0 or age > max(self.stale_max, self.ttl):
+            return None
+        self.fetched = fetched
+        return snapshot
+
+    def save(self, snapshot):
+        """
+        スケジューラーから取得したスナップショットをキャッシュに書き込む
+        書き込みに失敗してもエラーとはしない
+        """
+        if not self.enabled:
+            return
+        self.fetched = time.time()
+        self._write(self.fetched, snapshot)
+
+    def update(self, snapshot):
+        """
+        load()で読み込んだスナップショットを変更したものを書き戻す
+        ジョブの削除、変更を反映するためのもので、取得した時刻は元のままとし、
+        有効期間切れのスナップショットとして書き込む
+        """
+        if not self.enabled or self.fetched is None:
+            return
+        self._write(self.fetched, snapshot)
+        self.invalidate()
+
+    def _write(self, fetched, snapshot):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_atomic(self.path, pickle.dumps((fetched, snapshot)))
+        except OSError:
+            pass
+
+    def invalidate(self):
+        """
+        スナップショットを無効化する
+        中身は古いスナップショットとして残し、最終更新時刻のみ戻す
+        """
+        if not self.enabled:
+            return
+        try:
+            os.utime(self.path, (0, 0))
+        except OSError:
+            pass
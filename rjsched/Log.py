@@ -0,0 +1,184 @@
+"""
+rjschedのログ出力
+
+ログの出力先はプロセスごとに一度だけ開き、
+ログはキューを経由してバックグラウンドのスレッドから出力する。
+出力先は設定ファイルのlog_sinkで選択する。
+
+    syslog: syslog (デフォルト。ident 'recordjob'、facility LOCAL7)
+    file:   log_fileで指定したファイルにテキスト形式で追記
+    jsonl:  log_fileで指定したファイルにJSON Lines形式で追記
+"""
+
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import syslog
+import threading
+
+IDENT = 'recordjob'
+SINKS = ('syslog', 'file', 'jsonl')
+DEFAULT_LOG_FILE = '~/.rj/rj.log'
+
+# syslogのプライオリティとloggingのレベルの対応
+LEVELS = {
+    syslog.LOG_EMERG: logging.CRITICAL,
+    syslog.LOG_ALERT: logging.CRITICAL,
+    syslog.LOG_CRIT: logging.CRITICAL,
+    syslog.LOG_ERR: logging.ERROR,
+    syslog.LOG_WARNING: logging.WARNING,
+    syslog.LOG_NOTICE: logging.INFO,
+    syslog.LOG_INFO: logging.INFO,
+    syslog.LOG_DEBUG: logging.DEBUG,
+}
+PRIORITIES = {
+    logging.CRITICAL: syslog.LOG_CRIT,
+    logging.ERROR: syslog.LOG_ERR,
+    logging.WARNING: syslog.LOG_WARNING,
+    logging.INFO: syslog.LOG_INFO,
+    logging.DEBUG: syslog.LOG_DEBUG,
+}
+FACILITIES = {
+    'user': syslog.LOG_USER,
+    'daemon': syslog.LOG_DAEMON,
+    'local0': syslog.LOG_LOCAL0,
+    'local1': syslog.LOG_LOCAL1,
+    'local2': syslog.LOG_LOCAL2,
+    'local3': syslog.LOG_LOCAL3,
+    'local4': syslog.LOG_LOCAL4,
+    'local5': syslog.LOG_LOCAL5,
+    'local6': syslog.LOG_LOCAL6,
+    'local7': syslog.LOG_LOCAL7,
+}
+
+class SyslogHandler(logging.Handler):
+    """
+    syslogモジュールでログを送るハンドラー
+    openlogはハンドラーの作成時に一度だけ行う
+    """
+    def __init__(self, ident=IDENT, facility=syslog.LOG_LOCAL7):
+        super().__init__()
+        syslog.openlog(
+            ident=ident, logoption=syslog.LOG_PID, facility=facility)
+
+    def emit(self, record):
+        try:
+            priority = getattr(record, 'priority', None)
+            if priority is None:
+                priority = PRIORITIES.get(record.levelno, syslog.LOG_INFO)
+            syslog.syslog(priority, self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        syslog.closelog()
+        super().close()
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    ログを1行1レコードのJSONにする
+    """
+    def __init__(self, ident=IDENT):
+        super().__init__()
+        self.ident = ident
+
+    def format(self, record):
+        return json.dumps({
+            'time': datetime.fromtimestamp(record.created).isoformat(
+                timespec='milliseconds'),
+            'ident': self.ident,
+            'pid': record.process,
+            'level': record.levelname.lower(),
+            'message': record.getMessage()}, ensure_ascii=False)
+
+def create_handler(config):
+    """
+    設定に従ってログの出力先のハンドラーを作成する
+
+    config: rjの設定 (dict)
+            log_sink:     'syslog', 'file', 'jsonl' (str)
+            log_file:     file, jsonlの出力先 (str)
+            log_ident:    ident (str)
+            log_facility: syslogのfacility ex. 'local7' (str)
+    """
+    sink = config.get('log_sink') or 'syslog'
+    ident = config.get('log_ident') or IDENT
+    if sink not in SINKS:
+        raise ValueError('unknown log_sink: {}'.format(sink))
+
+    if sink == 'syslog':
+        facility = FACILITIES.get(
+            str(config.get('log_facility', 'local7')).lower())
+        if facility is None:
+            raise ValueError(
+                'unknown log_facility: {}'.format(config.get('log_facility')))
+        return SyslogHandler(ident, facility)
+
+    path = os.path.expanduser(config.get('log_file') or DEFAULT_LOG_FILE)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    handler = logging.FileHandler(path, encoding='utf-8')
+    if sink == 'jsonl':
+        handler.setFormatter(JsonLinesFormatter(ident))
+    else:
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s {}[%(process)d]: %(levelname)s %(message)s'.format(
+                ident)))
+    return handler
+
+_lock = threading.Lock()
+_listener = None
+
+def setup(config=None):
+    """
+    ログの出力先を開き、バックグラウンドのスレッドを開始する
+    プロセスで二度目以降の呼び出しは何もしない
+    """
+    global _listener
+    with _lock:
+        if _listener:
+            return
+        try:
+            handler = create_handler(config or {})
+        except (ValueError, OSError) as err:
+            # 設定の誤りでrjが使えなくならないようsyslogに出力する
+            print('log sink cannot open: {}'.format(err), file=sys.stderr)
+            handler = SyslogHandler()
+        records = queue.Queue(-1)
+        logger = logging.getLogger(IDENT)
+        logger.handlers = [QueueHandler(records)]
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        _listener = QueueListener(records, handler)
+        _listener.start()
+
+def shutdown():
+    """
+    キューに残っているログを出力し、出力先を閉じる
+    """
+    global _listener
+    with _lock:
+        if not _listener:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        logging.getLogger(IDENT).handlers = []
+        _listener = None
+
+atexit.register(shutdown)
+
+def log(priority, message):
+    """
+    syslogのプライオリティを指定してログを出力する
+    setup()が呼ばれていない場合はデフォルトの設定で開始する
+    """
+    if not _listener:
+        setup()
+    logging.getLogger(IDENT).log(
+        LEVELS.get(priority, logging.INFO), message,
+        extra={'priority': priority})
@@ -0,0 +1,233 @@
+"""
+node_exporterのtextfile collector向けのメトリクス
+
+ジョブの状態ごとの件数、チューナーの使用数、チューナー数超過の
+警告がついたジョブ数、_run_command()で実行したコマンドの
+所要時間のヒストグラムをPrometheusのテキスト形式で出力する。
+
+ヒストグラムはプロセス内で集計するため、実行ごとに別プロセスとなる
+rj metricsではtextfileと同じディレクトリのLATENCY_FILEに保存し、
+次回の実行で読み込んで累積する。
+"""
+
+from bisect import bisect_left
+from datetime import datetime
+import json
+import os
+import threading
+import time
+from rjsched.AtomicFile import write_atomic
+from rjsched.TunerTimeline import TunerTimeline
+
+# ジョブの状態(RecordJob.job_stateの値)
+STATES = (
+    'Completed',
+    'Exiting',
+    'on Hold',
+    'Queued',
+    'Recording',
+    'Moved',
+    'Waiting',
+    'Suspend',
+)
+# コマンド所要時間のヒストグラムのバケット(秒)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# コマンド所要時間のヒストグラムを保存するファイル
+# textfile collectorは*.promのみ読むため、同じディレクトリに置く
+LATENCY_FILE = 'rj.latency.json'
+
+class CommandLatency:
+    """
+    コマンドごとの所要時間のヒストグラム
+    コマンドはパスを除いたコマンド名で区別する
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histogram = {}
+        self.lock = threading.Lock()
+
+    def observe(self, command, elapsed):
+        """
+        コマンドの所要時間を記録する
+
+        command: 実行したコマンド (list)
+        elapsed: 所要時間(秒) (float)
+        """
+        name = os.path.basename(command[0]) if command else ''
+        with self.lock:
+            counts, total, count = self.histogram.get(
+                name, ([0] * len(self.buckets), 0.0, 0))
+            counts = counts[:]
+            index = bisect_left(self.buckets, elapsed)
+            if index < len(counts):
+                counts[index] += 1
+            self.histogram[name] = (counts, total + elapsed, count + 1)
+
+    def samples(self):
+        """
+        {コマンド名: (累積件数のリスト, 合計時間, 件数)}を返す
+        累積件数のリストはbucketsの各上限以下の件数
+        """
+        with self.lock:
+            histogram = dict(self.histogram)
+        result = {}
+        for name, (counts, total, count) in histogram.items():
+            cumulative = []
+            acc = 0
+            for i in counts:
+                acc += i
+                cumulative.append(acc)
+            result[name] = (cumulative, total, count)
+        return result
+
+    def load(self, path):
+        """
+        save()で書き込んだヒストグラムを読み込み、記録済みの値に加える
+        読み込めない場合、bucketsが異なる場合は何もしない
+        """
+        try:
+            with open(path) as f:
+                state = json.load(f)
+            if state['buckets'] != list(self.buckets):
+                return
+            histogram = {}
+            for name, (counts, total, count) in state['histogram'].items():
+                if len(counts) != len(self.buckets):
+                    return
+                histogram[name] = (
+                    [int(i) for i in counts], float(total), int(count))
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        with self.lock:
+            for name, (counts, total, count) in histogram.items():
+                c, t, n = self.histogram.get(
+                    name, ([0] * len(self.buckets), 0.0, 0))
+                self.histogram[name] = (
+                    [i + j for i, j in zip(c, counts)], t + total, n + count)
+
+    def save(self, path):
+        """
+        ヒストグラムをpathにアトミックに書き込む
+        """
+        with self.lock:
+            histogram = dict(self.histogram)
+        write_atomic(path, json.dumps({
+            'buckets': list(self.buckets),
+            'histogram': histogram,
+        }))
+
+latency = CommandLatency()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(
+        '{}="{}"'.format(k, _escape(v)) for k, v in labels.items()) + '}'
+
+def _float(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+def _timestamp(dt):
+    return time.mktime(dt.timetuple())
+
+def next_peak(timeline, _type, now):
+    """
+    (現在の同時録画数, 今後のピークの同時録画数, ピークの開始時刻)を返す
+    """
+    booked = timeline.at(_type, now)
+    peak, peak_time = booked, now
+    for t, concurrency in timeline.timeline.get(_type, []):
+        if t > now and concurrency > peak:
+            peak, peak_time = concurrency, t
+    return booked, peak, peak_time
+
+def render(joblist, capacity, now=None, latency=latency):
+    """
+    メトリクスをPrometheusのテキスト形式にして返す
+
+    joblist:  ジョブ情報のリスト (list)
+    capacity: チューナー種別ごとのチューナー数 (dict)
+    now:      現在時刻 (datetime)
+    latency:  コマンド所要時間のヒストグラム (CommandLatency)
+    """
+    now = now or datetime.now()
+    lines = []
+
+    def metric(name, help_, type_, samples):
+        lines.append('# HELP {} {}'.format(name, help_))
+        lines.append('# TYPE {} {}'.format(name, type_))
+        for suffix, labels, value in samples:
+            lines.append('{}{}{} {}'.format(name, suffix, labels, value))
+
+    # ジョブの状態ごとの件数
+    states = dict.fromkeys(STATES, 0)
+    for job in joblist:
+        state = job.get('record_state') or 'Unknown'
+        states[state] = states.get(state, 0) + 1
+    metric('rj_jobs', 'Number of recording jobs per state.', 'gauge', [
+        ('', _labels(state=k), v) for k, v in states.items()])
+
+    # チューナー数と使用数
+    timeline = TunerTimeline(capacity)
+    timeline.check(joblist)
+    available, booked, peak, peak_time = [], [], [], []
+    for _type in sorted(capacity):
+        b, p, t = next_peak(timeline, _type, now)
+        labels = _labels(tuner=_type)
+        available.append(('', labels, capacity[_type]))
+        booked.append(('', labels, b))
+        peak.append(('', labels, p))
+        peak_time.append(('', labels, _float(_timestamp(t))))
+    metric('rj_tuners_available',
+        'Number of tuners available on the scheduler.', 'gauge', available)
+    metric('rj_tuners_booked',
+        'Number of tuners booked by recording jobs now.', 'gauge', booked)
+    metric('rj_tuners_booked_peak',
+        'Number of tuners booked at the next peak.', 'gauge', peak)
+    metric('rj_tuners_booked_peak_timestamp_seconds',
+        'Start time of the next peak of booked tuners.', 'gauge', peak_time)
+
+    # チューナー数超過の警告がついたジョブ数
+    metric('rj_conflict_jobs',
+        'Number of jobs flagged for running out of tuners.', 'gauge', [
+            ('', '', sum(1 for job in joblist if job.get('alert')))])
+
+    # コマンドの所要時間
+    samples = []
+    for name, (cumulative, total, count) in sorted(latency.samples().items()):
+        for le, value in zip(latency.buckets, cumulative):
+            samples.append((
+                '_bucket', _labels(command=name, le=_float(le)), value))
+        samples.append((
+            '_bucket', _labels(command=name, le='+Inf'), count))
+        samples.append(('_sum', _labels(command=name), _float(total)))
+        samples.append(('_count', _labels(command=name), count))
+    metric('rj_command_duration_seconds',
+        'Time spent running scheduler commands.', 'histogram', samples)
+
+    metric('rj_metrics_last_update_timestamp_seconds',
+        'Time the metrics were generated.', 'gauge', [
+            ('', '', _float(_timestamp(now)))])
+
+    return '\n'.join(lines) + '\n'
+
+def latency_file(directory):
+    """
+    directoryに置くヒストグラムの保存先のパスを返す
+    """
+    return os.path.join(os.path.expanduser(directory), LATENCY_FILE)
+
+def write_textfile(directory, text, name='rj.prom'):
+    """
+    メトリクスをdirectory/nameにアトミックに書き込み、パスを返す
+    node_exporterが書き込み途中のファイルを読まないよう、
+    一時ファイルに書き込んでからリネームする
+    """
+    directory = os.path.expanduser(directory)
+    path = os.path.join(directory, name)
+    write_atomic(path, text, mode=0o644)
+    return path
@@ -0,0 +1,286 @@
+"""
+rjdとrjの間の通信
+
+リクエスト、レスポンスともに4バイトのデータ長に続けて
+pickleしたオブジェクトを送る。
+ソケットは実行ユーザーのみ読み書きできるパーミッションで作成する。
+"""
+
+import os
+import pickle
+import queue
+import socket
+import socketserver
+import struct
+import syslog
+import threading
+import time
+from rjsched import Metrics
+from rjsched.Timings import timings
+
+HEADER = struct.Struct('!I')
+
+def send_message(sock, obj):
+    """
+    objをpickleしてソケットに送信する
+    """
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+def recv_message(sock):
+    """
+    ソケットから1メッセージ受信し、unpickleして返す
+    接続が閉じられた場合はNoneを返す
+    """
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            return None
+        buf.extend(chunk)
+    return bytes(buf)
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        request = recv_message(self.request)
+        if request is None:
+            return
+        try:
+            response = (True, self.server.rjd.dispatch(*request))
+        except Exception as err:
+            response = (False, err)
+        send_message(self.request, response)
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class RecordJobDaemon:
+    """
+    RecordJob*のインスタンスとジョブ情報リストをメモリ上に保持し、
+    Unixドメインソケット経由でrjからのリクエストに応答する
+
+    参照系のリクエストはメモリ上のジョブ情報リストから応答し、
+    変更系のリクエストは単一のワーカースレッドで順に実行する。
+    バックエンドのインスタンスはワーカースレッドからのみ操作する。
+    """
+    READ = ('get_job_list', 'get_channel_list', 'get_config', 'get_metrics')
+    WRITE = (
+        'add',
+        'add_many',
+        'remove',
+        'change_begin',
+        'change_rectime',
+        'change_channel',
+        'change_name',
+    )
+
+    def __init__(
+            self, rec, config, socket_path=None, interval=None,
+            metrics_dir=None):
+        """
+        rec:         バックエンドのインスタンス (RecordJob)
+        config:      rjの設定 (dict)
+        socket_path: Unixドメインソケットのパス (str)
+        interval:    ジョブ情報リストの更新間隔(秒) (int)
+        metrics_dir: 更新ごとにメトリクスを書き込むディレクトリ (str)
+        """
+        self.rec = rec
+        self.config = config
+        self.socket_path = os.path.expanduser(
+            socket_path or '~/.rj/rjd.sock')
+        if interval is None:
+            interval = config.get('rjd_interval', 30)
+        self.interval = interval
+        self.metrics_dir = metrics_dir or config.get('metrics_dir')
+        self.joblist = []
+        self.chlist = {}
+        self.capacity = {}
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.refresh_pending = threading.Event()
+        self.stopped = threading.Event()
+        self.server = None
+
+    def dispatch(self, method, args=(), kwargs=None):
+        """
+        リクエストを処理して結果を返す
+        """
+        kwargs = kwargs or {}
+        if method in self.READ:
+            return getattr(self, '_' + method)(*args, **kwargs)
+        if method in self.WRITE:
+            reply = queue.Queue(maxsize=1)
+            self.queue.put((method, args, kwargs, reply))
+            ok, result = reply.get()
+            if not ok:
+                raise result
+            return result
+        raise AttributeError('unsupported method: {}'.format(method))
+
+    def _get_job_list(self, jid=''):
+        with self.lock:
+            joblist = self.joblist
+        if jid:
+            joblist = [i for i in joblist if i['rj_id'] == jid]
+        return joblist
+
+    def _get_channel_list(self):
+        with self.lock:
+            return self.chlist
+
+    def _get_config(self):
+        return self.config
+
+    def _get_metrics(self):
+        with self.lock:
+            joblist = self.joblist
+            capacity = self.capacity
+        return Metrics.render(joblist, capacity)
+
+    def refresh(self):
+        """
+        バックエンドからジョブ情報リストを取得し直す
+        取得に失敗した場合は前回のジョブ情報リストを保持する
+        """
+        try:
+            joblist = self.rec.get_job_list()
+            chlist = self.rec.get_channel_list()
+        except Exception as err:
+            self.rec._logger(
+                syslog.LOG_ERR, 'rjd: cannot refresh job list: {}'.format(err))
+            return
+        timeline = getattr(self.rec, 'timeline', None)
+        with self.lock:
+            self.joblist = joblist
+            self.chlist = chlist
+            if timeline:
+                self.capacity = timeline.capacity
+
+        if self.metrics_dir:
+            try:
+                Metrics.write_textfile(self.metrics_dir, self._get_metrics())
+                Metrics.latency.save(Metrics.latency_file(self.metrics_dir))
+            except OSError as err:
+                self.rec._logger(
+                    syslog.LOG_ERR,
+                    'rjd: cannot write metrics: {}'.format(err))
+
+    def _worker(self):
+        """
+        変更系リクエストとジョブ情報リストの更新を順に実行する
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            if item == 'refresh':
+                self.refresh_pending.clear()
+                self.refresh()
+                continue
+
+            method, args, kwargs, reply = item
+            try:
+                result = (True, getattr(self.rec, method)(*args, **kwargs))
+            except Exception as err:
+                result = (False, err)
+            # 変更後のジョブ情報を参照系リクエストに反映する
+            self.refresh()
+            reply.put(result)
+
+    def _refresher(self):
+        """
+        interval秒ごとにジョブ情報リストの更新をワーカーに依頼する
+        """
+        while not self.stopped.wait(self.interval):
+            if not self.refresh_pending.is_set():
+                self.refresh_pending.set()
+                self.queue.put('refresh')
+
+    def start(self):
+        """
+        ソケットを作成し、ワーカースレッドなどを起動する
+        """
+        if self.metrics_dir:
+            # 再起動してもコマンド所要時間のヒストグラムを引き継ぐ
+            Metrics.latency.load(Metrics.latency_file(self.metrics_dir))
+        self.refresh()
+
+        if os.path.exists(self.socket_path):
+            # 前回異常終了した際のソケットが残っている
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        umask = os.umask(0o177)
+        try:
+            self.server = _UnixServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        self.server.rjd = self
+
+        for target in (self._worker, self._refresher):
+            threading.Thread(target=target, daemon=True).start()
+
+    def serve_forever(self):
+        """
+        shutdown()が呼ばれるまでリクエストに応答する
+        """
+        if not self.server:
+            self.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        self.stopped.set()
+        self.queue.put(None)
+        if self.server:
+            self.server.shutdown()
+
+class RecordJobClient:
+    """
+    rjdにリクエストを転送するバックエンドのプロキシ
+    RecordJob*と同じメソッドで呼び出せる
+    """
+    def __init__(self, socket_path):
+        self.socket_path = os.path.expanduser(socket_path)
+        self.name = 'RecordJobClient'
+
+    def __str__(self):
+        return self.name
+
+    def _call(self, method, *args, **kwargs):
+        begin = time.perf_counter()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(self.socket_path)
+                send_message(sock, (method, args, kwargs))
+                response = recv_message(sock)
+        finally:
+            timings.command(['rjd', method], time.perf_counter() - begin)
+        if response is None:
+            raise ConnectionError('rjd closed the connection')
+        ok, result = response
+        if not ok:
+            raise result
+        return result
+
+    def __getattr__(self, method):
+        if method not in RecordJobDaemon.READ + RecordJobDaemon.WRITE:
+            raise AttributeError(method)
+        def call(*args, **kwargs):
+            return self._call(method, *args, **kwargs)
+        return call
+
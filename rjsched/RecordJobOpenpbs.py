@@ -1,11 +1,19 @@
-from copy import deepcopy
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from textwrap import dedent
+import asyncio
 import json
 import os
 import re
 import rjsched
 import sys
+from subprocess import CalledProcessError, TimeoutExpired
+from rjsched.Job import Job
+from rjsched.JobCache import JobCache
+from rjsched.TimeParser import parse_asctime, parse_walltime
+from rjsched.Timings import timings
+from rjsched.TunerPlacement import TunerPlacement
+from rjsched.TunerTimeline import TunerTimeline
 
 class RecordJobOpenpbs(rjsched.RecordJob):
     def __init__(self, config):
@@ -17,8 +25,15 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         self.pbsnodes = [pbsexec + '/pbsnodes', '-a', '-F', 'json']
         self.qsub = [pbsexec + '/qsub']
         self.qdel = [pbsexec + '/qdel']
+        self.qdel_chunk = 256
+        self.re_qdel_error = re.compile(r'\b(\d+)(\.\S*)?\s*$')
         self.qalter = [pbsexec + '/qalter']
         self.joblist = []
+        self.timeline = None
+        self.cache = JobCache(
+            config.get('cache_file', '~/.rj/joblist.cache'),
+            config.get('cache_ttl', 0),
+            config.get('cache_stale_max', 600))
 
     def __str__(self):
         return self.name
@@ -27,54 +42,143 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         """
         利用可能なノードのカスタムリソース'tt'、'bs'を集計する
         """
-        tuners = {'tt': 0, 'bs': 0}
+        return self._sum_tuners(self._get_tuner_nodes())
 
-        available = re.compile(r'free|job-busy')
+    async def _get_tuner_num_async(self):
+        """
+        _get_tuner_num()の非同期版
+        """
+        return self._sum_tuners(await self._get_tuner_nodes_async())
+
+    def _get_tuner_nodes(self):
+        """
+        利用可能なノードごとのカスタムリソース'tt'、'bs'を取得する
+        """
         proc = self._run_command(self.pbsnodes, log=False)
-        nodes = json.loads(proc.stdout).get('nodes', {})
-        for v in nodes.values():
-            if available.match(v.get('state', '')):
-                resources = v.get('resources_available', {})
-                tuners['tt'] += int(resources.get('tt', 0))
-                tuners['bs'] += int(resources.get('bs', 0))
+        return self._parse_tuner_nodes(proc.stdout)
+
+    async def _get_tuner_nodes_async(self):
+        """
+        _get_tuner_nodes()の非同期版
+        """
+        proc = await self._run_command_async(self.pbsnodes, log=False)
+        return self._parse_tuner_nodes(proc.stdout)
+
+    def _parse_tuner_num(self, stdout):
+        """
+        pbsnodesコマンドの出力からチューナー数を集計する
+        """
+        return self._sum_tuners(self._parse_tuner_nodes(stdout))
+
+    def _parse_tuner_nodes(self, stdout):
+        """
+        pbsnodesコマンドの出力からホストごとのチューナー数と
+        割り当て済みのチューナー数を取得する
+        ホスト名はresources_availableの'host'、なければノード名とする
+
+        {ホスト名: {'available': {'tt': n, 'bs': n},
+                    'assigned':  {'tt': n, 'bs': n}}}
+        """
+        nodes = {}
+
+        available = re.compile(r'free|job-busy')
+        for k, v in json.loads(stdout).get('nodes', {}).items():
+            if not available.match(v.get('state', '')):
+                continue
+            resources = v.get('resources_available', {})
+            assigned = v.get('resources_assigned', {})
+            node = nodes.setdefault(resources.get('host', k), {
+                'available': {'tt': 0, 'bs': 0},
+                'assigned': {'tt': 0, 'bs': 0}})
+            for _type in ('tt', 'bs'):
+                node['available'][_type] += int(resources.get(_type, 0))
+                node['assigned'][_type] += int(assigned.get(_type, 0))
+        return nodes
+
+    def _sum_tuners(self, nodes):
+        """
+        ホストごとのチューナー数を合計する
+        """
+        tuners = {'tt': 0, 'bs': 0}
+        for node in nodes.values():
+            for _type in tuners:
+                tuners[_type] += node['available'].get(_type, 0)
         return tuners
 
-    def _check_tuner_resource(self):
+    def _node_capacity(self, nodes):
+        """
+        ホストごとの録画に使用できるチューナー数を返す
+
+        resources_assignedのうちself.joblist[]の実行中のジョブで
+        説明できない分(rj以外から投入されたジョブなど)は
+        終了時刻がわからないため、チューナー数から差し引く
+        """
+        running = {}
+        for job in self.joblist:
+            host = job.get('exec_host')
+            if host in nodes:
+                key = (host, job.get('tuner'))
+                running[key] = running.get(key, 0) + 1
+
+        capacity = {}
+        for host, node in nodes.items():
+            capacity[host] = {}
+            for _type, num in node['available'].items():
+                unknown = node['assigned'].get(_type, 0) - running.get(
+                    (host, _type), 0)
+                capacity[host][_type] = num - max(unknown, 0)
+        return capacity
+
+    def _check_tuner_resource(self, tuners=None, nodes=None):
         """
         チューナーの空き具合をチェックする
         最大同時録画数を超過しているジョブには警告をつける
-        """
-        msg = 'Out of Tuners. Max: {}'
-        tuners = self._get_tuner_num()
-        stack = {'tt': [], 'bs': []}
 
-        for job in self.joblist:
-            _type = job.get('tuner')
-            if _type == 'not_rec_job':
-                continue
-            if len(stack.get(_type)) < tuners.get(_type):
-                # チューナーに空きがある
-                stack.get(_type).append(job)
+        tuners: チューナー数 (dict)
+                省略時は_get_tuner_num()で取得する
+        nodes:  ホストごとのチューナー数 (dict)
+                _parse_tuner_nodes()の戻り値。指定された場合は
+                ホストごとにチューナーを割り当ててチェックする
+        """
+        if tuners is None:
+            tuners = self._get_tuner_num()
+        self.timeline = TunerTimeline(tuners)
+
+        with timings.phase('check tuner resource'):
+            overflow = self.timeline.check(self.joblist)
+            if nodes:
+                overflow = self._check_node_resource(nodes)
             else:
-                # ガベージコレクト
-                for stacked_job in stack.get(_type):
-                    # stack内のジョブから録画終了しているものを削除
-                    if job.get('rec_begin') > stacked_job.get('rec_end'):
-                        stack.get(_type).remove(stacked_job)
-                # 改めてチューナーの空きを確認
-                if len(stack.get(_type)) < tuners.get(_type):
-                    # 空きがある
-                    stack.get(_type).append(job)
-                else:
-                    stack.get(_type).append(job)
-                    for stacked_job in stack.get(_type):
-                        # 現時点でstackに積まれているジョブ全てに警告を追加
-                        stacked_job['alert'] = msg.format(tuners.get(_type))
-
-    def _fetch_joblist(self):
+                msg = 'Out of Tuners. Max: {}'
+                overflow = [(i, msg.format(
+                    tuners.get(self.joblist[i].get('tuner'))))
+                    for i in overflow]
+        for i, alert in overflow:
+            # チューナー数を超過した時点で開始するジョブに警告を追加
+            self.joblist[i] = Job(self.joblist[i], alert=alert)
+
+    def _check_node_resource(self, nodes):
+        """
+        ホストごとにチューナーを割り当て、
+        (ジョブのインデックス, 警告文)のリストを返す
+        """
+        msg = 'Out of Tuners on {} at {:%Y/%m/%d %H:%M}. Max: {}'
+        capacity = self._node_capacity(nodes)
+        overflow = []
+        for i, hosts in TunerPlacement(capacity).check(self.joblist):
+            job = self.joblist[i]
+            _max = sum(capacity[h].get(job.get('tuner'), 0) for h in hosts)
+            overflow.append((i, msg.format(
+                ','.join(hosts) or '-', job.get('rec_begin'), _max)))
+        return overflow
+
+    def _fetch_joblist(self, jids=None):
         """
         qstatコマンドの出力から、ジョブごとに下記の情報を取得し
         self.joblist[]に詰める
+        jidsが指定された場合はそのジョブのみqstatで取得する
+
+        jids: ジョブIDのリスト (list)
 
         'rj_id':        OpenPBSのジョブID (str)
         'channel':      チャンネル番号 (str)
@@ -93,13 +197,59 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         'mtime':        ジョブをMoMが最後にモニタした時刻 (datetime)
         'alert':        警告メッセージ (str)
         """
+        try:
+            stdout = self._run_command(
+                self._qstat_command(jids), log=False).stdout
+        except CalledProcessError as err:
+            if not jids:
+                raise
+            # 存在しないジョブIDが含まれているとqstatはエラー終了するが
+            # 存在するジョブの情報は標準出力に出力される
+            stdout = err.stdout
+        with timings.phase('build joblist'):
+            self._build_joblist(stdout, jids)
+
+    async def _fetch_joblist_async(self, jids=None):
+        """
+        _fetch_joblist()の非同期版
+        """
+        try:
+            proc = await self._run_command_async(
+                self._qstat_command(jids), log=False)
+            stdout = proc.stdout
+        except CalledProcessError as err:
+            if not jids:
+                raise
+            stdout = err.stdout
+        with timings.phase('build joblist'):
+            self._build_joblist(stdout, jids)
+
+    def _qstat_command(self, jids=None):
+        """
+        qstatのコマンドラインを返す
+        """
+        qstat = self.qstat[:]
+        if jids:
+            qstat.extend(jids)
+        return qstat
+
+    def _build_joblist(self, stdout, jids=None):
+        """
+        qstatコマンドの出力からジョブ情報を組み立て、self.joblist[]に詰める
+        """
         # 同一インスタンスで複数回呼ばれた際に古い情報を返さないよう毎回クリアする
         self.joblist.clear()
         current = datetime.now()
         chlist = self.get_channel_list()
 
-        proc = self._run_command(self.qstat, log=False)
-        jobs = json.loads(proc.stdout).get('Jobs', {})
+        with timings.phase('json decode'):
+            if jids:
+                try:
+                    jobs = json.loads(stdout or '{}').get('Jobs', {})
+                except ValueError:
+                    jobs = {}
+            else:
+                jobs = json.loads(stdout).get('Jobs', {})
         for k, v in jobs.items():
             # ジョブID、チャンネル番号、番組名
             job = {'rj_id': k.split('.')[0]}
@@ -118,21 +268,18 @@ class RecordJobOpenpbs(rjsched.RecordJob):
             job['station_name'] = chlist.get(job.get('channel'), '')
 
             # 録画時間
-            wt_h, wt_m, wt_s = [
-                int(i) for i in v.get('Resource_List').get('walltime').split(':')]
-            job['walltime'] = timedelta(hours=wt_h, minutes=wt_m, seconds=wt_s)
+            job['walltime'] = parse_walltime(
+                v.get('Resource_List').get('walltime'))
 
             # ジョブの状態、録画開始時刻、録画終了時間、録画開始からの経過時間
             state = v.get('job_state')
             if state == "W":
                 # waiting
-                job['rec_begin'] = datetime.strptime(
-                    v.get('Execution_Time'), "%a %b %d %H:%M:%S %Y")
+                job['rec_begin'] = parse_asctime(v.get('Execution_Time'))
                 job['elapse'] = None
             else:
                 # queued or running
-                job['rec_begin'] = datetime.strptime(
-                    v.get('etime'), "%a %b %d %H:%M:%S %Y")
+                job['rec_begin'] = parse_asctime(v.get('etime'))
                 job['elapse'] = current - job['rec_begin']
                 job['exec_host'] = v.get('exec_host', 'dummy/dummy').split('/')[0]
             job['rec_end'] = job['rec_begin'] + job['walltime']
@@ -152,22 +299,48 @@ class RecordJobOpenpbs(rjsched.RecordJob):
             job['group'] = v.get('egroup')
 
             # qtime, ctime, mtime
-            job['qtime'] = datetime.strptime(
-                v.get('qtime'), "%a %b %d %H:%M:%S %Y")
-            job['ctime'] = datetime.strptime(
-                v.get('ctime'), "%a %b %d %H:%M:%S %Y")
-            job['mtime'] = datetime.strptime(
-                v.get('mtime'), "%a %b %d %H:%M:%S %Y")
+            job['qtime'] = parse_asctime(v.get('qtime'))
+            job['ctime'] = parse_asctime(v.get('ctime'))
+            job['mtime'] = parse_asctime(v.get('mtime'))
 
             # alert
             job['alert'] = ''
 
-            self.joblist.append(job)
+            self.joblist.append(Job(job))
 
         # 録画開始時刻で昇順にソート
         self.joblist = sorted(
             self.joblist, key=lambda x: x['rec_begin'])
 
+    def _fetch_all(self):
+        """
+        qstatとpbsnodesを並行して実行し、self.joblist[]を更新して
+        (チューナー数, ホストごとのチューナー数)を返す
+        取得した情報はキャッシュに保存する
+        """
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # qstatの実行中にpbsnodesを別スレッドで実行する
+            future = executor.submit(self._get_tuner_nodes)
+            self._fetch_joblist()
+            nodes = future.result()
+
+        tuners = self._sum_tuners(nodes)
+        self.cache.save(
+            {'joblist': self.joblist, 'tuners': tuners, 'nodes': nodes})
+        return tuners, nodes
+
+    async def _fetch_all_async(self):
+        """
+        _fetch_all()の非同期版
+        """
+        _, nodes = await asyncio.gather(
+            self._fetch_joblist_async(), self._get_tuner_nodes_async())
+
+        tuners = self._sum_tuners(nodes)
+        self.cache.save(
+            {'joblist': self.joblist, 'tuners': tuners, 'nodes': nodes})
+        return tuners, nodes
+
     def get_job_list(self, jid=''):
         """
         ジョブ情報をリストに詰め、呼び出し元に返す
@@ -176,32 +349,181 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         jid:  ジョブID (str)
         """
 
-        # ジョブ情報リスト取得
-        self._fetch_joblist()
+        snapshot = self.cache.load()
+        if snapshot:
+            # キャッシュが有効期間内であればスケジューラーに問い合わせない
+            self.joblist = snapshot.get('joblist')
+            tuners = snapshot.get('tuners')
+            nodes = snapshot.get('nodes')
+        elif jid:
+            return self._get_job_list_targeted(jid)
+        else:
+            # ジョブ情報リスト取得
+            tuners, nodes = self._fetch_all()
 
         # 最大同時録画数のチェック
-        self._check_tuner_resource()
+        self._check_tuner_resource(tuners, nodes)
+        return self._select_joblist(jid)
+
+    async def get_job_list_async(self, jid=''):
+        """
+        get_job_list()の非同期版
+        """
+        snapshot = self.cache.load()
+        if snapshot:
+            self.joblist = snapshot.get('joblist')
+            tuners = snapshot.get('tuners')
+            nodes = snapshot.get('nodes')
+        elif jid:
+            return await self._get_job_list_targeted_async(jid)
+        else:
+            tuners, nodes = await self._fetch_all_async()
+
+        self._check_tuner_resource(tuners, nodes)
+        return self._select_joblist(jid)
 
+    def _select_joblist(self, jid=''):
+        """
+        self.joblist[]のコピーを返す
+        jidが指定された場合はそのジョブ情報のみ抽出する
+
+        ジョブ情報は変更不可のJobのため、リストのみコピーする
+        """
         if jid:
             # 指定されたジョブIDの情報のみ抽出
-            joblist = [i for i in self.joblist if i['rj_id'] in jid]
-        else:
-            # 全ジョブ
-            joblist = self.joblist
+            return [i for i in self.joblist if i['rj_id'] == jid]
+        # 全ジョブ
+        return list(self.joblist)
 
-        return deepcopy(joblist)
+    def _get_job_list_targeted(self, jid):
+        """
+        指定されたジョブIDのジョブのみqstatで取得し、
+        ジョブ情報リストを返す
 
-    def add(self, ch, title, begin, rectime, repeat=''):
+        最大同時録画数のチェックには有効期間切れのキャッシュにある
+        他のジョブ情報とチューナー数を使用する
+        キャッシュがない、または取得からcache_stale_max秒を超えている場合は
+        全ジョブを取得する
+        cache_ttlが0の場合はキャッシュを保存しないため、常に全ジョブを取得する
+
+        jid:  ジョブID (str)
         """
-        ジョブをサブミットし、ジョブ情報リストを返す
+        snapshot = self.cache.load(stale=True)
+        if not snapshot:
+            self._check_tuner_resource(*self._fetch_all())
+            return self._select_joblist(jid)
+
+        if not jid.isdigit():
+            # qstatのオプションと解釈されないよう数字以外は受け付けない
+            return []
+
+        self._fetch_joblist([jid])
+        return self._merge_snapshot(self.joblist, snapshot)
+
+    async def _get_job_list_targeted_async(self, jid):
+        """
+        _get_job_list_targeted()の非同期版
+        """
+        snapshot = self.cache.load(stale=True)
+        if not snapshot:
+            self._check_tuner_resource(*await self._fetch_all_async())
+            return self._select_joblist(jid)
+
+        if not jid.isdigit():
+            return []
+
+        await self._fetch_joblist_async([jid])
+        return self._merge_snapshot(self.joblist, snapshot)
+
+    def _merge_snapshot(self, targets, snapshot):
+        """
+        スナップショットのジョブ情報をtargetsのジョブ情報で置き換えて
+        最大同時録画数をチェックし、targetsのジョブ情報リストを返す
+        置き換えたスナップショットはキャッシュに書き戻す
+
+        targets:  最新のジョブ情報のリスト (list)
+        snapshot: JobCacheのスナップショット (dict)
+        """
+        jids = [i['rj_id'] for i in targets]
+        others = [i for i in snapshot.get('joblist') if i['rj_id'] not in jids]
+        self.joblist = sorted(others + targets, key=lambda x: x['rec_begin'])
+        self.cache.update(dict(snapshot, joblist=self.joblist))
+        self._check_tuner_resource(
+            snapshot.get('tuners'), snapshot.get('nodes'))
+
+        return [i for i in self.joblist if i['rj_id'] in jids]
+
+    def _changed_job_list(self, job, verify):
+        """
+        変更後のジョブ情報リストを返す
+
+        verifyがTrueの場合はqstatで変更後のジョブ情報を取得する
+        Falseの場合はqalterに渡した値から組み立てたジョブ情報を
+        そのまま使用し、最大同時録画数のチェックには
+        キャッシュにある他のジョブ情報を使用する
+        キャッシュがない、または取得からcache_stale_max秒を超えている場合は
+        verifyがTrueの場合と同じくqstatで取得する
+
+        job:    変更後のジョブ情報 (dict)
+        verify: (bool)
+        """
+        if not verify:
+            joblist = self._changed_job_list_local(job)
+            if joblist is not None:
+                return joblist
+        return self.get_job_list(job.get('rj_id'))
+
+    async def _changed_job_list_async(self, job, verify):
+        """
+        _changed_job_list()の非同期版
+        """
+        if not verify:
+            joblist = self._changed_job_list_local(job)
+            if joblist is not None:
+                return joblist
+        return await self.get_job_list_async(job.get('rj_id'))
+
+    def _changed_job_list_local(self, job):
+        """
+        qalterに渡した値から組み立てたジョブ情報をキャッシュにある
+        他のジョブ情報と合わせてチェックし、ジョブ情報リストを返す
+        使用できるキャッシュがない場合はNoneを返す
+        """
+        snapshot = self.cache.load(stale=True)
+        if not snapshot:
+            return None
+        return self._merge_snapshot([Job(job, alert='')], snapshot)
+
+    def _submit(self, ch, title, begin, rectime):
+        """
+        録画ジョブをqsubでサブミットし、ジョブIDを返す
 
         ch:      チャンネル番号(str)
         title:   番組名(str)
         begin:   開始時間(datetime)
         rectime: 録画時間(timedelta)
-        repeat:  繰り返しフラグ(str)
         """
+        qsub, jobexec = self._qsub_command(ch, title, begin, rectime)
+        proc = self._run_command(command=qsub, _input=jobexec)
+        return proc.stdout.split('.', 1)[0]
+
+    async def _submit_async(self, ch, title, begin, rectime):
+        """
+        _submit()の非同期版
+        """
+        qsub, jobexec = self._qsub_command(ch, title, begin, rectime)
+        proc = await self._run_command_async(command=qsub, _input=jobexec)
+        return proc.stdout.split('.', 1)[0]
 
+    def _qsub_command(self, ch, title, begin, rectime):
+        """
+        (qsubのコマンドライン, qsubの標準入力に渡すジョブスクリプト)を返す
+
+        ch:      チャンネル番号(str)
+        title:   番組名(str)
+        begin:   開始時間(datetime)
+        rectime: 録画時間(timedelta)
+        """
         recpt1_args = \
             '${{PBS_JOBNAME##*.}} - {}/${{PBS_JOBNAME}}.'\
             '$(date +%Y%m%d_%H%M.%S).${{PBS_JOBID%.*}}.ts'.format(self.recdir)
@@ -223,26 +545,215 @@ class RecordJobOpenpbs(rjsched.RecordJob):
                 '-o', self.logdir,
                 '-W', 'umask=222',
                 '-',]
+        return qsub, jobexec
 
-        proc = self._run_command(command=qsub, _input=jobexec)
-        return self.get_job_list(proc.stdout.split('.', 1)[0])
+    def add(self, ch, title, begin, rectime, repeat=''):
+        """
+        ジョブをサブミットし、ジョブ情報リストを返す
 
-    def remove(self, jid=''):
+        ch:      チャンネル番号(str)
+        title:   番組名(str)
+        begin:   開始時間(datetime)
+        rectime: 録画時間(timedelta)
+        repeat:  繰り返しフラグ(str)
+        """
+        jid = self._submit(ch, title, begin, rectime)
+        self.cache.invalidate()
+        return self.get_job_list(jid)
+
+    async def add_async(self, ch, title, begin, rectime, repeat=''):
+        """
+        add()の非同期版
+        """
+        jid = await self._submit_async(ch, title, begin, rectime)
+        self.cache.invalidate()
+        return await self.get_job_list_async(jid)
+
+    def add_many(self, jobs, workers=4):
+        """
+        複数のジョブを並行してサブミットし、
+        (サブミットしたジョブ情報リスト, ジョブごとの結果のリスト)を返す
+        ジョブ情報リストの取得は全ジョブのサブミット後に一度だけ行う
+
+        jobs:    (ch, title, begin, rectime)のリスト (list)
+        workers: 同時に実行するqsubの最大数 (int)
+
+        ジョブごとの結果はjobsと同じ順序で(ジョブID, エラーメッセージ)を返す
+        サブミットに失敗したジョブはジョブIDが''となる
+        """
+        def submit(job):
+            try:
+                return self._submit(*job), ''
+            except (OSError, TimeoutExpired, CalledProcessError) as err:
+                return '', str(err)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = list(executor.map(submit, jobs))
+
+        jids = [jid for jid, _ in results if jid]
+        if not jids:
+            return [], results
+
+        self.cache.invalidate()
+        joblist = [i for i in self.get_job_list() if i['rj_id'] in jids]
+        return joblist, results
+
+    async def add_many_async(self, jobs, workers=4):
+        """
+        add_many()の非同期版
+        同時に実行するqsubの数はworkersで制限する
+        """
+        semaphore = asyncio.Semaphore(max(1, workers))
+
+        async def submit(job):
+            async with semaphore:
+                try:
+                    return await self._submit_async(*job), ''
+                except (OSError, TimeoutExpired, CalledProcessError) as err:
+                    return '', str(err)
+
+        results = await asyncio.gather(*[submit(job) for job in jobs])
+
+        jids = [jid for jid, _ in results if jid]
+        if not jids:
+            return [], results
+
+        self.cache.invalidate()
+        joblist = [
+            i for i in await self.get_job_list_async() if i['rj_id'] in jids]
+        return joblist, results
+
+    def _qdel(self, jids):
+        """
+        qdelコマンド1回で複数のジョブを削除し、
+        ジョブIDごとの結果を格納したdictを返す
+
+        削除できたジョブは''、できなかったジョブはエラーメッセージとなる
+        """
+        try:
+            self._run_command(self.qdel + list(jids))
+        except (OSError, TimeoutExpired, CalledProcessError) as err:
+            return self._qdel_result(jids, err)
+        return self._qdel_result(jids)
+
+    async def _qdel_async(self, jids):
+        """
+        _qdel()の非同期版
+        """
+        try:
+            await self._run_command_async(self.qdel + list(jids))
+        except (OSError, TimeoutExpired, CalledProcessError) as err:
+            return self._qdel_result(jids, err)
+        return self._qdel_result(jids)
+
+    def _qdel_result(self, jids, err=None):
+        """
+        qdelの実行結果からジョブIDごとの結果を格納したdictを返す
+
+        err: qdelの実行時に発生した例外
+        """
+        result = {jid: '' for jid in jids}
+        if err is None:
+            return result
+
+        if isinstance(err, CalledProcessError):
+            # qdelは削除できなかったジョブごとに
+            # "qdel: Unknown Job Id 12.server" のような行を出力する
+            failed = False
+            for line in (err.stderr or '').splitlines():
+                m = self.re_qdel_error.search(line)
+                if m and m.group(1) in result:
+                    result[m.group(1)] = line.strip()
+                    failed = True
+            if failed:
+                return result
+
+        return {jid: str(err) for jid in jids}
+
+    def remove(self, jids):
         """
         引数で与えられたIDのジョブを削除する
-        FIXME: 引数をstrではなくlistに変更して複数ジョブを一括削除
+        ジョブ情報の取得は一度だけ行い、qdelは最大qdel_chunk個ずつ
+        まとめて実行する
+
+        jids: ジョブIDのリスト (list)
+              strの場合は単一のジョブIDとして扱う
 
-        削除したジョブ情報のリストを返す
+        (削除対象のジョブ情報のリスト, ジョブIDごとの結果のdict)を返す
+        結果は削除できた場合は''、できなかった場合はエラーメッセージ
         """
-        joblist = self.get_job_list(jid)
-        if joblist:
-            qdel = self.qdel[:]
-            qdel.append(jid)
-            self._run_command(qdel)
+        jids = self._unique_jids(jids)
+        joblist, result, targets = self._remove_targets(
+            jids, self.get_job_list())
+
+        for i in range(0, len(targets), self.qdel_chunk):
+            result.update(self._qdel(targets[i:i + self.qdel_chunk]))
 
-        return joblist
+        if targets:
+            self._drop_from_cache(result)
 
-    def change_begin(self, joblist, begin=None, delta=None):
+        return joblist, result
+
+    async def remove_async(self, jids):
+        """
+        remove()の非同期版
+        qdel_chunk個ずつに分けたqdelは並行して実行する
+        """
+        jids = self._unique_jids(jids)
+        joblist, result, targets = self._remove_targets(
+            jids, await self.get_job_list_async())
+
+        chunks = [targets[i:i + self.qdel_chunk]
+            for i in range(0, len(targets), self.qdel_chunk)]
+        for i in await asyncio.gather(*[self._qdel_async(c) for c in chunks]):
+            result.update(i)
+
+        if targets:
+            self._drop_from_cache(result)
+
+        return joblist, result
+
+    def _drop_from_cache(self, result):
+        """
+        削除できたジョブをキャッシュのスナップショットから除いて無効化する
+
+        result: ジョブIDごとの削除結果 (dict)
+        """
+        self.cache.invalidate()
+        snapshot = self.cache.load(stale=True)
+        if not snapshot:
+            return
+        deleted = [jid for jid, err in result.items() if not err]
+        self.cache.update(dict(snapshot, joblist=[
+            i for i in snapshot.get('joblist') if i['rj_id'] not in deleted]))
+
+    def _unique_jids(self, jids):
+        """
+        ジョブIDをリストにし、重複を除いて返す
+        """
+        if isinstance(jids, str):
+            jids = [jids]
+        return list(dict.fromkeys(jids))
+
+    def _remove_targets(self, jids, joblist):
+        """
+        (削除対象のジョブ情報のリスト, 存在しないジョブIDの結果のdict,
+        qdelに渡すジョブIDのリスト)を返す
+        """
+        joblist = [i for i in joblist if i['rj_id'] in jids]
+        exists = [i['rj_id'] for i in joblist]
+
+        result = {}
+        targets = []
+        for jid in jids:
+            if jid in exists:
+                targets.append(jid)
+            else:
+                result[jid] = 'No such JOB ID'
+
+        return joblist, result, targets
+
+    def change_begin(self, joblist, begin=None, delta=None, verify=False):
         """
         録画ジョブの開始時刻を指定時刻に変更
         変更後のジョブ情報を格納したjoblistを返す
@@ -253,17 +764,40 @@ class RecordJobOpenpbs(rjsched.RecordJob):
                  begin, deltaが両方指定された場合はdeltaが優先される
         delta:   現在の録画開始時刻との差分 (timedelta)
                  begin, deltaが両方指定された場合はdeltaが優先される
+        verify:  変更後のジョブ情報をqstatで取得する (bool)
+        """
+        qalter, job = self._prepare_change_begin(joblist, begin, delta)
+        self._run_command(qalter)
+        self.cache.invalidate()
+        return self._changed_job_list(job, verify)
+
+    async def change_begin_async(
+            self, joblist, begin=None, delta=None, verify=False):
+        """
+        change_begin()の非同期版
+        """
+        qalter, job = self._prepare_change_begin(joblist, begin, delta)
+        await self._run_command_async(qalter)
+        self.cache.invalidate()
+        return await self._changed_job_list_async(job, verify)
+
+    def _prepare_change_begin(self, joblist, begin, delta):
+        """
+        (qalterのコマンドライン, 変更後のジョブ情報)を返す
         """
         jid = joblist[0].get('rj_id')
         if delta:
             begin = joblist[0].get('rec_begin') + delta
         qalter = self.qalter[:]
         qalter.extend(['-a', begin.strftime('%Y%m%d%H%M.%S'), jid])
-        self._run_command(qalter)
 
-        return self.get_job_list(jid)
+        job = Job(
+            joblist[0],
+            rec_begin=begin,
+            rec_end=begin + joblist[0].get('walltime'))
+        return qalter, job
 
-    def change_rectime(self, joblist, rectime=None, delta=None):
+    def change_rectime(self, joblist, rectime=None, delta=None, verify=False):
         """
         録画時間を指定時間に変更
         変更後のジョブ情報を格納したjoblistを返す
@@ -274,6 +808,26 @@ class RecordJobOpenpbs(rjsched.RecordJob):
                  rectime, deltaが両方指定された場合はdeltaを優先する
         delta:   現在の録画時間との差分 (timedelta)
                  rectime, deltaが両方指定された場合はdeltaを優先する
+        verify:  変更後のジョブ情報をqstatで取得する (bool)
+        """
+        qalter, job = self._prepare_change_rectime(joblist, rectime, delta)
+        self._run_command(qalter)
+        self.cache.invalidate()
+        return self._changed_job_list(job, verify)
+
+    async def change_rectime_async(
+            self, joblist, rectime=None, delta=None, verify=False):
+        """
+        change_rectime()の非同期版
+        """
+        qalter, job = self._prepare_change_rectime(joblist, rectime, delta)
+        await self._run_command_async(qalter)
+        self.cache.invalidate()
+        return await self._changed_job_list_async(job, verify)
+
+    def _prepare_change_rectime(self, joblist, rectime, delta):
+        """
+        (qalterのコマンドライン, 変更後のジョブ情報)を返す
         """
         jid = joblist[0].get('rj_id')
         if delta:
@@ -281,11 +835,14 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         qalter = self.qalter[:]
         qalter.extend([
             '-l', 'walltime={}'.format(rectime.total_seconds()), jid])
-        self._run_command(qalter)
 
-        return self.get_job_list(jid)
+        job = Job(
+            joblist[0],
+            walltime=rectime,
+            rec_end=joblist[0].get('rec_begin') + rectime)
+        return qalter, job
 
-    def _change_jobname(self, joblist, name='', ch=''):
+    def _change_jobname(self, joblist, name='', ch='', verify=False):
         """
         "番組名"."チャンネル番号" で構成されるOpenPBSジョブ名を変更する
         変更後のジョブ情報を格納したjoblistを返す
@@ -293,6 +850,7 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         joblist:  ジョブリスト (list)
         name:     新しい番組名 (str)
         ch:       新しいチャンネル番号 (str)
+        verify:   変更後のジョブ情報をqstatで取得する (bool)
 
         FIXME:
         現在は待機中のジョブのみ対応。
@@ -301,6 +859,25 @@ class RecordJobOpenpbs(rjsched.RecordJob):
             チャンネル変更: mvで録画ファイル名を変更
                             + recpt1ctlでチューナーのチャンネルを変更
         """
+        qalter, job = self._prepare_change_jobname(joblist, name, ch)
+        self._run_command(qalter)
+        self.cache.invalidate()
+        return self._changed_job_list(job, verify)
+
+    async def _change_jobname_async(
+            self, joblist, name='', ch='', verify=False):
+        """
+        _change_jobname()の非同期版
+        """
+        qalter, job = self._prepare_change_jobname(joblist, name, ch)
+        await self._run_command_async(qalter)
+        self.cache.invalidate()
+        return await self._changed_job_list_async(job, verify)
+
+    def _prepare_change_jobname(self, joblist, name, ch):
+        """
+        (qalterのコマンドライン, 変更後のジョブ情報)を返す
+        """
         jid = joblist[0].get('rj_id')
         if not name:
             name = joblist[0].get('rj_title')
@@ -310,11 +887,14 @@ class RecordJobOpenpbs(rjsched.RecordJob):
         qalter = self.qalter[:]
         qalter.extend([
             '-N', '{}.{}'.format(name, ch), jid])
-        self._run_command(qalter)
 
-        return self.get_job_list(jid)
+        job = Job(joblist[0], rj_title=name)
+        if ch != job.get('channel'):
+            job = job.replace(
+                channel=ch, station_name=self.get_channel_list().get(ch, ''))
+        return qalter, job
 
-    def change_channel(self, joblist, ch):
+    def change_channel(self, joblist, ch, verify=False):
         """
         _change_jobname()のラッパー
         録画するチャンネルを変更する
@@ -322,10 +902,11 @@ class RecordJobOpenpbs(rjsched.RecordJob):
 
         joblist: ジョブリスト (list)
         ch:      新しいチャンネル番号 (str)
+        verify:  変更後のジョブ情報をqstatで取得する (bool)
         """
-        return self._change_jobname(joblist=joblist, ch=ch)
+        return self._change_jobname(joblist=joblist, ch=ch, verify=verify)
 
-    def change_name(self, joblist, name):
+    def change_name(self, joblist, name, verify=False):
         """
         _change_jobname()のラッパー
         番組名を変更する
@@ -333,5 +914,21 @@ class RecordJobOpenpbs(rjsched.RecordJob):
 
         joblist: ジョブリスト (list)
         name:    新しい番組名 (str)
+        verify:  変更後のジョブ情報をqstatで取得する (bool)
+        """
+        return self._change_jobname(
+            joblist=joblist, name=name, verify=verify)
+
+    async def change_channel_async(self, joblist, ch, verify=False):
+        """
+        change_channel()の非同期版
+        """
+        return await self._change_jobname_async(
+            joblist=joblist, ch=ch, verify=verify)
+
+    async def change_name_async(self, joblist, name, verify=False):
+        """
+        change_name()の非同期版
         """
-        return self._change_jobname(joblist=joblist, name=name)
+        return await self._change_jobname_async(
+            joblist=joblist, name=name, verify=verify)
@@ -0,0 +1,379 @@
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import CalledProcessError, TimeoutExpired
+import asyncio
+import heapq
+import rjsched
+import sys
+from rjsched.RecordJobOpenpbs import RecordJobOpenpbs
+from rjsched.TunerTimeline import TunerTimeline
+
+class RecordJobOpenpbsCluster(rjsched.RecordJob):
+    """
+    複数のOpenPBSサーバーをまとめて扱うバックエンド
+
+    サーバーごとにRecordJobOpenpbsを作成し、ジョブ情報の取得は
+    全サーバーに並行して問い合わせて録画開始時刻順にまとめる。
+    ジョブIDは'ジョブID@サーバー名'とし、サーバーを区別する。
+    チューナー数の確認はサーバーごとに行う。
+
+    設定ファイルのpbs_serversにサーバーを列挙する。
+        pbs_servers:
+          - name: pbs1                 # PBS_SERVERに渡すサーバー名
+            pbsexec_dir: /opt/pbs/bin  # 省略時はpbsexec_dir
+            joblog_dir: /home/USERNAME/log  # 省略時はjoblog_dir
+          - pbs2                       # サーバー名のみでもよい
+    """
+    def __init__(self, config):
+        super().__init__(config)
+        self.name = 'RecordJobOpenpbsCluster'
+        self.servers = {}
+        for server in config.get('pbs_servers') or []:
+            if isinstance(server, str):
+                server = {'name': server}
+            name = server.get('name')
+            if not name or name in self.servers:
+                raise ValueError('invalid pbs_servers: {}'.format(name))
+            # キャッシュファイルはサーバーごとに分ける
+            rec = RecordJobOpenpbs(dict(
+                config,
+                pbsexec_dir=server.get(
+                    'pbsexec_dir', config.get('pbsexec_dir')),
+                joblog_dir=server.get('joblog_dir', config.get('joblog_dir')),
+                cache_file='{}.{}'.format(
+                    config.get('cache_file', '~/.rj/joblist.cache'), name)))
+            rec.env = {'PBS_SERVER': name}
+            self.servers[name] = rec
+        if not self.servers:
+            raise ValueError('pbs_servers is not set')
+        self.joblist = []
+        self.timeline = None
+        # 最後のジョブ情報の取得に応答したサーバーごとのチューナー数
+        self.capacity = {}
+        # 最後のジョブ情報の取得に応答したサーバー
+        self.online = []
+
+    def __str__(self):
+        return self.name
+
+    def _qualify(self, name, joblist):
+        """
+        サーバーnameのジョブ情報のジョブIDを'ジョブID@サーバー名'にして返す
+        """
+        return [
+            job.replace(rj_id='{}@{}'.format(job['rj_id'], name), server=name)
+                for job in joblist]
+
+    def _split_jid(self, jid):
+        """
+        'ジョブID@サーバー名'を(サーバー名, ジョブID)にして返す
+        サーバー名がない場合はサーバー名をNoneとする
+        """
+        if '@' in jid:
+            local, name = jid.rsplit('@', 1)
+            return name, local
+        return None, jid
+
+    def _route(self, jid):
+        """
+        ジョブIDを問い合わせる(サーバー名, ジョブID)のリストを返す
+        サーバー名のないジョブIDは全サーバーに問い合わせる
+        """
+        name, local = self._split_jid(jid)
+        if name is None:
+            return [(i, local) for i in self.servers]
+        if name not in self.servers:
+            return []
+        return [(name, local)]
+
+    def _map(self, func, targets):
+        """
+        targetsの(サーバー名, 引数)ごとにfunc(RecordJobOpenpbs, 引数)を
+        並行して実行し、{サーバー名: 戻り値}を返す
+
+        失敗したサーバーは警告を表示して除く
+        全サーバーで失敗した場合は最初の例外を送出する
+        """
+        if not targets:
+            return {}
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            futures = [
+                (name, executor.submit(func, self.servers[name], arg))
+                    for name, arg in targets]
+            results = {}
+            errors = []
+            for name, future in futures:
+                try:
+                    results[name] = future.result()
+                except (OSError, TimeoutExpired, CalledProcessError) as err:
+                    print('cannot get job information from {}: {}'.format(
+                        name, err), file=sys.stderr)
+                    errors.append(err)
+        if errors and not results:
+            raise errors[0]
+        return results
+
+    def _merge(self, results):
+        """
+        サーバーごとのジョブ情報リストを録画開始時刻順にまとめて返す
+        """
+        return list(heapq.merge(
+            *[self._qualify(name, joblist)
+                for name, joblist in results.items()],
+            key=lambda x: x['rec_begin']))
+
+    def _update_capacity(self, names):
+        """
+        サーバーごとのチューナー数と、全サーバーの合計のTunerTimelineを
+        応答したサーバーnamesのみから作り直す
+        応答しなかったサーバーのチューナー数は合計に含めない
+        """
+        capacity = {}
+        for name in names:
+            timeline = self.servers[name].timeline
+            if timeline:
+                capacity[name] = timeline.capacity
+            elif name in self.capacity:
+                # チューナー数を取得できなかった場合は前回の値とする
+                capacity[name] = self.capacity[name]
+        self.capacity = capacity
+        total = {}
+        for capacity in self.capacity.values():
+            for k, v in capacity.items():
+                total[k] = total.get(k, 0) + v
+        self.timeline = TunerTimeline(total)
+        self.timeline.check(self.joblist)
+
+    def get_job_list(self, jid=''):
+        """
+        全サーバーのジョブ情報をまとめたリストを返す
+        jidが指定された場合はそのジョブ情報のみ返す
+
+        jid:  ジョブID (str)
+              'ジョブID@サーバー名'または'ジョブID'
+        """
+        if jid:
+            return self._merge(self._map(
+                lambda rec, local: rec.get_job_list(local), self._route(jid)))
+
+        results = self._map(
+            lambda rec, _: rec.get_job_list(),
+            [(name, None) for name in self.servers])
+        self.joblist = self._merge(results)
+        self.online = list(results)
+        self._update_capacity(results)
+        return list(self.joblist)
+
+    async def get_job_list_async(self, jid=''):
+        """
+        get_job_list()の非同期版
+        """
+        targets = self._route(jid) if jid else [
+            (name, '') for name in self.servers]
+        returns = await asyncio.gather(
+            *[self.servers[name].get_job_list_async(local)
+                for name, local in targets],
+            return_exceptions=True)
+
+        results = {}
+        errors = []
+        for (name, _), ret in zip(targets, returns):
+            if isinstance(ret, (OSError, TimeoutExpired, CalledProcessError)):
+                print('cannot get job information from {}: {}'.format(
+                    name, ret), file=sys.stderr)
+                errors.append(ret)
+            elif isinstance(ret, BaseException):
+                raise ret
+            else:
+                results[name] = ret
+        if errors and not results:
+            raise errors[0]
+
+        if jid:
+            return self._merge(results)
+        self.joblist = self._merge(results)
+        self.online = list(results)
+        self._update_capacity(results)
+        return list(self.joblist)
+
+    def _booked(self, timeline, tuner, begin, end):
+        """
+        beginからendまでのチューナー種別tunerの最大同時録画数を返す
+        """
+        booked = timeline.at(tuner, begin)
+        for t, concurrency in timeline.timeline.get(tuner, []):
+            if begin < t <= end:
+                booked = max(booked, concurrency)
+        return booked
+
+    def _select_server(self, ch, begin, rectime, joblists):
+        """
+        録画時間中の空きチューナーが最も多いサーバー名を返す
+        空きが同じ場合はpbs_serversの順で先のサーバーとする
+
+        joblists: サーバーごとのジョブ情報リスト (dict)
+                  選択したサーバーのリストには追加するジョブを加える
+        """
+        tuner = 'bs' if self._is_bs(ch) else 'tt'
+        end = begin + rectime
+        best = None
+        for name in self.servers:
+            if name not in joblists or name not in self.online:
+                # 応答しなかったサーバーには振り分けない
+                continue
+            capacity = self.capacity.get(name, {})
+            timeline = TunerTimeline(capacity)
+            timeline.check(joblists[name])
+            free = capacity.get(tuner, 0) - self._booked(
+                timeline, tuner, begin, end)
+            if best is None or free > best[1]:
+                best = (name, free)
+        if best is None:
+            raise ValueError('no PBS server is available')
+
+        joblists[best[0]].append(
+            {'tuner': tuner, 'rec_begin': begin, 'rec_end': end})
+        return best[0]
+
+    def _current_joblists(self):
+        """
+        全サーバーのジョブ情報を取得し、{サーバー名: ジョブ情報リスト}を返す
+        """
+        self.get_job_list()
+        joblists = {name: [] for name in self.online}
+        for job in self.joblist:
+            joblists[job['server']].append(job)
+        return joblists
+
+    def add(self, ch, title, begin, rectime, repeat=''):
+        """
+        録画時間中の空きチューナーが最も多いサーバーにジョブをサブミットし、
+        ジョブ情報リストを返す
+        """
+        name = self._select_server(
+            ch, begin, rectime, self._current_joblists())
+        joblist = self.servers[name].add(ch, title, begin, rectime, repeat)
+        return self._qualify(name, joblist)
+
+    def add_many(self, jobs, workers=4):
+        """
+        複数のジョブをサーバーに振り分けてサブミットし、
+        (サブミットしたジョブ情報リスト, ジョブごとの結果のリスト)を返す
+        振り分けは先頭のジョブから順に、それまでに振り分けたジョブも含めて
+        空きチューナーが最も多いサーバーとする
+
+        jobs:    (ch, title, begin, rectime)のリスト (list)
+        workers: サーバーごとに同時に実行するqsubの最大数 (int)
+        """
+        joblists = self._current_joblists()
+        groups = {}
+        for i, job in enumerate(jobs):
+            name = self._select_server(job[0], job[2], job[3], joblists)
+            groups.setdefault(name, []).append(i)
+
+        returns = self._map(
+            lambda rec, indices: rec.add_many(
+                [jobs[i] for i in indices], workers),
+            list(groups.items()))
+
+        joblist = []
+        results = [('', 'cannot submit job')] * len(jobs)
+        for name, indices in groups.items():
+            if name not in returns:
+                continue
+            submitted, server_results = returns[name]
+            joblist.extend(self._qualify(name, submitted))
+            for i, (jid, err) in zip(indices, server_results):
+                results[i] = ('{}@{}'.format(jid, name) if jid else '', err)
+        joblist.sort(key=lambda x: x['rec_begin'])
+        return joblist, results
+
+    def remove(self, jids):
+        """
+        引数で与えられたIDのジョブを削除する
+        サーバー名のないジョブIDは、一つのサーバーにのみ存在する場合に削除する
+
+        (削除対象のジョブ情報のリスト, ジョブIDごとの結果のdict)を返す
+        """
+        if isinstance(jids, str):
+            jids = [jids]
+        jids = list(dict.fromkeys(jids))
+
+        result = {}
+        targets = {}
+        joblist = None
+        for jid in jids:
+            name, local = self._split_jid(jid)
+            if name is None:
+                if len(self.servers) == 1:
+                    name = next(iter(self.servers))
+                else:
+                    if joblist is None:
+                        joblist = self.get_job_list()
+                    found = [
+                        i['server'] for i in joblist
+                            if self._split_jid(i['rj_id'])[1] == local]
+                    if len(found) > 1:
+                        result[jid] = 'ambiguous JOB ID, use ID@server'
+                        continue
+                    name = found[0] if found else None
+            if name not in self.servers:
+                result[jid] = 'No such JOB ID'
+                continue
+            targets.setdefault(name, []).append(local)
+
+        removed = []
+        for name, (server_joblist, server_result) in self._map(
+                lambda rec, locals_: rec.remove(locals_),
+                list(targets.items())).items():
+            removed.extend(self._qualify(name, server_joblist))
+            for local, err in server_result.items():
+                result['{}@{}'.format(local, name)] = err
+        removed.sort(key=lambda x: x['rec_begin'])
+        return removed, result
+
+    def _member(self, joblist):
+        """
+        変更対象のジョブのサーバー名、RecordJobOpenpbsと
+        サーバーのジョブIDにしたジョブ情報リストを返す
+        """
+        job = joblist[0]
+        name, local = self._split_jid(job['rj_id'])
+        if name is None:
+            name = job.get('server')
+        if name not in self.servers:
+            raise ValueError('unknown PBS server: {}'.format(name))
+        return name, self.servers[name], [job.replace(rj_id=local)]
+
+    def change_begin(self, joblist, begin=None, delta=None, verify=False):
+        """
+        録画ジョブの開始時刻を変更する
+        引数と戻り値はRecordJobOpenpbs.change_begin()と同じ
+        """
+        name, rec, joblist = self._member(joblist)
+        return self._qualify(
+            name, rec.change_begin(joblist, begin, delta, verify))
+
+    def change_rectime(self, joblist, rectime=None, delta=None, verify=False):
+        """
+        録画時間を変更する
+        引数と戻り値はRecordJobOpenpbs.change_rectime()と同じ
+        """
+        name, rec, joblist = self._member(joblist)
+        return self._qualify(
+            name, rec.change_rectime(joblist, rectime, delta, verify))
+
+    def change_channel(self, joblist, ch, verify=False):
+        """
+        録画するチャンネルを変更する
+        引数と戻り値はRecordJobOpenpbs.change_channel()と同じ
+        """
+        name, rec, joblist = self._member(joblist)
+        return self._qualify(name, rec.change_channel(joblist, ch, verify))
+
+    def change_name(self, joblist, name, verify=False):
+        """
+        番組名を変更する
+        引数と戻り値はRecordJobOpenpbs.change_name()と同じ
+        """
+        server, rec, joblist = self._member(joblist)
+        return self._qualify(server, rec.change_name(joblist, name, verify))
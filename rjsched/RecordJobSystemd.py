@@ -1,31 +1,57 @@
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from subprocess import run, PIPE, STDOUT, DEVNULL, CalledProcessError
 import hashlib
 import os
+import rjsched
 import sys
-
-class RecordJobSystemd(recordjob.RecordJob):
-    def __init__(self):
-        super().__init__()
+from rjsched.Job import Job
+from rjsched.TimeParser import parse_oncalendar, parse_systemd_time
+from rjsched.TunerTimeline import TunerTimeline
+from rjsched.UnitIndex import UnitIndex
+
+class RecordJobSystemd(rjsched.RecordJob):
+    def __init__(self, config):
+        super().__init__(config)
         self.name = 'RecordJobSystemd'
         self.prefix = 'RJ'
         self.unitdir = os.path.expanduser('~') + '/.config/systemd/user'
-        self.tuner_tt_num = 2
-        self.tuner_bs_num = 2
+        self.tuner_tt_num = config.get('tuner_tt_num', 2)
+        self.tuner_bs_num = config.get('tuner_bs_num', 2)
+        self.timeline = None
+        self.index = UnitIndex(
+            config.get('unit_index_file', '~/.rj/systemd.index'),
+            self.unitdir, self.prefix)
+        self.batch_depth = 0
+        self.batch_reload = False
+        self.batch_timers = []
         self.sctl = ['systemctl', '--user']
         self.sctl_start = self.sctl + ['start']
         self.sctl_stop = self.sctl + ['stop']
         self.sctl_enable = self.sctl + ['enable']
         self.sctl_disable = self.sctl + ['disable']
         self.sctl_show = self.sctl + ['--all', '--no-pager', 'show']
+        self.sctl_show_state = self.sctl + [
+            '--no-pager',
+            'show',
+            '--property=Id,ActiveState,NextElapseUSecRealtime,'
+            'LastTriggerUSec,MainPID',
+        ]
+        self.show_chunk = 256
+        self.sctl_show_schedule = self.sctl + [
+            '--no-pager',
+            'show',
+            '--property=Id,ActiveState,NextElapseUSecRealtime,'
+            'LastTriggerUSec,Environment',
+            self.prefix + '.*.timer',
+            self.prefix + '.*.service',
+        ]
         self.sctl_showenv = self.sctl + [
             '--all',
             '--no-pager',
             'show-environment',
         ]
         self.sctl_reload = self.sctl + ['daemon-reload']
-        self.recpt1 = [self.recpt1_path, '--b25', '--strip']
-        self.recpt1ctl = [self.recpt1ctl_path]
         self.execstop = 'ExecStopPost=@/bin/bash "/bin/bash" "-c" "systemctl --user disable {}"'
         self.template_timer = """# created programmatically via rj. Do not edit.
 [Unit]
@@ -154,25 +180,11 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
         timerユニットはsystemd startで有効化する。
         また、OS再起動後も自動的に有効化されるよう
         systemd enableする。
+        batch()の中で呼んだ場合、start/enableはbatch()の終了時に
+        まとめて行う
         """
-        unit, rj_id_long = self._gen_unitname_jobid(ch, title, begin)
-
         try:
-            # timer/serviceユニットファイル作成
-            timer_file = self.unitdir + '/' + unit + '.timer'
-            service_file = self.unitdir + '/' + unit + '.service'
-
-            self._create_timer(timer_file, title, begin, repeat)
-            self._create_service(service_file, ch, title, rectime, repeat)
-
-            # timerユニットをsystemctl start, enabled
-            sctl_start = self.sctl_start[:]
-            sctl_enable = self.sctl_enable[:]
-            sctl_start.append(unit + '.timer')
-            sctl_enable.append(unit + '.timer')
-
-            run(sctl_start, check=True, stdout=DEVNULL, stderr=STDOUT)
-            run(sctl_enable, check=True, stdout=DEVNULL, stderr=STDOUT)
+            rj_id_long = self._add(ch, title, begin, rectime, repeat)
         except (PermissionError, FileNotFoundError) as err:
             print('cannot create unit file:', err)
             rj_id_long = ''
@@ -182,38 +194,188 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
 
         return rj_id_long
 
-    def remove(self, jid=''):
+    def _add(self, ch, title, begin, rectime, repeat=''):
         """
-        録画ジョブを削除する
+        ユニットファイルを作成してtimerユニットをstart/enableし、
+        ジョブIDを返す
+        失敗した場合はOSError, CalledProcessErrorを送出する
         """
-        jobinfo = self.get_job_info(jid=jid)
-        if not jobinfo:
-            print('no such jobid:', jid)
-            return
+        unit, rj_id_long = self._gen_unitname_jobid(ch, title, begin)
+        before = self.index.mtime()
 
-        timers = []
-        services = []
-        for i in jobinfo:
-            timers.append(i['timer']['Names'])
-            services.append(i['service']['Names'])
+        # timer/serviceユニットファイル作成
+        timer_file = self.unitdir + '/' + unit + '.timer'
+        service_file = self.unitdir + '/' + unit + '.service'
 
-        # timer停止(ジョブ削除)
-        sctl_stop = self.sctl_stop[:]
-        sctl_disable = self.sctl_disable[:]
+        self._create_timer(timer_file, title, begin, repeat)
+        self._create_service(service_file, ch, title, rectime, repeat)
+        self.index.add(before, {rj_id_long: unit})
+
+        if self.batch_depth:
+            self.batch_timers.append(unit + '.timer')
+            return rj_id_long
+
+        # timerユニットをsystemctl start, enabled
+        sctl_start = self.sctl_start[:]
+        sctl_enable = self.sctl_enable[:]
+        sctl_start.append(unit + '.timer')
+        sctl_enable.append(unit + '.timer')
+
+        run(sctl_start, check=True, stdout=DEVNULL, stderr=STDOUT)
+        run(sctl_enable, check=True, stdout=DEVNULL, stderr=STDOUT)
+
+        return rj_id_long
+
+    def add_many(self, jobs, workers=4):
+        """
+        複数のジョブのユニットファイルをまとめて作成し、
+        (作成したジョブ情報リスト, ジョブごとの結果のリスト)を返す
+        daemon-reloadと、全timerユニットのstart/enableは一度だけ行う
+
+        jobs:    (ch, title, begin, rectime[, repeat])のリスト (list)
+        workers: RecordJobOpenpbs.add_many()と同じ呼び出し方をするための
+                 引数で、使用しない (int)
+
+        ジョブごとの結果はjobsと同じ順序で(ジョブID, エラーメッセージ)を返す
+        作成に失敗したジョブはジョブIDが''となる
+        """
+        results = []
+        with self.batch() as errors:
+            for job in jobs:
+                try:
+                    results.append((self._add(*job), ''))
+                except OSError as err:
+                    results.append(('', str(err)))
 
-        sctl_stop.extend(timers)
-        sctl_stop.extend(services)
-        sctl_disable.extend(timers)
+        # start/enableに失敗したジョブはエラーとする
+        for index, job in enumerate(jobs):
+            unit = self._gen_unitname_jobid(*job[:3])[0] + '.timer'
+            if results[index][0] and unit in errors:
+                results[index] = ('', errors[unit])
+
+        jids = [jid for jid, _ in results if jid]
+        if not jids:
+            return [], results
+
+        joblist = [
+            i for i in self.get_job_info() if i['rj_id_long'] in jids]
+        return joblist, results
+
+    @contextmanager
+    def batch(self):
+        """
+        withブロック内のユニットファイルの変更をまとめて反映する
+
+        ブロック内のadd()で作成したtimerユニットのstart/enableと、
+        change_*()によるdaemon-reloadはブロックの終了時に一度だけ行う
+        ブロックの終了後、yieldしたdictに
+        {timerユニット名: エラーメッセージ}が格納される
+        """
+        errors = {}
+        self.batch_depth += 1
         try:
-            run(sctl_stop, check=True, stdout=DEVNULL, stderr=STDOUT)
-            run(sctl_disable, check=True, stdout=DEVNULL, stderr=STDOUT)
-        except (CalledProcessError) as err:
-            print('cannot delete job:', err)
+            yield errors
+        finally:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                errors.update(self._batch_commit())
+
+    def _batch_commit(self):
+        """
+        batch()で保留したdaemon-reloadとtimerユニットのstart/enableを行い、
+        {timerユニット名: エラーメッセージ}を返す
+        """
+        timers = self.batch_timers
+        reload = self.batch_reload or timers
+        self.batch_timers = []
+        self.batch_reload = False
+
+        if reload:
+            self._unit_reload()
+        errors = {}
+        for command in (self.sctl_start, self.sctl_enable):
+            targets = [i for i in timers if i not in errors]
+            errors.update(self._systemctl_units(command, targets))
+        return errors
+
+    def _systemctl_units(self, command, units):
+        """
+        全ユニットを指定したsystemctlコマンドを1回実行する
+        失敗した場合はユニットごとに実行し直して、
+        {ユニット名: エラーメッセージ}を返す
+        """
+        if not units:
+            return {}
+        try:
+            run(command + units, check=True, stdout=DEVNULL, stderr=STDOUT)
+            return {}
+        except (OSError, CalledProcessError):
+            pass
+
+        errors = {}
+        for unit in units:
+            try:
+                run(command + [unit], check=True, stdout=PIPE, stderr=STDOUT,
+                    universal_newlines=True)
+            except CalledProcessError as err:
+                errors[unit] = (err.output or str(err)).strip()
+            except OSError as err:
+                errors[unit] = str(err)
+        return errors
+
+    def remove(self, jids):
+        """
+        引数で与えられたIDのジョブを削除する
+        timer/serviceユニットのstopとtimerユニットのdisableは
+        全ジョブ分まとめて実行する
+
+        jids: ジョブIDのリスト (list)
+              strの場合は単一のジョブIDとして扱う
+
+        (削除対象のジョブ情報のリスト, ジョブIDごとの結果のdict)を返す
+        結果は削除できた場合は''、できなかった場合はエラーメッセージ
+        結果のキーは存在するジョブでは一覧表示と同じ8桁のジョブIDとする
+        """
+        if isinstance(jids, str):
+            jids = [jids]
+        jids = list(dict.fromkeys(jids))
+
+        joblist = []
+        result = {}
+        for jid in jids:
+            key = 'rj_id' if len(jid) == 8 else 'rj_id_long'
+            jobinfo = [
+                i for i in self.get_job_info(jid=jid) if i[key] == jid]
+            if not jobinfo:
+                result[jid] = 'No such JOB ID'
+            elif jobinfo[0]['rj_id'] not in result:
+                joblist.extend(jobinfo)
+                result[jobinfo[0]['rj_id']] = ''
+
+        timers = [i['timer']['Names'] for i in joblist]
+        services = [i['service']['Names'] for i in joblist]
+
+        # timer停止(ジョブ削除)
+        errors = self._systemctl_units(self.sctl_stop, timers + services)
+        errors.update(self._systemctl_units(
+            self.sctl_disable, [i for i in timers if i not in errors]))
+
+        for i in joblist:
+            err = errors.get(i['timer']['Names']) \
+                or errors.get(i['service']['Names'])
+            if err:
+                result[i['rj_id']] = err
+
+        return joblist, result
 
     def _unit_reload(self):
         """
         ユニットファイルを再読込する
+        batch()の中では再読込をbatch()の終了時まで保留する
         """
+        if self.batch_depth:
+            self.batch_reload = True
+            return
         try:
             run(self.sctl_reload, check=True)
         except (CalledProcessError) as err:
@@ -338,8 +500,18 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
     def get_job_info(self, date=None, jid=''):
         """
         録画ジョブ情報を取得して返す
+
+        ジョブIDを指定した場合は、対応表から得たユニットのみ取得する
+        チューナー数超過の確認は_get_schedule()で得た全ジョブに対して行う
         """
-        jobinfo = self._get_job_info_systemd()
+        units = None
+        if jid:
+            try:
+                units = self.index.lookup(
+                    [jid] if isinstance(jid, str) else jid)
+            except OSError:
+                pass
+        jobinfo = self._get_job_info_systemd(units)
 
         if jid:
             # 指定のIDのジョブのみ抽出
@@ -358,10 +530,181 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
 
         return jobinfo
 
-    def _create_job_info_base(self):
+    def _create_job_info_base(self, units=None):
         """
         全ジョブのtimer/serviceユニット情報を取得し、
         下記構成のdictを作成して返す
+        {
+            'unit1': {
+                {'timer':   {timerユニットの情報}},
+                {'service': {serviceユニットの情報}},
+                {'tuner':   'tt' または 'bs'}
+            },
+            ...
+        }
+
+        ユニットファイルから必要な項目のみ読み込み、systemctl showでは
+        録画開始時刻などの実行時の状態のみ取得する
+        unitdirを読めない場合は_create_job_info_base_show()で取得する
+
+        units: 取得するユニット名(拡張子なし)のリスト
+               指定しない場合は全ジョブを取得する (list)
+        """
+        try:
+            jobs = self._scan_unit_files(units)
+        except OSError:
+            return self._create_job_info_base_show()
+
+        jobs = self._append_unit_state(jobs)
+        jobs = self._check_orphaned(jobs)
+        return jobs
+
+    def _scan_unit_files(self, units=None):
+        """
+        unitdirにあるジョブのユニットファイルを読み込み、
+        _create_job_info_base()と同じ構成のdictを返す
+
+        units: 読み込むユニット名(拡張子なし)のリスト
+               指定しない場合はunitdirの全ジョブを読み込む (list)
+        """
+        if units is None:
+            with os.scandir(self.unitdir) as entries:
+                names = [
+                    (entry.name, entry.path) for entry in entries
+                        if entry.name.startswith(self.prefix + '.')
+                ]
+        else:
+            names = [
+                (unit + '.' + suffix,
+                    os.path.join(self.unitdir, unit + '.' + suffix))
+                        for unit in units for suffix in ('timer', 'service')
+            ]
+
+        jobs = {}
+        for name, path in names:
+            unit, _, suffix = name.rpartition('.')
+            if suffix not in ('timer', 'service'):
+                continue
+            if units is not None and not os.path.exists(path):
+                continue
+            info = self._parse_unit_file(path)
+            info['Names'] = name
+            info['FragmentPath'] = path
+
+            if not jobs.get(unit):
+                jobs[unit] = {}
+                jobs[unit]['tuner'] = unit.rsplit('.', 1)[1]
+            jobs[unit][suffix] = info
+
+        return jobs
+
+    def _parse_unit_file(self, path):
+        """
+        ユニットファイルからDescription, OnCalendar, Environmentのみ
+        読み込んでdictで返す
+        Environmentはsystemctl showと同じく引用符を除いた形式にする
+        """
+        info = {}
+        try:
+            with open(path) as f:
+                for line in f:
+                    key, sep, value = line.partition('=')
+                    if sep and key in ('Description', 'OnCalendar', 'Environment'):
+                        info[key] = value.strip()
+        except (OSError, UnicodeDecodeError) as err:
+            print('cannot read unit file:', err)
+        if 'Environment' in info:
+            info['Environment'] = info['Environment'].replace('"', '')
+        return info
+
+    def _append_unit_state(self, jobs):
+        """
+        systemctl showで取得したユニットの状態をジョブ情報に追加する
+        timer、serviceともに動作していないジョブは除く
+        """
+        names = []
+        for unit, J in jobs.items():
+            for suffix in ('timer', 'service'):
+                if suffix in J:
+                    names.append(unit + '.' + suffix)
+
+        states = {}
+        for i in range(0, len(names), self.show_chunk):
+            command = self.sctl_show_state + names[i:i + self.show_chunk]
+            for state in self._run_systemctl_show(command):
+                if state.get('Id'):
+                    states[state['Id']] = state
+
+        active = {}
+        for unit, J in jobs.items():
+            for suffix in ('timer', 'service'):
+                if suffix in J:
+                    J[suffix].update(states.get(unit + '.' + suffix, {}))
+            if self._is_active(J):
+                active[unit] = J
+
+        return active
+
+    def _is_active(self, J):
+        """
+        timer、serviceのどちらかが動作中のジョブであればTrueを返す
+        """
+        timer_state = J.get('timer', {}).get('ActiveState')
+        service_state = J.get('service', {}).get('ActiveState')
+        return timer_state == 'active' or service_state in (
+            'active', 'activating', 'deactivating', 'reloading')
+
+    def _get_schedule(self, exclude=()):
+        """
+        動作中の全ジョブのチューナー種別、録画開始時刻、録画終了時刻を
+        ワイルドカード指定のsystemctl show 1回で取得し、リストで返す
+        ジョブID指定の取得でも、指定外のジョブとのチューナー数超過を
+        確認するためのもの
+        ユニットファイルは開始時刻が得られないジョブのみ読み込む
+
+        exclude: 除外するユニット名(拡張子なし)のリスト (list)
+        """
+        jobs = {}
+        for state in self._run_systemctl_show(self.sctl_show_schedule):
+            unit, _, suffix = state.get('Id', '').rpartition('.')
+            if suffix not in ('timer', 'service') or unit in exclude:
+                continue
+            if not jobs.get(unit):
+                jobs[unit] = {}
+                jobs[unit]['tuner'] = unit.rsplit('.', 1)[1]
+            jobs[unit][suffix] = state
+
+        schedule = []
+        for unit, J in jobs.items():
+            if not J.get('timer') or not J.get('service') \
+                    or not self._is_active(J):
+                continue
+            rec_begin = self._rec_begin(J['timer'])
+            path = os.path.join(self.unitdir, unit + '.timer')
+            if not rec_begin and os.path.exists(path):
+                # ONESHOTのジョブはユニットファイルのOnCalendarから
+                # 開始時刻を得る
+                rec_begin = self._rec_begin(self._parse_unit_file(path))
+            env = dict(
+                i.split('=', 1) for i in
+                    J['service'].get('Environment', '').split() if '=' in i)
+            try:
+                walltime = timedelta(seconds=int(env['RJ_walltime']))
+            except (KeyError, ValueError):
+                continue
+            if rec_begin:
+                schedule.append({
+                    'tuner': J['tuner'],
+                    'rec_begin': rec_begin,
+                    'rec_end': rec_begin + walltime,
+                })
+
+        return schedule
+
+    def _create_job_info_base_show(self):
+        """
+        全ジョブのtimer/serviceユニット情報をsystemctl showで取得し、
+        下記構成のdictを作成して返す
         {
             'unit1': {
                 {'timer':   {<systemctl show timerユニット>の出力}},
@@ -413,25 +756,19 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
         ベースとなるジョブ情報に録画関連情報を追加
         """
         current = datetime.now()
+        chlist = self.get_channel_list()
         for unit in jobs:
             J = jobs.get(unit)
             # 録画開始時刻
-            rec_begin = J['timer'].get('NextElapseUSecRealtime')
-            if not rec_begin:
-                # ジョブ実行中(録画中)
-                rec_begin = J['timer'].get('LastTriggerUSec')
-
+            rec_begin = self._rec_begin(J['timer'])
             if rec_begin:
-                # 開始時刻のdatetimeオブジェクトを追加
-                J['rec_begin'] = datetime.strptime(
-                    # WDY YYYY-MM-DD HH:MM:SS TZN
-                    rec_begin, "%a %Y-%m-%d %H:%M:%S %Z"
-                )
-                if J['rec_begin'] < current:
-                    # 録画中
-                    elapse = current - J['rec_begin']
-                    J['elapse'] = elapse
-                    J['record_state'] = 'Recording'
+                J['rec_begin'] = rec_begin
+
+            if J.get('rec_begin') and J['rec_begin'] < current:
+                # 録画中
+                elapse = current - J['rec_begin']
+                J['elapse'] = elapse
+                J['record_state'] = 'Recording'
 
             # チャンネル、録画時間、録画終了時刻
             rec_env = J['service'].get('Environment')
@@ -441,6 +778,7 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
                 walltime = walltime.split('=')[1]
 
                 J['channel'] = ch
+                J['station_name'] = chlist.get(ch, '')
                 J['walltime'] = timedelta(seconds=int(walltime))
                 J['rec_end'] = (
                     J['rec_begin'] + J['walltime'] 
@@ -453,24 +791,55 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
             J['rj_id'] = J['rj_id_long'][0:8]
             J['repeat'] = J['timer'].get('Description').split(':')[1]
 
-    def _get_job_info_systemd(self):
+    def _rec_begin(self, timer):
+        """
+        timerユニットの情報から録画開始時刻を求めて返す
+        求められない場合はNoneを返す
+        """
+        # --property指定のsystemctl showは値がない場合'n/a'を返す
+        rec_begin = timer.get('NextElapseUSecRealtime')
+        if not rec_begin or rec_begin == 'n/a':
+            # ジョブ実行中(録画中)
+            rec_begin = timer.get('LastTriggerUSec')
+        if rec_begin and rec_begin != 'n/a':
+            # WDY YYYY-MM-DD HH:MM:SS TZN
+            return parse_systemd_time(rec_begin)
+        if timer.get('OnCalendar'):
+            # ONESHOTのジョブはユニットファイルのOnCalendarから
+            # 開始時刻を得る
+            try:
+                return parse_oncalendar(timer['OnCalendar'])
+            except ValueError:
+                pass
+        return None
+
+    def _get_job_info_systemd(self, units=None):
         """
         全ジョブのtimerユニット/serviceユニット情報を取得し、
         補足情報を追加して配列に詰めて返す
+
+        units: 取得するユニット名(拡張子なし)のリスト
+               指定しない場合は全ジョブを取得する (list)
+               指定した場合も、チューナー数超過は指定外のジョブを
+               含めて確認する
         """
         jobarray = []
 
-        jobs = self._create_job_info_base()
+        jobs = self._create_job_info_base(units)
         self._append_job_info(jobs)
 
         # 開始時間で昇順にソート
         jobarray = [
-            jobs[k] for k, v in sorted(
+            Job(jobs[k]) for k, v in sorted(
                 jobs.items(), key=lambda x:x[1]['rec_begin']
             )
         ]
 
-        self._check_channel_resource(jobarray)
+        if units is None or not jobarray:
+            self._check_channel_resource(jobarray)
+        else:
+            self._check_channel_resource(
+                jobarray, self._get_schedule(exclude=jobs))
 
         return jobarray
 
@@ -485,56 +854,54 @@ ExecStart=@/bin/bash "/bin/bash" "-c" "{_recpt1} $$RJ_ch $$RJ_walltime {_output}
         if service:
             command.append(unit + '.service')
 
-        unitlist = []
+        return self._run_systemctl_show(command)
+
+    def _run_systemctl_show(self, command):
+        """
+        systemctl showを実行し、出力をユニット毎に辞書にまとめ、
+        リストに詰めて返す
+        """
         try:
             ret = run(
                 command, universal_newlines=True, stdout=PIPE, stderr=PIPE)
-            unit = {}
-            for i in ret.stdout.split('\n'):
-                if not i:
-                    # ユニット情報の終端まで来たので
-                    # 辞書をリストに追加
-                    unitlist.append(unit)
-                    unit = {}
-                    continue
-                # ユニット情報を辞書にまとめる。
-                k, v = i.split('=', 1)
-                unit[k] = v
+            return self._parse_show(ret.stdout)
         except (OSError, ValueError) as err:
             print('cannot get unit information: ', err)
             return []
 
+    def _parse_show(self, stdout):
+        """
+        systemctl showの出力をユニット毎に辞書にまとめ、
+        リストに詰めて返す
+        """
+        unitlist = []
+        unit = {}
+        for i in stdout.split('\n'):
+            if not i:
+                # ユニット情報の終端まで来たので
+                # 辞書をリストに追加
+                unitlist.append(unit)
+                unit = {}
+                continue
+            # ユニット情報を辞書にまとめる。
+            k, v = i.split('=', 1)
+            unit[k] = v
+
         return unitlist
 
-    def _check_channel_resource(self, jobarray):
+    def _check_channel_resource(self, jobarray, others=()):
         """
         チャンネルリソースの空き具合をチェックする
+
+        others: jobarray以外に集計に含めるジョブのリスト
+                警告はjobarrayのジョブにのみ追加する (list)
         """
-        tuner = {
-            'tt': {'jobs': [], 'max': self.tuner_tt_num},
-            'bs': {'jobs': [], 'max': self.tuner_bs_num},
-        }
         message = 'Not enough tuners'
-
-        for job in jobarray:
-            t = job.get('tuner')
-            if len(tuner[t]['jobs']) < tuner[t]['max']:
-                # チャンネルの空きがある
-                tuner[t]['jobs'].append(job)
-            else:
-                # ガベージコレクト
-                for overlap in tuner[t]['jobs']:
-                    # tuner[t]['jobs']のジョブから
-                    # 録画終了しているものを削除
-                    if job['rec_begin'] > overlap['rec_end']:
-                        tuner[t]['jobs'].remove(overlap)
-
-                # 改めてチャンネルの空き確認
-                if (len(tuner[t]['jobs']) < tuner[t]['max']):
-                    # チャンネルの空きがある
-                    tuner[t]['jobs'].append(job)
-                else:
-                    # 警告を追加
-                    job['alert'] = message
-                    for i in tuner[t]['jobs']:
-                        i['alert'] = message
+        self.timeline = TunerTimeline(
+            {'tt': self.tuner_tt_num, 'bs': self.tuner_bs_num})
+
+        for i in self.timeline.check(list(jobarray) + list(others)):
+            if i >= len(jobarray):
+                continue
+            # チューナー数を超過した時点で開始するジョブに警告を追加
+            jobarray[i] = jobarray[i].replace(alert=message)
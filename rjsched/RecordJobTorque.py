@@ -1,14 +1,19 @@
-from subprocess import Popen, PIPE, TimeoutExpired
+from subprocess import Popen, PIPE, CalledProcessError, TimeoutExpired
+from tempfile import TemporaryFile
 import re
 from datetime import datetime, timedelta
+import threading
 import time
 import yaml
+import rjsched
+from rjsched import Metrics
+from rjsched.Job import Job
+from rjsched.TimeParser import parse_asctime, parse_walltime
+from rjsched.Timings import timings
+from rjsched.TunerTimeline import TunerTimeline
 
 # torque commands
-qstat_path = '/usr/local/torque/bin/qstat'
-pbsnodes_path = '/usr/local/torque/bin/pbsnodes'
-qsub_path = '/usr/local/torque/bin/qsub'
-qalter_path = '/usr/local/torque/bin/qalter'
+torque_dir = '/usr/local/torque/bin'
 recpt1_path = '/usr/local/bin/recpt1'
 scriptdir = '/home/autumn/jobsh'
 logdir = '/home/autumn/log'
@@ -20,192 +25,309 @@ queuename = {
     'terrestrial': 'tt',
 }
 
-class RecordJobTorque:
-    def __init__(self):
-        self.qstat = [qstat_path, '-f', '-1' ]
-        self.pbsnodes = [pbsnodes_path, '-a' ]
-        self.qsub = qsub_path
-        self.qalter = [qalter_path, '-a' ]
+# qstat -f -1、pbsnodes -a、qsubの出力に使う正規表現
+# 行ごとにコンパイルし直さないようモジュールの読み込み時に一度だけ作る
+RE_JOBID = re.compile(r'Job Id:\s*(\d+)\.')
+RE_NODE_ATTR = re.compile(r'\s+(state|np|properties) = (\S+)')
+RE_NODE_UNAVAILABLE = re.compile(r'offline|down')
+RE_QSUB_JID = re.compile(r'(\d+)\.')
+
+# ジョブ情報の組み立てに使うqstat -f -1の属性
+# これ以外の属性は読み飛ばし、保持しない
+JOB_ATTRS = frozenset((
+    'Job_Name',
+    'Job_Owner',
+    'job_state',
+    'queue',
+    'Resource_List.walltime',
+    'Execution_Time',
+    'start_time',
+    'exec_host',
+    'euser',
+    'egroup',
+    'qtime',
+    'ctime',
+    'mtime',
+))
+
+class RecordJobTorque(rjsched.RecordJob):
+    def __init__(self, config=None):
+        config = config or {}
+        super().__init__(config)
+        self.name = 'RecordJobTorque'
+        pbsexec = config.get('pbsexec_dir') or torque_dir
+        self.qstat = [pbsexec + '/qstat', '-f', '-1']
+        self.pbsnodes = [pbsexec + '/pbsnodes', '-a']
+        self.qsub = pbsexec + '/qsub'
+        self.qalter = [pbsexec + '/qalter', '-a']
         self.comm_timeout = comm_timeout
-        self.recpt1_path = recpt1_path
-        self.scriptdir = scriptdir
-        self.logdir = logdir
-        self.recdir = recdir
-        self.channel_file = channel_file
-        self.job_state = {
-            'C': "Completed",
-            'E': "Exiting",
-            'H': "on Hold",
-            'Q': "Queued",
-            'R': "Recording",
-            'T': "Moved",
-            'W': "Waiting",
-            'S': "Suspend",
-        }
-
-    def _get_torque_job_info(self, target_jid=None):
+        self.recpt1_path = config.get('recpt1_path') or recpt1_path
+        self.scriptdir = config.get('jobscript_dir') or scriptdir
+        self.logdir = config.get('joblog_dir') or logdir
+        self.recdir = config.get('recdir') or recdir
+        self.channel_file = config.get('channel_file') or channel_file
+        self.joblist = []
+        self.timeline = None
+
+    def __str__(self):
+        return self.name
+
+    def _stream_command(self, command):
         """
-        qstatコマンドを-f -1オプション付きで実行した出力から
-        ジョブ毎の情報を取得し配列として返す
-        """
-        jobs = {}
-        current = datetime.now()
-
-        if target_jid:
-            if not target_jid.isdigit():
-                return []
+        コマンドを実行し、標準出力を1行ずつ返す
+        出力全体を保持しないため、ジョブ数によらずメモリ使用量は一定
 
-            self.qstat.append(target_jid)
-
-        # qstat -f -1でジョブ情報を取得し、２次元dictに詰める
-        # jobs['jobid'][{"key": value, "key": value, ...}]
+        comm_timeout秒以内に終了しない場合はコマンドをkillして
+        TimeoutExpiredを、終了ステータスが0以外の場合は
+        CalledProcessErrorを送出する
+        標準エラー出力は出力が詰まらないよう一時ファイルに受ける
+        """
+        begin = time.perf_counter()
         try:
-            with Popen(self.qstat,
+            with TemporaryFile('w+') as stderr, Popen(command,
                 universal_newlines=True,
                 stdout=PIPE,
-                stderr=PIPE
-            ) as pjob:
+                stderr=stderr,
+                env=self._command_env()
+            ) as proc:
+                # 出力の途中で止まったコマンドも読み込み中にkillする
+                killed = threading.Event()
+
+                def kill():
+                    killed.set()
+                    proc.kill()
+
+                timer = threading.Timer(self.comm_timeout, kill)
+                timer.start()
+                try:
+                    yield from proc.stdout
+                    proc.wait()
+                finally:
+                    timer.cancel()
+                if killed.is_set():
+                    raise TimeoutExpired(command, self.comm_timeout)
+                if proc.returncode:
+                    stderr.seek(0)
+                    raise CalledProcessError(
+                        proc.returncode, command, stderr=stderr.read())
+        finally:
+            elapsed = time.perf_counter() - begin
+            timings.command(command, elapsed)
+            Metrics.latency.observe(command, elapsed)
+
+    def _qstat_command(self, jid=None):
+        """
+        qstatのコマンドラインを返す
+        """
+        qstat = self.qstat[:]
+        if jid:
+            qstat.append(jid)
+        return qstat
+
+    def _parse_qstat(self, lines):
+        """
+        qstat -f -1の出力を1行ずつ読み、(ジョブID, 属性のdict)を順に返す
+        属性はJOB_ATTRSに含まれるもののみ保持する
+        """
+        jid = None
+        attrs = None
+        for line in lines:
+            if line[:1].isspace():
+                # ジョブの属性。大半の行はこれのため正規表現を使わずに分解する
+                key, sep, value = line.partition(' = ')
+                if sep and attrs is not None:
+                    key = key.strip()
+                    if key in JOB_ATTRS:
+                        attrs[key] = value.strip()
+                continue
+            m = RE_JOBID.match(line)
+            if m:
+                # a job informations begin here
+                if attrs is not None:
+                    yield jid, attrs
+                jid = m.group(1)
+                attrs = {}
+        if attrs is not None:
+            yield jid, attrs
+
+    def _build_job(self, jid, attrs, current, chlist):
+        """
+        qstat -f -1のジョブの属性からジョブ情報を組み立てる
+        キーはRecordJobOpenpbsのジョブ情報と同じ
+        """
+        # ジョブID、チャンネル番号、番組名
+        # ジョブ名は "チャンネル番号.番組名" 形式
+        job = {'rj_id': jid}
+        name = attrs.get('Job_Name', '')
+        ch, _, title = name.partition('.')
+        if title and ch.isdigit():
+            job['channel'] = ch
+            job['rj_title'] = title
+        else:
+            # 不正なチャンネル番号
+            job['channel'] = '0'
+            job['rj_title'] = name
+        job['station_name'] = chlist.get(job.get('channel'), '')
+
+        # 録画時間
+        job['walltime'] = parse_walltime(attrs.get('Resource_List.walltime'))
+
+        # ジョブの状態、録画開始時刻、録画終了時間、録画開始からの経過時間
+        state = attrs.get('job_state')
+        if 'Execution_Time' in attrs:
+            # 実行開始前(State: W)のジョブ。
+            # ex. "Tue Mar 15 23:59:50 2016"
+            job['rec_begin'] = parse_asctime(attrs['Execution_Time'])
+        elif 'start_time' in attrs:
+            # 実行中(State: R)、実行終了(State: C)のジョブ。
+            job['rec_begin'] = parse_asctime(attrs['start_time'])
+        else:
+            job['rec_begin'] = current
+        job['rec_end'] = job['rec_begin'] + job['walltime']
+        job['record_state'] = self.job_state.get(state)
+        if state == 'R':
+            job['elapse'] = current - job['rec_begin']
+        else:
+            job['elapse'] = None
+        if 'exec_host' in attrs:
+            job['exec_host'] = attrs['exec_host'].split('/')[0]
+
+        # 地上波(tt) or 衛星放送(bs)
+        # キュー名がそのままチューナー種別となる
+        queue = attrs.get('queue')
+        if queue in self.queuename.values():
+            job['tuner'] = queue
+        else:
+            job['tuner'] = 'not_rec_job'
 
-                re_jobid = re.compile(r'^Job Id:\s*(\d+)\.')
-                re_equal = re.compile(r'^\s+([\w.]+) = (.+$)')
+        # ジョブのオーナー、ジョブのグループ
+        job['user'] = attrs.get('euser') or \
+            attrs.get('Job_Owner', '').partition('@')[0]
+        job['group'] = attrs.get('egroup')
 
-                for jinfo in pjob.stdout:
-                    if re.match(re_jobid, jinfo):
-                        # a job informations begin here
-                        jid = re.match(re_jobid, jinfo).group(1)
-                        jobs[jid] = {}
-                        jobs[jid]['JID'] = jid
-                        continue
+        # qtime, ctime, mtime
+        job['qtime'] = parse_asctime(attrs.get('qtime'))
+        job['ctime'] = parse_asctime(attrs.get('ctime'))
+        job['mtime'] = parse_asctime(attrs.get('mtime'))
 
-                    if re.match(re_equal, jinfo):
-                        # set key and value to jobs['jobid']
-                        jkey, jval = re.match(re_equal, jinfo).group(1,2)
-                        jobs[jid][jkey] = jval
+        job['alert'] = ''
+        return Job(job)
 
-        except (OSError, ValueError) as err:
-            print('cannot get job information: {0}'.format(err))
-            return []
-
-        # 不足する情報を追加
-        for jid in jobs.keys():
-            job = jobs[jid]
-            if 'Execution_Time' in job:
-                # 実行開始前(State: W)のジョブ。
-                # 実行開始時間はqstat -fのExectiton_Timeから取得できる。
-                # ex. "Tue Mar 15 23:59:50 2016"
-                job['rec_begin'] = datetime.strptime(
-                    job['Execution_Time'], "%a %b %d %H:%M:%S %Y")
-            elif 'start_time' in job:
-                # 実行中(State: R)、実行終了(State: C)のジョブ。
-                # 実行開始時間はqstat -fのstart_timeから取得できる。
-                # フォーマットはExecution_Timeに同じ。
-                job['rec_begin'] = datetime.strptime(
-                    job['start_time'], "%a %b %d %H:%M:%S %Y")
-            else:
-                # ここに来るケースあるかしら？
-                job['rec_begin'] = current;
-
-            # ジョブ終了時間をjob['rec_end']に登録する。
-            # ジョブ開始時間 + Resource_List.walltime
-            wt_h, wt_m, wt_s = list(
-                map(int, job['Resource_List.walltime'].split(':')))
-            job['rec_end'] = (
-                job['rec_begin'] + timedelta(
-                    hours=wt_h, minutes=wt_m, seconds=wt_s))
-
-            # タイトル、チャンネル番号を登録する
-            job['channel'], job['title'] = job['Job_Name'].split('.', 1)
-
-            # qstatのjob_stateをわかりやすい表記に
-            job['record_state'] = self.job_state[job['job_state']]
-
-            if job['job_state'] == 'R':
-                # 録画開始からの経過時間を算出
-                job['elapse'] = (current - job['rec_begin']).seconds
-
-        job_array = [jobs[x] for x in sorted(jobs.keys())]
-        job_array = sorted(job_array, key=lambda j: j['rec_begin'])
-        self._check_channel_resource(job_array)
-
-        return job_array
-
-    def _check_channel_resource(self, job_array):
+    def _build_joblist(self, lines):
         """
-        チャンネルリソースの空き具合をチェックする
+        qstat -f -1の出力を1行ずつ読みながらジョブ情報を組み立て、
+        self.joblist[]に詰める
         """
-        queue_info = self._get_queue_info()
+        current = datetime.now()
+        chlist = self.get_channel_list()
+        self.joblist = [
+            self._build_job(jid, attrs, current, chlist)
+            for jid, attrs in self._parse_qstat(lines)]
 
-        for job in job_array:
-            if job['job_state'] == 'C':
-                continue
-            if (len(queue_info[job['queue']]['jobs']) <
-                queue_info[job['queue']]['ch_max']):
-                # チャンネルの空きがある
-                # queue_info[job['queue']]['jobs']にこのジョブを登録
-                queue_info[job['queue']]['jobs'].append(job)
-            else:
-                # ガベージコレクト
-                for old_job in queue_info[job['queue']]['jobs']:
-                    # queue_info[job['queue']]['jobs']に残っているジョブから
-                    # 録画終了しているものを削除
-                    if job['rec_begin'] > old_job['rec_end']:
-                        queue_info[job['queue']]['jobs'].remove(old_job)
-
-                # 改めてチャンネルの空き確認
-                if (len(queue_info[job['queue']]['jobs']) <
-                    queue_info[job['queue']]['ch_max']):
-                    # チャンネルの空きがある
-                    # queue_info[job['queue']]['jobs']にこのジョブを登録
-                    queue_info[job['queue']]['jobs'].append(job)
-                else:
-                    job['alert'] = 'NoResource'
-
-    def _get_queue_info(self):
+        # 録画開始時刻で昇順にソート
+        self.joblist.sort(key=lambda x: x['rec_begin'])
+
+    def _fetch_joblist(self, jid=None):
         """
-        pbsnodes -qの出力から以下の情報を取得し、ハッシュとして返す。
-          ノード名
-          properties: そのノードの所属するキュー名
-          np:         チューナー数
-          state:      ノードの状態
+        qstat -f -1の出力からジョブ情報を取得し、self.joblist[]に詰める
+        jidが指定された場合はそのジョブのみqstatで取得する
         """
-        nodes = {}
-        queue_info = {}
+        if jid and not jid.isdigit():
+            # qstatのオプションと解釈されないよう数字以外は受け付けない
+            self.joblist = []
+            return
 
         try:
-            with Popen(self.pbsnodes,
-                universal_newlines=True,
-                stdout=PIPE,
-                stderr=PIPE
-            ) as pnodes:
-                re_ninfo = re.compile(r'^\s+(state|np|properties) = (\S+)')
-                re_nname = re.compile(r'^\S+')
-                for ninfo in pnodes.stdout:
-                    if re.match(re_nname, ninfo):
-                        # a node informations begin here
-                        n = ninfo.rstrip()
-                        nodes[n] = {}
-                        continue
-                    if re.match(re_ninfo, ninfo):
-                        (key, value) = re.search(re_ninfo, ninfo).group(1, 2)
-                        nodes[n][key] = value
-        except (OSError, ValueError) as err:
-            print('cannot get node information: {0}'.format(err))
-            return None
+            with timings.phase('build joblist'):
+                self._build_joblist(
+                    self._stream_command(self._qstat_command(jid)))
+        except CalledProcessError:
+            if not jid:
+                raise
+            # 存在しないジョブIDを指定するとqstatはエラー終了する
+            self.joblist = []
+        except (OSError, ValueError, TimeoutExpired) as err:
+            print('cannot get job information: {0}'.format(err))
+            self.joblist = []
+
+    def _parse_pbsnodes(self, lines):
+        """
+        pbsnodes -aの出力を1行ずつ読み、稼動中のノードのチューナー数を
+        ノードのproperties(キュー名)ごとに集計する
+          state:      ノードの状態
+          np:         チューナー数
+          properties: そのノードの所属するキュー名
+        """
+        tuners = {'tt': 0, 'bs': 0}
+        node = None
 
-        # キューごとに、そのキューに所属するノードとチャンネル数を集計する。
-        for node in nodes.values():
-            if re.search(r'(offline|down)', node['state']):
+        def add(node):
+            if not node or RE_NODE_UNAVAILABLE.search(node.get('state', '')):
                 # 稼動状態にないノードは除外
-                continue
+                return
+            if node.get('properties') in tuners:
+                tuners[node['properties']] += int(node.get('np', 0))
+
+        for line in lines:
+            m = RE_NODE_ATTR.match(line)
+            if m:
+                if node is not None:
+                    node[m.group(1)] = m.group(2)
+            elif line[:1].strip():
+                # a node informations begin here
+                add(node)
+                node = {}
+        add(node)
+        return tuners
+
+    def _get_tuner_num(self):
+        """
+        稼動中のノードのチューナー数をキュー名ごとに集計する
+        """
+        try:
+            return self._parse_pbsnodes(self._stream_command(self.pbsnodes))
+        except CalledProcessError as err:
+            print('cannot get node information: {0} {1}'.format(
+                err, (err.stderr or '').strip()))
+            return {}
+        except (OSError, ValueError, TimeoutExpired) as err:
+            print('cannot get node information: {0}'.format(err))
+            return {}
 
-            if not node['properties'] in queue_info:
-                queue_info[node['properties']] = {}
-                queue_info[node['properties']]['ch_max'] = 0
-                queue_info[node['properties']]['jobs'] = []
+    def _check_tuner_resource(self, tuners=None):
+        """
+        チューナーの空き具合をチェックする
+        最大同時録画数を超過しているジョブには警告をつける
+        実行終了(State: C)のジョブは集計対象外
 
-            queue_info[node['properties']]['ch_max'] += int(node['np'])
+        tuners: チューナー数 (dict)
+                省略時は_get_tuner_num()で取得する
+        """
+        msg = 'Out of Tuners. Max: {}'
+        if tuners is None:
+            tuners = self._get_tuner_num()
+        self.timeline = TunerTimeline(tuners)
+
+        indices = [i for i, job in enumerate(self.joblist)
+            if job.get('record_state') != self.job_state['C']]
+        with timings.phase('check tuner resource'):
+            overflow = self.timeline.check([self.joblist[i] for i in indices])
+        for i in overflow:
+            # チューナー数を超過した時点で開始するジョブに警告を追加
+            job = self.joblist[indices[i]]
+            self.joblist[indices[i]] = Job(
+                job, alert=msg.format(tuners.get(job.get('tuner'))))
+
+    def get_job_list(self, jid=''):
+        """
+        ジョブ情報をリストに詰め、呼び出し元に返す
+        jidが指定されている場合はそのジョブ情報のみ取得する
 
-        return queue_info
+        jid:  ジョブID (str)
+        """
+        self._fetch_joblist(jid)
+        self._check_tuner_resource()
+        return list(self.joblist)
 
     def mod_begintime(self, jobinfo, date=None, time_delta=None):
         """
@@ -226,11 +348,12 @@ class RecordJobTorque:
             _min=begin.minute,
             _sec=begin.second)
 
-        self.qalter.extend([at, jobinfo[0]['JID']])
+        # 呼び出しごとにコマンドラインを組み立てる
+        qalter = self.qalter + [at, jobinfo[0]['rj_id']]
 
         # ジョブ開始時間を変更
         try:
-            with Popen(self.qalter, universal_newlines=True) as modify:
+            with Popen(qalter, universal_newlines=True) as modify:
                 modify.wait(timeout=self.comm_timeout)
         except (OSError, ValueError, TimeoutExpired) as err:
             print('cannot modify job: {0}'.format(err))
@@ -252,7 +375,7 @@ class RecordJobTorque:
         録画ジョブ情報を取得して配列として返す
         """
 
-        jobinfo = self._get_torque_job_info(jid)
+        jobinfo = self.get_job_list(jid or '')
 
         if date:
             # dateで指定された日のジョブのみを配列に詰め直す
@@ -306,7 +429,7 @@ _id=`echo $PBS_JOBID | awk -F'.' '{{printf("%04d", $1)}}'`
 {_recpt1} {_lnb} --b25 --strip {_ch} - {_recdir}/{_title}.{_ch}.`date +%Y%m%d_%H%M.%S`.$_id.ts
 """
 
-        filename = scriptdir + '/' + title + '.' + at + '.sh'
+        filename = self.scriptdir + '/' + title + '.' + at + '.sh'
         try:
             with open(filename, 'w') as f:
                 f.write(
@@ -338,7 +461,7 @@ _id=`echo $PBS_JOBID | awk -F'.' '{{printf("%04d", $1)}}'`
 
                 # get submitted job's ID
                 stdout_data, stderr_data = submit.communicate()
-                jid = re.match(r'^(\d+)\.', stdout_data).group(1)
+                jid = RE_QSUB_JID.match(stdout_data).group(1)
 
         except (OSError, ValueError, TimeoutExpired) as err:
             print('cannot submit job: {0}'.format(err))
@@ -0,0 +1,94 @@
+"""
+スケジューラーが出力する固定フォーマットの時刻文字列を変換する
+
+datetime.strptime()はロケールに依存し、呼び出しごとに書式を解釈するため遅い。
+ここでは書式を決め打ちで分解し、同じ文字列の変換結果はキャッシュする。
+qstatのqtime, ctime, mtimeなどは多数のジョブで同じ値になることが多い。
+"""
+
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+WEEKDAYS = frozenset(('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'))
+CACHE_SIZE = 4096
+
+def _hms(value, text):
+    """
+    "HH:MM:SS"を(時, 分, 秒)に分解する
+    """
+    hms = value.split(':')
+    if len(hms) != 3 or not all(i.isdigit() for i in hms):
+        raise ValueError('invalid time: {!r}'.format(text))
+    return int(hms[0]), int(hms[1]), int(hms[2])
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_asctime(text):
+    """
+    OpenPBS、Torqueのqstatが出力する時刻をdatetimeに変換する
+    datetime.strptime(text, "%a %b %d %H:%M:%S %Y")と同じ結果を返す
+
+    ex. "Sun Aug 16 20:00:00 2020", "Sun Aug  9 20:00:00 2020"
+    """
+    try:
+        wday, mon, day, hms, year = text.split()
+    except (AttributeError, ValueError):
+        raise ValueError('invalid timestamp: {!r}'.format(text))
+    if wday not in WEEKDAYS or mon not in MONTHS \
+            or not day.isdigit() or not year.isdigit():
+        raise ValueError('invalid timestamp: {!r}'.format(text))
+    hour, minute, second = _hms(hms, text)
+    return datetime(int(year), MONTHS[mon], int(day), hour, minute, second)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_systemd_time(text):
+    """
+    systemctl showが出力する時刻をdatetimeに変換する
+    タイムゾーン名は無視し、ローカル時刻として扱う
+
+    ex. "Sun 2020-08-16 20:00:00 JST"
+    """
+    try:
+        wday, ymd, hms = text.split()[:3]
+        year, month, day = ymd.split('-')
+    except (AttributeError, ValueError):
+        raise ValueError('invalid timestamp: {!r}'.format(text))
+    if wday not in WEEKDAYS \
+            or not (year.isdigit() and month.isdigit() and day.isdigit()):
+        raise ValueError('invalid timestamp: {!r}'.format(text))
+    hour, minute, second = _hms(hms, text)
+    return datetime(int(year), int(month), int(day), hour, minute, second)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_oncalendar(text):
+    """
+    timerユニットファイルのOnCalendarに書いた時刻をdatetimeに変換する
+    RecordJobSystemdが作成する"YYYY-MM-DD HH:MM:SS"の形式のみ扱う
+
+    ex. "2020-08-16 20:00:00"
+    """
+    try:
+        ymd, hms = text.split()
+        year, month, day = ymd.split('-')
+    except (AttributeError, ValueError):
+        raise ValueError('invalid timestamp: {!r}'.format(text))
+    if not (year.isdigit() and month.isdigit() and day.isdigit()):
+        raise ValueError('invalid timestamp: {!r}'.format(text))
+    hour, minute, second = _hms(hms, text)
+    return datetime(int(year), int(month), int(day), hour, minute, second)
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_walltime(text):
+    """
+    qstatのwalltime "HH:MM:SS"をtimedeltaに変換する
+    時は24以上の値もとりうる
+
+    ex. "00:29:30", "100:00:00"
+    """
+    if not isinstance(text, str):
+        raise ValueError('invalid walltime: {!r}'.format(text))
+    hour, minute, second = _hms(text, text)
+    return timedelta(hours=hour, minutes=minute, seconds=second)
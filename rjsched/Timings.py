@@ -0,0 +1,140 @@
+"""
+rjの処理時間の計測
+
+処理の段階ごとの経過時間、_run_command()で実行した外部コマンドごとの
+待ち時間、tracemallocによるピークメモリ使用量を記録し、
+標準エラー出力にまとめて表示する。
+計測を有効にしない限りphase()、command()は何もしない。
+"""
+
+from contextlib import contextmanager
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+class Timings:
+    def __init__(self):
+        self.enabled = False
+        self.begin = None
+        self.phases = []
+        self.commands = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def start(self, memory=True):
+        """
+        計測を開始する
+
+        memory: tracemallocでメモリ使用量を計測する (bool)
+        """
+        self.enabled = True
+        self.begin = time.perf_counter()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        withブロックの経過時間をnameの段階として記録する
+        入れ子にした場合は内側の段階を字下げして表示する
+        """
+        if not self.enabled:
+            yield
+            return
+        depth = getattr(self.local, 'depth', 0)
+        with self.lock:
+            index = len(self.phases)
+            self.phases.append([name, depth, None])
+        self.local.depth = depth + 1
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[index][2] = time.perf_counter() - begin
+            self.local.depth = depth
+
+    def command(self, command, elapsed):
+        """
+        外部コマンドの実行に要した時間を記録する
+
+        command: 実行したコマンド (list)
+        elapsed: 経過時間(秒) (float)
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.commands.append((command, elapsed))
+
+    def startup(self):
+        """
+        プロセスの起動から計測開始までの時間(秒)を返す
+        Pythonの起動とモジュールのimportに要した時間に相当する
+        取得できない場合はNoneを返す
+        """
+        try:
+            with open('/proc/self/stat') as f:
+                # プロセス名に空白が含まれる場合があるため')'以降を分割する
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open('/proc/uptime') as f:
+                uptime = float(f.read().split()[0])
+        except (OSError, IndexError, ValueError):
+            return None
+        started = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+        elapsed = time.perf_counter() - self.begin
+        return max(0.0, uptime - started - elapsed)
+
+    def summary(self):
+        """
+        計測結果を表示用の文字列にして返す
+        """
+        total = time.perf_counter() - self.begin
+        lines = ['rj timings:']
+        startup = self.startup()
+        if startup is not None:
+            lines.append('  {:36} {:9.1f} ms'.format(
+                'startup (python, imports)', startup * 1000))
+
+        for name, depth, elapsed in self.phases:
+            if elapsed is None:
+                continue
+            lines.append('  {:36} {:9.1f} ms'.format(
+                '  ' * depth + name, elapsed * 1000))
+
+        if self.commands:
+            waited = sum(i[1] for i in self.commands)
+            lines.append('  {:36} {:9.1f} ms'.format(
+                'commands ({})'.format(len(self.commands)), waited * 1000))
+            for command, elapsed in self.commands:
+                name = ' '.join(
+                    [os.path.basename(command[0])] + list(command[1:]))
+                if len(name) > 32:
+                    name = name[:31] + '~'
+                lines.append('    {:34} {:9.1f} ms'.format(
+                    name, elapsed * 1000))
+
+        lines.append('  {:36} {:9.1f} ms'.format('total', total * 1000))
+
+        if tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            lines.append('  {:36} {:9.1f} KiB'.format(
+                'peak memory (tracemalloc)', peak / 1024))
+        try:
+            import resource
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            lines.append('  {:36} {:9.1f} KiB'.format('max RSS', maxrss))
+        except ImportError:
+            pass
+
+        return '\n'.join(lines)
+
+    def report(self, file=None):
+        """
+        計測結果を標準エラー出力に表示する
+        """
+        if not self.enabled:
+            return
+        print(self.summary(), file=file or sys.stderr)
+
+timings = Timings()
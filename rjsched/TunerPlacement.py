@@ -0,0 +1,94 @@
+import heapq
+
+class TunerPlacement:
+    """
+    録画ジョブを録画ノードのチューナーに割り当て、
+    ノードごとの同時録画数がチューナー数を超過するジョブを求める
+
+    実行中のジョブ(exec_hostがノードに含まれるジョブ)はそのノードに固定し、
+    それ以外のジョブは開始時刻順にノード名順で最初に空きのあるノードに割り当てる。
+    録画時間の扱いはTunerTimelineと同じく開始時刻、終了時刻を含む閉区間とする。
+    """
+    def __init__(self, nodes):
+        """
+        nodes: ノードごとのチューナー種別ごとのチューナー数 (dict)
+               ex. {'node1': {'tt': 2, 'bs': 2}, 'node2': {'tt': 1, 'bs': 0}}
+        """
+        self.nodes = nodes
+        self.placement = {}
+
+    def check(self, joblist):
+        """
+        joblistのジョブをノードに割り当て、チューナーに空きがないジョブの
+        (インデックス, ノード名のリスト)のリストをインデックス順に返す
+
+        ノード名のリストは固定されたジョブの場合は実行ノード、
+        それ以外はそのチューナー種別のチューナーを持つ全ノード
+        割り当てたノードはself.placement[インデックス]に記録する
+
+        joblist: 'tuner', 'rec_begin', 'rec_end'を持つジョブのリスト (list)
+                 'exec_host'があれば実行ノードとして扱う
+                 どのノードも持たないチューナー種別のジョブは集計対象外
+        """
+        self.placement = {}
+        types = set()
+        for capacity in self.nodes.values():
+            types.update(capacity)
+
+        groups = {}
+        for i, job in enumerate(joblist):
+            _type = job.get('tuner')
+            if _type in types:
+                groups.setdefault(_type, []).append(i)
+
+        overflow = []
+        for _type, indices in groups.items():
+            overflow.extend(self._sweep(_type, joblist, indices))
+
+        return sorted(overflow)
+
+    def _sweep(self, _type, joblist, indices):
+        """
+        開始時刻順にジョブを走査し、ノードごとに録画中のジョブの終了時刻を
+        ヒープで管理して割り当てる
+        同じ開始時刻では固定されたジョブを先に割り当てる
+        """
+        hosts = sorted(
+            k for k, v in self.nodes.items() if v.get(_type, 0) > 0)
+        recording = {host: [] for host in self.nodes}
+        indices = sorted(indices, key=lambda i: (
+            joblist[i].get('rec_begin'),
+            joblist[i].get('exec_host') not in self.nodes))
+        overflow = []
+
+        for i in indices:
+            begin = joblist[i].get('rec_begin')
+            end = joblist[i].get('rec_end')
+            host = joblist[i].get('exec_host')
+            if host in self.nodes:
+                # 実行中のジョブはチューナーの空きに関わらず実行ノードで録画する
+                if self._free(recording[host], host, _type, begin) <= 0:
+                    overflow.append((i, [host]))
+                heapq.heappush(recording[host], end)
+                self.placement[i] = host
+                continue
+
+            for host in hosts:
+                if self._free(recording[host], host, _type, begin) > 0:
+                    heapq.heappush(recording[host], end)
+                    self.placement[i] = host
+                    break
+            else:
+                # どのノードにもチューナーの空きがない
+                overflow.append((i, hosts))
+
+        return overflow
+
+    def _free(self, recording, host, _type, begin):
+        """
+        begin時点でのノードhostのチューナーの空き数を返す
+        """
+        while recording and recording[0] < begin:
+            # 録画終了しているジョブを除く
+            heapq.heappop(recording)
+        return self.nodes[host].get(_type, 0) - len(recording)
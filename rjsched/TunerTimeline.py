@@ -0,0 +1,105 @@
+from bisect import bisect_left, bisect_right
+import heapq
+
+class TunerTimeline:
+    """
+    録画ジョブの開始時刻、終了時刻からチューナー種別ごとの
+    同時録画数の推移を求める
+
+    ジョブの録画時間は開始時刻、終了時刻を含む閉区間として扱う。
+    あるジョブの終了時刻と別のジョブの開始時刻が同じ場合は重複とみなす。
+    """
+    def __init__(self, capacity):
+        """
+        capacity: チューナー種別ごとのチューナー数 (dict)
+                  ex. {'tt': 2, 'bs': 2}
+        """
+        self.capacity = capacity
+        self.timeline = {}
+        self.peak = {}
+        # チューナー種別ごとの(開始時刻のリスト, 終了時刻のリスト)
+        self.events = {}
+
+    def check(self, joblist):
+        """
+        joblistの同時録画数を集計し、チューナー数を超過した時点で
+        開始するジョブのインデックスのリストを返す
+
+        joblist: 'tuner', 'rec_begin', 'rec_end'を持つジョブのリスト (list)
+                 capacityにないチューナー種別のジョブは集計対象外
+        """
+        self.timeline = {}
+        self.peak = {}
+        self.events = {}
+        groups = {}
+        for i, job in enumerate(joblist):
+            _type = job.get('tuner')
+            if _type in self.capacity:
+                groups.setdefault(_type, []).append(i)
+
+        overflow = []
+        for _type, indices in groups.items():
+            overflow.extend(self._sweep(_type, joblist, indices))
+
+        return sorted(overflow)
+
+    def _sweep(self, _type, joblist, indices):
+        """
+        開始時刻順にジョブを走査し、録画中のジョブの終了時刻を
+        ヒープで管理して同時録画数を求める
+        """
+        capacity = self.capacity.get(_type, 0)
+        indices = sorted(indices, key=lambda i: joblist[i].get('rec_begin'))
+        timeline = []
+        peak = 0
+        recording = []
+        overflow = []
+        begins = []
+        ends = []
+
+        for i in indices:
+            begin = joblist[i].get('rec_begin')
+            while recording and recording[0] < begin:
+                # 録画終了しているジョブを除く
+                end = heapq.heappop(recording)
+                ends.append(end)
+                self._append(timeline, end, len(recording))
+            if len(recording) >= capacity:
+                # チューナーに空きがない
+                overflow.append(i)
+            heapq.heappush(recording, joblist[i].get('rec_end'))
+            begins.append(begin)
+            self._append(timeline, begin, len(recording))
+            peak = max(peak, len(recording))
+
+        while recording:
+            end = heapq.heappop(recording)
+            ends.append(end)
+            self._append(timeline, end, len(recording))
+
+        self.timeline[_type] = timeline
+        self.peak[_type] = peak
+        # 終了時刻はヒープから昇順に取り出している
+        self.events[_type] = (begins, ends)
+        return overflow
+
+    def _append(self, timeline, time, concurrency):
+        """
+        同時録画数の変化点を追加する
+        同一時刻の変化点は最後の値のみ残す
+        """
+        if timeline and timeline[-1][0] == time:
+            timeline[-1] = (time, concurrency)
+        else:
+            timeline.append((time, concurrency))
+
+    def at(self, _type, time):
+        """
+        指定時刻におけるチューナー種別_typeの同時録画数を返す
+
+        check()と同じく閉区間として数えるため、終了時刻ちょうどの
+        ジョブも録画中とする。timelineの変化点は同一時刻の開始と終了を
+        まとめた後の値のため、開始時刻、終了時刻のリストから求める
+        """
+        begins, ends = self.events.get(_type, ([], []))
+        return bisect_right(begins, time) - bisect_left(ends, time)
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from rjsched.AtomicFile import write_atomic
+
+class UnitIndex:
+    """
+    systemdバックエンドのジョブIDとユニット名の対応表をファイルに保存する
+
+    対応表にはユニットファイルのディレクトリの最終更新時刻(ns)を記録し、
+    ディレクトリの最終更新時刻と一致しない場合は
+    ユニットファイルが追加、削除されたものとみなして作り直す。
+    """
+    def __init__(self, path, unitdir, prefix='RJ'):
+        self.path = os.path.expanduser(path)
+        self.unitdir = unitdir
+        self.prefix = prefix
+
+    def _mtime(self):
+        return os.stat(self.unitdir).st_mtime_ns
+
+    def _load(self):
+        """
+        保存した対応表を読み込み、(最終更新時刻, 対応表)を返す
+        読み込めない場合は(None, None)を返す
+        """
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+            return index['mtime_ns'], index['units']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    def _save(self, mtime, units):
+        """
+        対応表を書き込む
+        書き込みに失敗してもエラーとはしない
+        """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_atomic(
+                self.path, json.dumps({'mtime_ns': mtime, 'units': units}))
+        except OSError:
+            pass
+
+    def rebuild(self):
+        """
+        unitdirのユニットファイル名から対応表を作り直して返す
+        """
+        mtime = self._mtime()
+        units = {}
+        with os.scandir(self.unitdir) as entries:
+            for entry in entries:
+                unit, _, suffix = entry.name.rpartition('.')
+                if suffix == 'timer' and unit.startswith(self.prefix + '.'):
+                    rj_id_long = hashlib.sha256(
+                        unit.encode('utf-8')).hexdigest()
+                    units[rj_id_long] = unit
+        self._save(mtime, units)
+        return units
+
+    def units(self):
+        """
+        {rj_id_long: ユニット名}の対応表を返す
+        unitdirが変更されていれば作り直す
+        unitdirを読めない場合はOSErrorを送出する
+        """
+        mtime, units = self._load()
+        if units is None or mtime != self._mtime():
+            units = self.rebuild()
+        return units
+
+    def lookup(self, jids):
+        """
+        ジョブIDのリストに対応するユニット名のリストを返す
+        8文字のジョブIDはrj_id、それ以外はrj_id_longとして扱う
+        """
+        units = self.units()
+        found = []
+        for jid in jids:
+            if len(jid) == 8:
+                found.extend(
+                    v for k, v in units.items() if k[0:8] == jid)
+            elif jid in units:
+                found.append(units[jid])
+        return found
+
+    def mtime(self):
+        """
+        unitdirの最終更新時刻(ns)を返す
+        取得できない場合はNoneを返す
+        """
+        try:
+            return self._mtime()
+        except OSError:
+            return None
+
+    def add(self, before, added):
+        """
+        追加したユニットを対応表に反映する
+
+        before: ユニットファイル作成前のunitdirの最終更新時刻 (int)
+        added:  {rj_id_long: ユニット名} (dict)
+
+        対応表がユニットファイル作成前のunitdirと一致している場合のみ
+        更新する。一致しない場合は次回のunits()で作り直す。
+        """
+        mtime, units = self._load()
+        if units is None or before is None or mtime != before:
+            return
+        units.update(added)
+        after = self.mtime()
+        if after is not None:
+            self._save(after, units)
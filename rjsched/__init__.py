@@ -1,6 +1,11 @@
-from subprocess import run, PIPE, CalledProcessError, TimeoutExpired
-import yaml
+from subprocess import (
+    run, CompletedProcess, PIPE, CalledProcessError, TimeoutExpired)
+from rjsched import Log, Metrics
+from rjsched.Timings import timings
+import asyncio
+import os
 import syslog
+import time
 
 class RecordJob:
     def __init__(self, config):
@@ -11,6 +16,8 @@ class RecordJob:
         self.recpt1 = [recpt1_path, '--b25', '--strip']
         self.recpt1ctl = [recpt1ctl_path]
         self.comm_timeout = 10
+        # _run_command()で実行するコマンドに追加する環境変数 (dict)
+        self.env = None
         self.job_state = {
             'C': "Completed",
             'E': "Exiting",
@@ -25,6 +32,7 @@ class RecordJob:
             'satellite': 'bs',
             'terrestrial': 'tt',
         }
+        Log.setup(config)
 
     def _is_bs(self, ch):
         if int(ch) > 63:
@@ -33,11 +41,20 @@ class RecordJob:
             return False
 
     def _logger(self, priority, message):
-        ident = 'recordjob'
-        syslog.openlog(
-            ident=ident, logoption=syslog.LOG_PID, facility=syslog.LOG_LOCAL7)
-        syslog.syslog(priority, message)
-        syslog.closelog()
+        """
+        ログを出力する
+        出力先はrjsched.Logでプロセスごとに一度だけ開く
+        """
+        Log.log(priority, message)
+
+    def _command_env(self):
+        """
+        self.envを追加した環境変数を返す
+        self.envがない場合は親プロセスの環境変数をそのまま使うためNoneを返す
+        """
+        if not self.env:
+            return None
+        return dict(os.environ, **self.env)
 
     def _run_command(self, command, _input=None, log=True):
         """
@@ -45,6 +62,7 @@ class RecordJob:
         """
         if log:
             self._logger(syslog.LOG_INFO, ' '.join(command))
+        begin = time.perf_counter()
         try:
             proc = run(
                 command,
@@ -53,25 +71,81 @@ class RecordJob:
                 stderr=PIPE,
                 universal_newlines=True,
                 timeout=self.comm_timeout,
+                env=self._command_env(),
                 check=True,)
         except (OSError, TimeoutExpired, CalledProcessError) as err:
             self._logger(syslog.LOG_ERR, str(err))
             raise
+        finally:
+            elapsed = time.perf_counter() - begin
+            timings.command(command, elapsed)
+            Metrics.latency.observe(command, elapsed)
         return proc
 
+    async def _run_command_async(self, command, _input=None, log=True):
+        """
+        _run_command()の非同期版
+        コマンドを実行し、CompletedProcessオブジェクトを返す
+        タイムアウト、エラー時の例外とsyslogへの出力は_run_command()と同じ
+        """
+        if log:
+            self._logger(syslog.LOG_INFO, ' '.join(command))
+        begin = time.perf_counter()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=PIPE if _input is not None else None,
+                stdout=PIPE,
+                stderr=PIPE,
+                env=self._command_env(),)
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    proc.communicate(
+                        _input.encode() if _input is not None else None),
+                    timeout=self.comm_timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise TimeoutExpired(command, self.comm_timeout)
+            stdout = stdout.decode()
+            stderr = stderr.decode()
+            if proc.returncode:
+                raise CalledProcessError(
+                    proc.returncode, command, stdout, stderr)
+        except (OSError, TimeoutExpired, CalledProcessError) as err:
+            self._logger(syslog.LOG_ERR, str(err))
+            raise
+        finally:
+            elapsed = time.perf_counter() - begin
+            timings.command(command, elapsed)
+            Metrics.latency.observe(command, elapsed)
+        return CompletedProcess(command, proc.returncode, stdout, stderr)
+
     def get_channel_list(self):
         """
         チャンネル番号と局名の対応表をYAMLファイルから取得して返す
         """
-        try:
-            with open(self.channel_file) as f:
-                chinfo = yaml.safe_load(f)
-        except (PermissionError, FileNotFoundError, yaml.YAMLError) as err:
-            print('channel information cannot load: {}'.format(err))
-            return {}
+        with timings.phase('load channel list'):
+            import yaml
+            try:
+                with open(self.channel_file) as f:
+                    chinfo = yaml.safe_load(f)
+            except (PermissionError, FileNotFoundError, yaml.YAMLError) as err:
+                print('channel information cannot load: {}'.format(err))
+                return {}
 
         return {str(i): str(j) for i, j in chinfo.items()}
 
+    def get_metrics(self):
+        """
+        ジョブ情報とチューナー数からメトリクスを作成し、
+        Prometheusのテキスト形式で返す
+        """
+        joblist = self.get_job_list()
+        timeline = getattr(self, 'timeline', None)
+        capacity = timeline.capacity if timeline else {}
+        return Metrics.render(joblist, capacity)
+
     def change_repeat(self, job, repeat):
         """
         リピート設定変更用クラスメソッド
@@ -4,3 +4,18 @@ _opt="-v"
 python3 -m unittest ${_opt} tests/test_openpbs.py
 python3 -m unittest ${_opt} tests/test_cliutil.py
 python3 -m unittest ${_opt} tests/test_init.py
+python3 -m unittest ${_opt} tests/test_jobcache.py
+python3 -m unittest ${_opt} tests/test_tunertimeline.py
+python3 -m unittest ${_opt} tests/test_tunerplacement.py
+python3 -m unittest ${_opt} tests/test_daemon.py
+python3 -m unittest ${_opt} tests/test_job.py
+python3 -m unittest ${_opt} tests/test_timeparser.py
+python3 -m unittest ${_opt} tests/test_timings.py
+python3 -m unittest ${_opt} tests/test_metrics.py
+python3 -m unittest ${_opt} tests/test_log.py
+python3 -m unittest ${_opt} tests/test_systemd.py
+python3 -m unittest ${_opt} tests/test_unitindex.py
+python3 -m unittest ${_opt} tests/test_atomicfile.py
+python3 -m unittest ${_opt} tests/test_openpbs_cluster.py
+python3 -m unittest ${_opt} tests/test_torque.py
+python3 -m unittest ${_opt} tests/test_tsverify.py
@@ -0,0 +1,47 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import os
+from rjsched.AtomicFile import write_atomic
+
+class AtomicFileTest(TestCase):
+    def setUp(self):
+        super(AtomicFileTest, self).setUp()
+        self.tmpdir = TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'rj.prom')
+
+    def tearDown(self):
+        super(AtomicFileTest, self).tearDown()
+        self.tmpdir.cleanup()
+
+    def test_write(self):
+        #
+        # strはテキスト、bytesはバイナリで書き込み、
+        # 一時ファイルが残らないことを確認
+        #
+        write_atomic(self.path, 'text\n', mode=0o644)
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'text\n')
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+        write_atomic(self.path, b'\x00\x01')
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'\x00\x01')
+        self.assertEqual(os.listdir(self.tmpdir.name), ['rj.prom'])
+
+    def test_error(self):
+        #
+        # 置き換えに失敗した場合は元のファイルを残し、
+        # 一時ファイルを削除してOSErrorを送出することを確認
+        #
+        write_atomic(self.path, 'old\n')
+        with patch('os.replace', side_effect=OSError('failed')):
+            with self.assertRaises(OSError):
+                write_atomic(self.path, 'new\n')
+        with open(self.path) as f:
+            self.assertEqual(f.read(), 'old\n')
+        self.assertEqual(os.listdir(self.tmpdir.name), ['rj.prom'])
+
+        # 書き込み先のディレクトリがない
+        with self.assertRaises(OSError):
+            write_atomic(os.path.join(self.tmpdir.name, 'none', 'x'), 'x')
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 from unittest import TestCase
 from unittest.mock import mock_open, patch, MagicMock, DEFAULT
 from freezegun import freeze_time
+import json
 import cliutil
 
 class CliUtilTest(TestCase):
@@ -672,3 +673,200 @@ class CliUtilTest(TestCase):
         timestr = '01:01:01:01-'
         result = cliutil.parse_time_delta(timestr)
         self.assertIsNone(result)
+
+    # 現在時刻を2020年09月01日(火) 12時00分00秒に固定
+    @freeze_time('2020-09-01 12:00:00')
+    def test_parse_schedule(self):
+        #
+        # schedule.txt形式の行から録画予約とエラーのリストを生成する
+        #
+        lines = [
+            '## Tue\n',
+            '\n',
+            '15     yurukyan       Tue  22:30\n',
+            '211    yamanosusume   Mon  26:30  00:15:00\n',
+            '15     morning        Tue  07:30\n',
+            'x      bad_ch         Tue  22:00\n',
+            '15     bad_date       Xyz  22:00\n',
+            '15     bad_rectime    Tue  22:00  abc\n',
+            '15     too_few\n',
+            '15     past           2020/08/31  22:00\n',
+        ]
+        expect_jobs = [
+            {
+                'lineno': 3,
+                'ch': '15',
+                'name': 'yurukyan',
+                'begin': datetime(2020, 9, 1, 22, 29, 30),
+                'rectime': timedelta(seconds=1770)},
+            {
+                'lineno': 4,
+                'ch': '211',
+                'name': 'yamanosusume',
+                'begin': datetime(2020, 9, 8, 2, 29, 30),
+                'rectime': timedelta(seconds=900)},
+            {
+                # 今週分は放送済みなので翌週
+                'lineno': 5,
+                'ch': '15',
+                'name': 'morning',
+                'begin': datetime(2020, 9, 8, 7, 29, 30),
+                'rectime': timedelta(seconds=1770)},
+        ]
+        expect_errors = [
+            (6, 'invalid Channel: x'),
+            (7, 'Invalid date, time: Xyz 22:00'),
+            (8, 'Invalid recording time: abc'),
+            (9, 'invalid format: 15     too_few'),
+            (10, 'Start in the past.'),
+        ]
+
+        jobs, errors = cliutil.parse_schedule(
+            lines, warmup_sec=30, day_change_hour=5, default_rectime=1770)
+        self.assertEqual(jobs, expect_jobs)
+        self.assertEqual(errors, expect_errors)
+
+    def test_format_records(self):
+        #
+        # ジョブ情報をjson, ndjson, tsvで出力する
+        #
+        joblist = [
+            {
+                'rj_id': '68',
+                'rj_title': 'news\twith tab',
+                'channel': '15',
+                'station_name': 'MX',
+                'rec_begin': datetime(2020, 9, 1, 23, 59, 30),
+                'rec_end': datetime(2020, 9, 2, 0, 29, 0),
+                'walltime': timedelta(seconds=1770),
+                'elapse': timedelta(seconds=90, microseconds=500),
+                'record_state': 'Recording',
+                'alert': '',
+                'tuner': 'tt',
+                'user': 'autumn',
+                'group': 'autumn',
+                'exec_host': 'node1/0',
+                'Execution_Time': 'Tue Sep  1 23:59:30 2020'},
+            {
+                'rj_id': '69',
+                'rj_title': '深夜アニメ',
+                'rec_begin': datetime(2020, 9, 2, 1, 0, 0),
+                'walltime': timedelta(seconds=1800)},
+        ]
+        record = {
+            'rj_id': '68',
+            'rj_title': 'news\twith tab',
+            'channel': '15',
+            'station_name': 'MX',
+            'rec_begin': '2020-09-01T23:59:30',
+            'rec_end': '2020-09-02T00:29:00',
+            'walltime': 1770,
+            'elapse': 90,
+            'record_state': 'Recording',
+            'alert': None,
+            'tuner': 'tt',
+            'user': 'autumn',
+            'group': 'autumn',
+            'exec_host': 'node1/0'}
+        self.assertEqual(cliutil.job_record(joblist[0]), record)
+
+        lines = list(cliutil.format_records(joblist, 'ndjson'))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(json.loads(lines[0]), record)
+        self.assertIn('"rj_title": "深夜アニメ"', lines[1])
+
+        self.assertEqual(
+            json.loads(''.join(cliutil.format_records(joblist, 'json'))),
+            [json.loads(i) for i in lines])
+        self.assertEqual(
+            json.loads(''.join(cliutil.format_records([], 'json'))), [])
+
+        lines = list(cliutil.format_records(joblist, 'tsv'))
+        self.assertEqual(lines[0].split('\t'), list(cliutil.RECORD_FIELDS))
+        self.assertEqual(lines[1].split('\t')[0:2], ['68', 'news with tab'])
+        self.assertEqual(lines[2].split('\t'), [
+            '69', '深夜アニメ', '', '', '2020-09-02T01:00:00', '', '1800',
+            '', '', '', '', '', '', ''])
+
+        with self.assertRaises(ValueError):
+            list(cliutil.format_records(joblist, 'xml'))
+
+    def test_dateline_formatter(self):
+        #
+        # datelineより前の時刻は前日の24時以降として扱う
+        #
+        formatter = cliutil.DatelineFormatter(5)
+        fields = formatter.fields(datetime(2020, 9, 1, 2, 30, 15))
+        self.assertEqual(fields, cliutil.Dateline(
+            datetime(2020, 8, 31).date(), 'Mon', '2020', '08', '31', '26',
+            '30', '15'))
+        self.assertEqual(
+            formatter.format_fields(fields), 'Mon 08/31 26:30')
+        self.assertEqual(
+            formatter.format(datetime(2020, 9, 1, 2, 30, 15), True, True),
+            'Mon 2020/08/31 26:30:15')
+        self.assertEqual(
+            formatter.format(datetime(2020, 9, 1, 5, 0, 0), sec=True),
+            'Tue 09/01 05:00:00')
+        # 年をまたぐ場合
+        self.assertEqual(
+            formatter.format(datetime(2021, 1, 1, 4, 59, 59), True, True),
+            'Thu 2020/12/31 28:59:59')
+
+        # 曜日と年月日は日付ごとに一度だけ作成する
+        self.assertEqual(len(formatter.days), 3)
+        formatter.fields(datetime(2020, 9, 1, 23, 0, 0))
+        self.assertEqual(len(formatter.days), 3)
+
+        # datelineが0の場合は日付を変えない
+        self.assertEqual(
+            cliutil.DatelineFormatter().format(
+                datetime(2020, 9, 1, 0, 0, 0), True, True),
+            'Tue 2020/09/01 00:00:00')
+
+    def test_diff_joblist(self):
+        #
+        # rj_idでジョブを対応付け、増減と状態の変化を返す
+        #
+        prev = [
+            {'rj_id': '1', 'record_state': 'Recording',
+                'elapse': timedelta(seconds=10), 'alert': ''},
+            {'rj_id': '2', 'record_state': 'Waiting', 'alert': ''},
+            {'rj_id': '3', 'record_state': 'Waiting', 'alert': ''},
+            {'rj_id': '4', 'record_state': 'Waiting', 'alert': ''},
+        ]
+        curr = [
+            {'rj_id': '1', 'record_state': 'Recording',
+                'elapse': timedelta(seconds=12), 'alert': ''},
+            {'rj_id': '2', 'record_state': 'Waiting', 'alert': ''},
+            {'rj_id': '4', 'record_state': 'Waiting',
+                'alert': 'Tuner Shortage'},
+            {'rj_id': '5', 'record_state': 'Waiting', 'alert': ''},
+        ]
+        self.assertEqual(
+            cliutil.diff_joblist(prev, curr), (['5'], ['3'], ['1', '4']))
+        self.assertEqual(cliutil.diff_joblist(curr, curr), ([], [], []))
+
+    def test_watch_interval(self):
+        #
+        # 開始、終了時刻が近いジョブがあれば短い間隔で取得する
+        #
+        now = datetime(2020, 9, 1, 20, 0, 0)
+        job = {
+            'rec_begin': now + timedelta(minutes=10),
+            'rec_end': now + timedelta(minutes=40)}
+        self.assertEqual(cliutil.watch_interval([], now), 30)
+        self.assertEqual(cliutil.watch_interval([job], now), 30)
+        # 開始60秒前まで待つ
+        job['rec_begin'] = now + timedelta(seconds=75)
+        self.assertEqual(cliutil.watch_interval([job], now), 15)
+        # 開始時刻の前後60秒以内
+        job['rec_begin'] = now + timedelta(seconds=30)
+        self.assertEqual(cliutil.watch_interval([job], now), 2)
+        job['rec_begin'] = now - timedelta(seconds=30)
+        self.assertEqual(cliutil.watch_interval([job], now), 2)
+        # 録画中は終了時刻の前後
+        job['rec_begin'] = now - timedelta(minutes=10)
+        job['rec_end'] = now + timedelta(seconds=20)
+        self.assertEqual(
+            cliutil.watch_interval([job], now, fast=1, slow=10), 1)
@@ -0,0 +1,90 @@
+from subprocess import CalledProcessError
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import MagicMock
+import os
+import threading
+from rjsched.RecordJobDaemon import RecordJobDaemon, RecordJobClient
+
+class RecordJobDaemonTest(TestCase):
+    def setUp(self):
+        super(RecordJobDaemonTest, self).setUp()
+        self.tmpdir = TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, 'rjd.sock')
+        self.config = {'scheduler': 'openpbs', 'day_change_hour': 5}
+        self.rec = MagicMock()
+        self.rec.get_job_list.return_value = [{'rj_id': '1'}, {'rj_id': '2'}]
+        self.rec.get_channel_list.return_value = {'15': 'MX'}
+        self.rec.timeline.capacity = {'tt': 2, 'bs': 2}
+
+        self.rjd = RecordJobDaemon(
+            self.rec, self.config, self.socket_path, interval=3600)
+        self.rjd.start()
+        self.thread = threading.Thread(target=self.rjd.serve_forever)
+        self.thread.start()
+        self.client = RecordJobClient(self.socket_path)
+
+    def tearDown(self):
+        super(RecordJobDaemonTest, self).tearDown()
+        self.rjd.shutdown()
+        self.thread.join()
+        self.tmpdir.cleanup()
+
+    def test_socket_permission(self):
+        #
+        # ソケットは実行ユーザーのみ読み書きできる
+        #
+        mode = os.stat(self.socket_path).st_mode & 0o777
+        self.assertEqual(mode, 0o600)
+
+    def test_read(self):
+        #
+        # 参照系のリクエストはバックエンドを呼ばずに応答する
+        #
+        self.rec.get_job_list.reset_mock()
+
+        self.assertEqual(self.client.get_config(), self.config)
+        self.assertEqual(
+            self.client.get_job_list(), [{'rj_id': '1'}, {'rj_id': '2'}])
+        self.assertEqual(self.client.get_job_list('2'), [{'rj_id': '2'}])
+        # ジョブIDは完全一致で探す
+        self.assertEqual(self.client.get_job_list('12'), [])
+        self.assertEqual(self.client.get_channel_list(), {'15': 'MX'})
+        self.rec.get_job_list.assert_not_called()
+
+    def test_metrics(self):
+        #
+        # メトリクスはメモリ上のジョブ情報リストから作成し、
+        # metrics_dirが指定されていれば更新ごとに書き込む
+        #
+        text = self.client.get_metrics()
+        self.assertIn('rj_tuners_available{tuner="tt"} 2', text.splitlines())
+
+        self.rjd.metrics_dir = self.tmpdir.name
+        self.rjd.refresh()
+        with open(os.path.join(self.tmpdir.name, 'rj.prom')) as f:
+            self.assertIn('rj_conflict_jobs 0', f.read().splitlines())
+
+    def test_write(self):
+        #
+        # 変更系のリクエストはバックエンドで実行し、
+        # 実行後にジョブ情報リストを更新する
+        #
+        self.rec.remove.return_value = ([{'rj_id': '1'}], {'1': ''})
+        self.rec.get_job_list.return_value = [{'rj_id': '2'}]
+
+        result = self.client.remove(['1'])
+        self.assertEqual(result, ([{'rj_id': '1'}], {'1': ''}))
+        self.rec.remove.assert_called_once_with(['1'])
+        self.assertEqual(self.client.get_job_list(), [{'rj_id': '2'}])
+
+    def test_error(self):
+        #
+        # バックエンドで発生した例外はクライアントで再送出される
+        #
+        self.rec.change_name.side_effect = CalledProcessError(1, 'qalter')
+        with self.assertRaises(CalledProcessError):
+            self.client.change_name([{'rj_id': '1'}], 'name')
+
+        with self.assertRaises(AttributeError):
+            self.client.no_such_method()
@@ -1,7 +1,10 @@
+from subprocess import CalledProcessError, TimeoutExpired
 from textwrap import dedent
 from unittest import TestCase
 from unittest.mock import mock_open, patch, MagicMock
+import asyncio
 import rjsched
+import syslog
 
 class RecordJobTest(TestCase):
     def setUp(self):
@@ -31,3 +34,54 @@ class RecordJobTest(TestCase):
         with patch('rjsched.open', mopen):
             result = self.rec.get_channel_list()
             self.assertEqual(result, expected)
+
+    def test_run_command_env(self):
+        #
+        # self.envの環境変数を追加してコマンドを実行する
+        #
+        command = ['sh', '-c', 'echo "$PBS_SERVER:${PATH:+path}"']
+        self.rec.env = {'PBS_SERVER': 'pbs2'}
+        proc = self.rec._run_command(command, log=False)
+        self.assertEqual(proc.stdout, 'pbs2:path\n')
+        proc = asyncio.run(self.rec._run_command_async(command, log=False))
+        self.assertEqual(proc.stdout, 'pbs2:path\n')
+
+    def test_run_command_async(self):
+        #
+        # 標準入力を渡し、標準出力を受け取る
+        #
+        with patch.object(self.rec, '_logger') as logger:
+            proc = asyncio.run(
+                self.rec._run_command_async(['cat'], _input='foo'))
+            self.assertEqual(proc.returncode, 0)
+            self.assertEqual(proc.stdout, 'foo')
+            logger.assert_called_once_with(syslog.LOG_INFO, 'cat')
+
+        #
+        # log=Falseの場合はコマンドをsyslogに出力しない
+        #
+        with patch.object(self.rec, '_logger') as logger:
+            proc = asyncio.run(
+                self.rec._run_command_async(['echo', 'bar'], log=False))
+            self.assertEqual(proc.stdout, 'bar\n')
+            logger.assert_not_called()
+
+    def test_run_command_async_error(self):
+        #
+        # 終了コードが0以外の場合はCalledProcessError
+        #
+        with patch.object(self.rec, '_logger') as logger:
+            with self.assertRaises(CalledProcessError) as cm:
+                asyncio.run(self.rec._run_command_async(['false'], log=False))
+            self.assertEqual(cm.exception.returncode, 1)
+            logger.assert_called_once()
+            self.assertEqual(logger.call_args[0][0], syslog.LOG_ERR)
+
+        #
+        # タイムアウトした場合はTimeoutExpired
+        #
+        self.rec.comm_timeout = 0.1
+        with patch.object(self.rec, '_logger'):
+            with self.assertRaises(TimeoutExpired):
+                asyncio.run(
+                    self.rec._run_command_async(['sleep', '5'], log=False))
@@ -0,0 +1,63 @@
+from copy import deepcopy
+from datetime import datetime, timedelta
+from unittest import TestCase
+import pickle
+from rjsched.Job import Job
+
+class JobTest(TestCase):
+    def setUp(self):
+        super(JobTest, self).setUp()
+        self.data = {
+            'rj_id': '68',
+            'rj_title': 'test',
+            'channel': '15',
+            'rec_begin': datetime(2020, 8, 16, 20, 0, 0),
+            'walltime': timedelta(seconds=1770),
+            'alert': '',
+            'repeat': 'WEEKLY'}
+
+    def test_mapping(self):
+        #
+        # dictと同様に参照できる
+        #
+        job = Job(self.data)
+        self.assertEqual(job['rj_id'], '68')
+        self.assertEqual(job.get('repeat'), 'WEEKLY')
+        self.assertIsNone(job.get('exec_host'))
+        self.assertEqual(job.get('exec_host', 'dummy'), 'dummy')
+        self.assertIn('alert', job)
+        self.assertNotIn('exec_host', job)
+        self.assertEqual(len(job), len(self.data))
+        self.assertEqual(set(job.keys()), set(self.data.keys()))
+        with self.assertRaises(KeyError):
+            job['exec_host']
+
+        # dictとの比較
+        self.assertEqual(job, self.data)
+        self.assertEqual([job], [self.data])
+        self.assertEqual(job.to_dict(), self.data)
+
+    def test_immutable(self):
+        #
+        # 値の変更はできず、replace()で新しいレコードを作成する
+        #
+        job = Job(self.data)
+        with self.assertRaises(TypeError):
+            job['alert'] = 'foo'
+        with self.assertRaises(AttributeError):
+            job.alert = 'foo'
+
+        changed = job.replace(alert='foo', station_name='MX')
+        self.assertEqual(job['alert'], '')
+        self.assertEqual(changed['alert'], 'foo')
+        self.assertEqual(changed['station_name'], 'MX')
+        self.assertEqual(changed['repeat'], 'WEEKLY')
+
+    def test_pickle(self):
+        #
+        # キャッシュ、rjdとの通信のためpickle、deepcopyできる
+        #
+        job = Job(self.data)
+        self.assertEqual(pickle.loads(pickle.dumps(job)), job)
+        self.assertIsInstance(pickle.loads(pickle.dumps(job)), Job)
+        self.assertEqual(deepcopy(job), job)
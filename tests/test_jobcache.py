@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+from freezegun import freeze_time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import os
+from rjsched.JobCache import JobCache
+
+class JobCacheTest(TestCase):
+    def setUp(self):
+        super(JobCacheTest, self).setUp()
+        self.tmpdir = TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'joblist.cache')
+        self.snapshot = {
+            'joblist': [{
+                'rj_id': '68',
+                'rec_begin': datetime(2020, 8, 16, 20, 0, 0),
+                'walltime': timedelta(seconds=1770)}],
+            'tuners': {'tt': 2, 'bs': 2}}
+
+    def tearDown(self):
+        super(JobCacheTest, self).tearDown()
+        self.tmpdir.cleanup()
+
+    def test_disabled(self):
+        #
+        # ttlが0の場合はファイルを作成せず、常にNoneを返す
+        #
+        cache = JobCache(self.path, 0)
+        cache.save(self.snapshot)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNone(cache.load())
+        self.assertIsNone(cache.load(stale=True))
+
+    def test_save_load(self):
+        #
+        # 保存したスナップショットがttl以内であれば読み込める
+        #
+        cache = JobCache(self.path, 60)
+        self.assertIsNone(cache.load())
+
+        cache.save(self.snapshot)
+        self.assertEqual(cache.load(), self.snapshot)
+
+    def test_expired(self):
+        #
+        # ttlを超過したスナップショットはstale=Trueの場合のみ読み込める
+        #
+        cache = JobCache(self.path, 60)
+        cache.save(self.snapshot)
+        old = os.stat(self.path).st_mtime - 61
+        os.utime(self.path, (old, old))
+
+        self.assertIsNone(cache.load())
+        self.assertEqual(cache.load(stale=True), self.snapshot)
+
+    def test_invalidate(self):
+        #
+        # 無効化したスナップショットはstale=Trueの場合のみ読み込める
+        #
+        cache = JobCache(self.path, 60)
+        cache.save(self.snapshot)
+        cache.invalidate()
+
+        self.assertIsNone(cache.load())
+        self.assertEqual(cache.load(stale=True), self.snapshot)
+
+    def test_broken(self):
+        #
+        # 壊れたキャッシュファイルはNoneとして扱う
+        #
+        cache = JobCache(self.path, 60)
+        with open(self.path, 'wb') as f:
+            f.write(b'broken')
+
+        self.assertIsNone(cache.load())
+
+    def test_stale_max(self):
+        #
+        # 取得からstale_max秒を超えたスナップショットは
+        # stale=Trueでも読み込まないことを確認
+        #
+        cache = JobCache(self.path, 60, stale_max=600)
+        with freeze_time('2020-08-16 20:00:00'):
+            cache.save(self.snapshot)
+            cache.invalidate()
+        with freeze_time('2020-08-16 20:10:00'):
+            self.assertEqual(cache.load(stale=True), self.snapshot)
+        with freeze_time('2020-08-16 20:10:01'):
+            self.assertIsNone(cache.load(stale=True))
+
+    def test_update(self):
+        #
+        # 書き戻したスナップショットは無効化され、
+        # 取得した時刻は元のままであることを確認
+        #
+        cache = JobCache(self.path, 60, stale_max=600)
+        updated = dict(self.snapshot, joblist=[])
+        with freeze_time('2020-08-16 20:00:00'):
+            cache.save(self.snapshot)
+        with freeze_time('2020-08-16 20:09:00'):
+            cache.load(stale=True)
+            cache.update(updated)
+            self.assertIsNone(cache.load())
+            self.assertEqual(cache.load(stale=True), updated)
+        with freeze_time('2020-08-16 20:10:01'):
+            self.assertIsNone(cache.load(stale=True))
+
+        # 読み込んでいないスナップショットは書き戻さない
+        cache = JobCache(os.path.join(self.tmpdir.name, 'other.cache'), 60)
+        cache.update(updated)
+        self.assertFalse(os.path.exists(cache.path))
@@ -0,0 +1,91 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import json
+import os
+import syslog
+import rjsched
+from rjsched import Log
+
+class LogTest(TestCase):
+    def setUp(self):
+        super(LogTest, self).setUp()
+        Log.shutdown()
+        self.tmpdir = TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'rj.log')
+
+    def tearDown(self):
+        super(LogTest, self).tearDown()
+        Log.shutdown()
+        self.tmpdir.cleanup()
+
+    def test_syslog(self):
+        #
+        # syslogはプロセスで一度だけopenlogし、プライオリティを引き継ぐ
+        #
+        with patch('rjsched.Log.syslog.openlog') as openlog, \
+                patch('rjsched.Log.syslog.syslog') as _syslog, \
+                patch('rjsched.Log.syslog.closelog') as closelog:
+            rec = rjsched.RecordJob({})
+            rec._logger(syslog.LOG_INFO, 'qsub -')
+            rec._logger(syslog.LOG_ERR, 'error')
+            Log.shutdown()
+
+            openlog.assert_called_once_with(
+                ident='recordjob', logoption=syslog.LOG_PID,
+                facility=syslog.LOG_LOCAL7)
+            self.assertEqual(
+                [i[0] for i in _syslog.call_args_list],
+                [(syslog.LOG_INFO, 'qsub -'), (syslog.LOG_ERR, 'error')])
+            closelog.assert_called_once_with()
+
+    def test_file(self):
+        #
+        # fileはテキスト形式で追記する
+        #
+        Log.setup({'log_sink': 'file', 'log_file': self.path})
+        Log.log(syslog.LOG_INFO, 'qstat -f')
+        Log.log(syslog.LOG_ERR, 'error')
+        Log.shutdown()
+
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('recordjob[{}]: INFO qstat -f'.format(os.getpid()), lines[0])
+        self.assertIn('ERROR error', lines[1])
+
+    def test_jsonl(self):
+        #
+        # jsonlは1行1レコードのJSONで追記する
+        #
+        Log.setup({'log_sink': 'jsonl', 'log_file': self.path})
+        Log.log(syslog.LOG_WARNING, '録画')
+        Log.shutdown()
+
+        with open(self.path) as f:
+            record = json.loads(f.readline())
+        self.assertEqual(record['ident'], 'recordjob')
+        self.assertEqual(record['pid'], os.getpid())
+        self.assertEqual(record['level'], 'warning')
+        self.assertEqual(record['message'], '録画')
+
+    def test_setup_once(self):
+        #
+        # 二度目以降のsetup()は無視される
+        #
+        Log.setup({'log_sink': 'file', 'log_file': self.path})
+        Log.setup({'log_sink': 'jsonl', 'log_file': self.path})
+        Log.log(syslog.LOG_INFO, 'foo')
+        Log.shutdown()
+
+        with open(self.path) as f:
+            self.assertIn('INFO foo', f.read())
+
+    def test_invalid_sink(self):
+        #
+        # 不正な設定の場合はValueError
+        #
+        with self.assertRaises(ValueError):
+            Log.create_handler({'log_sink': 'foo'})
+        with self.assertRaises(ValueError):
+            Log.create_handler({'log_facility': 'foo'})
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import os
+import stat
+from rjsched import Metrics
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        self.now = datetime(2020, 8, 16, 20, 10, 0)
+        begin = datetime(2020, 8, 16, 20, 0, 0)
+        walltime = timedelta(minutes=30)
+
+        def job(rj_id, begin, tuner, state='Waiting', alert=''):
+            return {
+                'rj_id': rj_id,
+                'rec_begin': begin,
+                'rec_end': begin + walltime,
+                'tuner': tuner,
+                'record_state': state,
+                'alert': alert}
+
+        self.joblist = [
+            job('1', begin, 'tt', 'Recording'),
+            job('2', begin + timedelta(hours=1), 'tt'),
+            job('3', begin + timedelta(hours=1), 'tt'),
+            job('4', begin + timedelta(hours=1), 'tt', alert='Out of Tuners'),
+            job('5', begin + timedelta(hours=2), 'bs'),
+            job('6', begin, 'not_rec_job', 'Queued')]
+        self.capacity = {'tt': 2, 'bs': 2}
+
+    def test_command_latency(self):
+        #
+        # バケットごとの累積件数、合計時間、件数を返す
+        #
+        latency = Metrics.CommandLatency(buckets=(0.1, 1.0))
+        latency.observe(['/opt/pbs/bin/qstat', '-f'], 0.05)
+        latency.observe(['/opt/pbs/bin/qstat', '-f'], 0.5)
+        latency.observe(['/opt/pbs/bin/qstat'], 3.0)
+        latency.observe(['/opt/pbs/bin/qsub'], 0.1)
+
+        samples = latency.samples()
+        self.assertEqual(samples['qstat'][0], [1, 2])
+        self.assertAlmostEqual(samples['qstat'][1], 3.55)
+        self.assertEqual(samples['qstat'][2], 3)
+        self.assertEqual(samples['qsub'][0], [1, 1])
+
+    def test_command_latency_persist(self):
+        #
+        # 保存したヒストグラムを別のインスタンスで読み込んで累積する
+        #
+        with TemporaryDirectory() as tmpdir:
+            path = Metrics.latency_file(tmpdir)
+            self.assertEqual(path, os.path.join(tmpdir, 'rj.latency.json'))
+
+            latency = Metrics.CommandLatency(buckets=(0.1, 1.0))
+            # 保存したファイルがなければ何もしない
+            latency.load(path)
+            latency.observe(['/opt/pbs/bin/qstat'], 0.05)
+            latency.save(path)
+
+            latency = Metrics.CommandLatency(buckets=(0.1, 1.0))
+            latency.observe(['/opt/pbs/bin/qstat'], 0.5)
+            latency.load(path)
+            samples = latency.samples()
+            self.assertEqual(samples['qstat'][0], [1, 2])
+            self.assertAlmostEqual(samples['qstat'][1], 0.55)
+            self.assertEqual(samples['qstat'][2], 2)
+
+            # bucketsが異なる場合は読み込まない
+            latency = Metrics.CommandLatency(buckets=(0.1, 1.0, 10.0))
+            latency.load(path)
+            self.assertEqual(latency.samples(), {})
+
+            with open(path, 'w') as f:
+                f.write('broken')
+            latency = Metrics.CommandLatency(buckets=(0.1, 1.0))
+            latency.load(path)
+            self.assertEqual(latency.samples(), {})
+
+    def test_render(self):
+        #
+        # ジョブ数、チューナー使用数、警告数、所要時間のヒストグラムを出力する
+        #
+        latency = Metrics.CommandLatency(buckets=(0.1, 1.0))
+        latency.observe(['/opt/pbs/bin/qstat'], 0.5)
+
+        text = Metrics.render(
+            self.joblist, self.capacity, self.now, latency)
+        lines = text.splitlines()
+
+        self.assertIn('rj_jobs{state="Waiting"} 4', lines)
+        self.assertIn('rj_jobs{state="Recording"} 1', lines)
+        self.assertIn('rj_jobs{state="Queued"} 1', lines)
+        self.assertIn('rj_jobs{state="Suspend"} 0', lines)
+        self.assertIn('rj_tuners_available{tuner="tt"} 2', lines)
+        self.assertIn('rj_tuners_booked{tuner="tt"} 1', lines)
+        self.assertIn('rj_tuners_booked{tuner="bs"} 0', lines)
+        self.assertIn('rj_tuners_booked_peak{tuner="tt"} 3', lines)
+        self.assertIn('rj_tuners_booked_peak{tuner="bs"} 1', lines)
+        peak = Metrics._timestamp(datetime(2020, 8, 16, 21, 0, 0))
+        self.assertIn(
+            'rj_tuners_booked_peak_timestamp_seconds{{tuner="tt"}} {}'.format(
+                float(peak)), lines)
+        self.assertIn('rj_conflict_jobs 1', lines)
+        self.assertIn(
+            'rj_command_duration_seconds_bucket'
+            '{command="qstat",le="0.1"} 0', lines)
+        self.assertIn(
+            'rj_command_duration_seconds_bucket'
+            '{command="qstat",le="1.0"} 1', lines)
+        self.assertIn(
+            'rj_command_duration_seconds_bucket'
+            '{command="qstat",le="+Inf"} 1', lines)
+        self.assertIn(
+            'rj_command_duration_seconds_count{command="qstat"} 1', lines)
+        self.assertIn('# TYPE rj_command_duration_seconds histogram', lines)
+        self.assertTrue(text.endswith('\n'))
+
+    def test_write_textfile(self):
+        #
+        # ディレクトリにrj.promを作成し、一時ファイルは残さない
+        #
+        with TemporaryDirectory() as tmpdir:
+            path = Metrics.write_textfile(tmpdir, 'rj_conflict_jobs 0\n')
+            self.assertEqual(path, os.path.join(tmpdir, 'rj.prom'))
+            self.assertEqual(os.listdir(tmpdir), ['rj.prom'])
+            with open(path) as f:
+                self.assertEqual(f.read(), 'rj_conflict_jobs 0\n')
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
+
+            with self.assertRaises(OSError):
+                Metrics.write_textfile(
+                    os.path.join(tmpdir, 'nonexistent'), '')
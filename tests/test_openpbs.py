@@ -1,10 +1,15 @@
 from copy import deepcopy
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from rjsched import RecordJobOpenpbs
-from unittest.mock import mock_open, patch, MagicMock
+from rjsched.JobCache import JobCache
+from unittest.mock import mock_open, patch, MagicMock, AsyncMock, call
 from datetime import datetime, timedelta
-from subprocess import PIPE, STDOUT, DEVNULL
+from subprocess import PIPE, STDOUT, DEVNULL, CalledProcessError
 from textwrap import dedent
+from threading import Barrier
+import asyncio
+import os
 from freezegun import freeze_time
 
 class RecordJobOpenpbsTest(TestCase):
@@ -23,6 +28,16 @@ class RecordJobOpenpbsTest(TestCase):
     def tearDown(self):
         super(RecordJobOpenpbsTest, self).tearDown()
 
+    def use_snapshot(self):
+        #
+        # 変更後のジョブ情報をキャッシュにあるジョブ情報と合わせて返すよう、
+        # 空のスナップショットを読み込ませる
+        #
+        self.rec.cache = MagicMock()
+        self.rec.cache.load.return_value = {
+            'joblist': [], 'tuners': {'tt': 2, 'bs': 2}}
+        self.rec._check_tuner_resource = MagicMock()
+
     def test_classname(self):
         self.assertEqual(str(self.rec), 'RecordJobOpenpbs')
 
@@ -87,6 +102,40 @@ class RecordJobOpenpbsTest(TestCase):
         self.rec.get_job_list.assert_called_with('111')
         self.assertEqual(joblist, joblist_origin)
 
+    def test_add_many(self):
+        #
+        # 複数ジョブを一括サブミットした際にジョブ情報リストの取得が
+        # 一度だけ行われ、ジョブごとの結果が返ることを確認
+        #
+        begin = datetime(2020, 8, 19, 20, 29, 30)
+        rectime = timedelta(seconds=1770)
+        jobs = [
+            ('15', 'ok1', begin, rectime),
+            ('15', 'ng', begin, rectime),
+            ('211', 'ok2', begin, rectime)]
+        joblist_all = [{'rj_id': '1'}, {'rj_id': '110'}, {'rj_id': '111'}]
+
+        def run_command(command, _input):
+            proc = MagicMock()
+            title = command[2].split('.')[0]
+            if title == 'ng':
+                raise CalledProcessError(1, command)
+            proc.stdout = {'ok1': '110.example.org', 'ok2': '111.example.org'}[title]
+            return proc
+
+        self.rec._run_command = MagicMock(side_effect=run_command)
+        self.rec.get_job_list = MagicMock(return_value=joblist_all)
+
+        joblist, results = self.rec.add_many(jobs, workers=2)
+
+        self.assertEqual(self.rec._run_command.call_count, 3)
+        self.rec.get_job_list.assert_called_once_with()
+        self.assertEqual(joblist, [{'rj_id': '110'}, {'rj_id': '111'}])
+        self.assertEqual([i[0] for i in results], ['110', '', '111'])
+        self.assertEqual(results[0][1], '')
+        self.assertTrue(results[1][1])
+        self.assertEqual(results[2][1], '')
+
     def test_remove(self):
         #
         # ジョブ削除の際のqdelコマンドの引数、戻り値を確認
@@ -101,9 +150,10 @@ class RecordJobOpenpbsTest(TestCase):
 
         self.rec.get_job_list.return_value = expected_joblist
 
-        joblist = self.rec.remove(jid)
+        joblist, result = self.rec.remove(jid)
         self.rec._run_command.assert_called_with(expected_command)
         self.assertEqual(joblist, expected_joblist)
+        self.assertEqual(result, {jid: ''})
 
         # _run_commandのMagicMockをリセット
         self.rec._run_command.reset_mock()
@@ -111,9 +161,49 @@ class RecordJobOpenpbsTest(TestCase):
         # 対象のジョブが存在しない場合は_run_command()を呼ばず空リストを返す
         self.rec.get_job_list.return_value = []
 
-        joblist = self.rec.remove(jid)
+        joblist, result = self.rec.remove(jid)
         self.rec._run_command.assert_not_called()
         self.assertEqual(joblist, [])
+        self.assertEqual(result, {jid: 'No such JOB ID'})
+
+    def test_remove_multi(self):
+        #
+        # 複数ジョブ削除の際にジョブ情報の取得とqdelが
+        # まとめて行われることを確認
+        #
+        self.rec._run_command = MagicMock()
+        self.rec.get_job_list = MagicMock(return_value=[
+            {'rj_id': '1'}, {'rj_id': '2'}, {'rj_id': '3'}, {'rj_id': '4'}])
+
+        joblist, result = self.rec.remove(['1', '2', '5', '3', '1'])
+        self.rec.get_job_list.assert_called_once_with()
+        self.rec._run_command.assert_called_once_with(
+            ['/work/pbs/bin/qdel', '1', '2', '3'])
+        self.assertEqual(
+            joblist, [{'rj_id': '1'}, {'rj_id': '2'}, {'rj_id': '3'}])
+        self.assertEqual(
+            result, {'1': '', '2': '', '3': '', '5': 'No such JOB ID'})
+
+        # qdelの引数が多い場合は分割して実行する
+        self.rec._run_command.reset_mock()
+        self.rec.qdel_chunk = 3
+
+        joblist, result = self.rec.remove(['1', '2', '3', '4'])
+        self.assertEqual(self.rec._run_command.call_args_list, [
+            call(['/work/pbs/bin/qdel', '1', '2', '3']),
+            call(['/work/pbs/bin/qdel', '4'])])
+        self.assertEqual(result, {'1': '', '2': '', '3': '', '4': ''})
+
+        # 一部のジョブの削除に失敗
+        self.rec._run_command.reset_mock()
+        self.rec.qdel_chunk = 256
+        self.rec._run_command.side_effect = CalledProcessError(
+            15, ['/work/pbs/bin/qdel', '1', '2', '3'],
+            stderr='qdel: Job has finished 2.openpbs\n')
+
+        joblist, result = self.rec.remove(['1', '2', '3'])
+        self.assertEqual(
+            result, {'1': '', '2': 'qdel: Job has finished 2.openpbs', '3': ''})
 
     def test_change_begin(self):
         #
@@ -121,10 +211,14 @@ class RecordJobOpenpbsTest(TestCase):
         #
         begin = datetime(2020, 8, 16, 0, 0, 0)
         delta = timedelta(seconds=300)
-        joblist = [{'rj_id': '1', 'rec_begin': begin}]
+        walltime = timedelta(seconds=1770)
+        joblist = [{
+            'rj_id': '1', 'rec_begin': begin, 'walltime': walltime,
+            'rec_end': begin + walltime, 'alert': ''}]
 
         self.rec._run_command = MagicMock()
         self.rec.get_job_list = MagicMock(return_value=joblist)
+        self.use_snapshot()
 
         expected_command = [
             '/work/pbs/bin/qalter', '-a', '202008160000.00', '1']
@@ -137,6 +231,7 @@ class RecordJobOpenpbsTest(TestCase):
             deepcopy(joblist), begin=begin)
 
         self.rec._run_command.assert_called_with(expected_command)
+        self.rec.get_job_list.assert_not_called()
         self.assertEqual(result1, joblist)
 
         # 元の録画開始時間からの差分指定
@@ -144,16 +239,32 @@ class RecordJobOpenpbsTest(TestCase):
             deepcopy(joblist), delta=delta)
 
         self.rec._run_command.assert_called_with(expected_command_delta)
-        self.assertEqual(result2, joblist)
+        self.rec.get_job_list.assert_not_called()
+        self.assertEqual(result2, [dict(
+            joblist[0],
+            rec_begin=begin + delta,
+            rec_end=begin + delta + walltime)])
+
+        # 変更後のジョブ情報をqstatで取得
+        result3 = self.rec.change_begin(
+            deepcopy(joblist), delta=delta, verify=True)
+
+        self.rec.get_job_list.assert_called_once_with('1')
+        self.assertEqual(result3, joblist)
 
     def test_change_rectime(self):
         #
         # 録画時間変更の際のqalterコマンドの引数、戻り値を確認
         #
-        joblist = [{'rj_id': '1', 'walltime': timedelta(seconds=1770)}]
+        begin = datetime(2020, 8, 16, 0, 0, 0)
+        joblist = [{
+            'rj_id': '1', 'rec_begin': begin,
+            'walltime': timedelta(seconds=1770),
+            'rec_end': begin + timedelta(seconds=1770), 'alert': ''}]
 
         self.rec._run_command = MagicMock()
         self.rec.get_job_list = MagicMock(return_value=joblist)
+        self.use_snapshot()
 
         rectime = timedelta(seconds=1800)
         delta = timedelta(seconds=300)
@@ -169,22 +280,40 @@ class RecordJobOpenpbsTest(TestCase):
             deepcopy(joblist), rectime=rectime)
 
         self.rec._run_command.assert_called_with(expected_command)
-        self.assertEqual(result1, joblist)
+        self.rec.get_job_list.assert_not_called()
+        self.assertEqual(result1, [dict(
+            joblist[0], walltime=rectime, rec_end=begin + rectime)])
 
         # 元の録画開始時間からの差分指定
         result2 = self.rec.change_rectime(
             deepcopy(joblist), delta=delta)
 
         self.rec._run_command.assert_called_with(expected_command_delta)
-        self.assertEqual(result2, joblist)
+        self.assertEqual(result2, [dict(
+            joblist[0],
+            walltime=timedelta(seconds=2070),
+            rec_end=begin + timedelta(seconds=2070))])
+
+        # 変更後のジョブ情報をqstatで取得
+        result3 = self.rec.change_rectime(
+            deepcopy(joblist), delta=delta, verify=True)
+
+        self.rec.get_job_list.assert_called_once_with('1')
+        self.assertEqual(result3, joblist)
 
     def test_change_jobname(self):
         #
         # ジョブ名変更の際のqalterコマンドの引数、戻り値を確認
         #
-        joblist = [{'rj_id': '1', 'rj_title': 'origin', 'channel': '15'}]
+        joblist = [{
+            'rj_id': '1', 'rj_title': 'origin', 'channel': '15',
+            'station_name': 'MX', 'rec_begin': datetime(2020, 8, 16, 0, 0, 0),
+            'alert': ''}]
         self.rec._run_command = MagicMock()
         self.rec.get_job_list = MagicMock(return_value=joblist)
+        self.use_snapshot()
+        self.rec.get_channel_list = MagicMock(
+            return_value={'15': 'MX', '211': 'BS11'})
 
         expected_change_name_command = [
             '/work/pbs/bin/qalter', '-N', 'changed.15', '1']
@@ -198,7 +327,7 @@ class RecordJobOpenpbsTest(TestCase):
 
         self.rec._run_command.assert_called_with(
                 expected_change_name_command)
-        self.assertEqual(result1, joblist)
+        self.assertEqual(result1, [dict(joblist[0], rj_title='changed')])
 
         # チャンネル番号変更
         result2 = self.rec._change_jobname(
@@ -206,7 +335,45 @@ class RecordJobOpenpbsTest(TestCase):
 
         self.rec._run_command.assert_called_with(
             expected_change_channel_command)
-        self.assertEqual(result2, joblist)
+        self.assertEqual(result2, [dict(
+            joblist[0], channel='211', station_name='BS11')])
+        self.rec.get_job_list.assert_not_called()
+
+        # 変更後のジョブ情報をqstatで取得
+        result3 = self.rec._change_jobname(
+            joblist=deepcopy(joblist), ch='211', verify=True)
+
+        self.rec.get_job_list.assert_called_once_with('1')
+        self.assertEqual(result3, joblist)
+
+    def test_changed_job_list(self):
+        #
+        # ローカルで組み立てた変更後のジョブ情報が
+        # キャッシュにある他のジョブと合わせてチェックされることを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        self.rec.cache = MagicMock()
+        self.rec.cache.load.return_value = {
+            'joblist': [
+                {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22,
+                    'rec_end': t23, 'alert': ''},
+                {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t23,
+                    'rec_end': t23 + timedelta(hours=1), 'alert': ''}],
+            'tuners': {'tt': 1, 'bs': 1}}
+
+        job = {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22,
+            'rec_end': t23, 'alert': ''}
+        result = self.rec._changed_job_list(dict(job), verify=False)
+        self.rec.cache.load.assert_called_once_with(stale=True)
+        self.assertEqual(result, [dict(job, alert='Out of Tuners. Max: 1')])
+
+        # 使用できるキャッシュがない場合はqstatで取得する
+        self.rec.cache.load.return_value = None
+        self.rec.get_job_list = MagicMock(return_value=[job])
+        result = self.rec._changed_job_list(dict(job), verify=False)
+        self.rec.get_job_list.assert_called_once_with('2')
+        self.assertEqual(result, [job])
 
     # 現在時刻を2020年08月16日 20時03分00秒(1597575780)に固定
     @freeze_time('2020-08-16 20:03:00')
@@ -442,6 +609,7 @@ class RecordJobOpenpbsTest(TestCase):
         expected_jid72 = []
 
         self.rec._fetch_joblist = MagicMock()
+        self.rec._get_tuner_nodes = MagicMock(return_value={})
         self.rec._check_tuner_resource = MagicMock()
         self.rec.joblist = joblist_all
 
@@ -465,6 +633,236 @@ class RecordJobOpenpbsTest(TestCase):
         joblist = self.rec.get_job_list()
         self.assertEqual(joblist, joblist_all)
 
+    def test_get_job_list_cached(self):
+        #
+        # キャッシュが有効期間内であればqstat、pbsnodesを実行しないことを確認
+        #
+        joblist_all = [{'rj_id': '68'}, {'rj_id': '69'}]
+        tuners = {'tt': 2, 'bs': 2}
+        nodes = {'node1': {
+            'available': {'tt': 2, 'bs': 2},
+            'assigned': {'tt': 0, 'bs': 0}}}
+
+        self.rec._fetch_joblist = MagicMock()
+        self.rec._get_tuner_nodes = MagicMock()
+        self.rec._check_tuner_resource = MagicMock()
+        self.rec.cache = MagicMock()
+
+        # キャッシュヒット
+        self.rec.cache.load.return_value = {
+            'joblist': joblist_all, 'tuners': tuners, 'nodes': nodes}
+        joblist = self.rec.get_job_list()
+        self.assertEqual(joblist, joblist_all)
+        self.rec._fetch_joblist.assert_not_called()
+        self.rec._get_tuner_nodes.assert_not_called()
+        self.rec._check_tuner_resource.assert_called_with(tuners, nodes)
+
+        # ジョブIDは完全一致で探す
+        self.assertEqual(self.rec.get_job_list(jid='68'), [{'rj_id': '68'}])
+        self.assertEqual(self.rec.get_job_list(jid='6869'), [])
+
+        # キャッシュミス
+        self.rec.cache.load.return_value = None
+        self.rec._get_tuner_nodes.return_value = nodes
+        self.rec.joblist = joblist_all
+        self.rec.get_job_list()
+        self.rec._fetch_joblist.assert_called_once_with()
+        self.rec.cache.save.assert_called_with(
+            {'joblist': joblist_all, 'tuners': tuners, 'nodes': nodes})
+
+    def test_fetch_all(self):
+        #
+        # qstatとpbsnodesが並行して実行されることを確認
+        #
+        started = Barrier(2, timeout=5)
+        tuners = {'tt': 2, 'bs': 2}
+        nodes = {'node1': {
+            'available': {'tt': 2, 'bs': 2},
+            'assigned': {'tt': 0, 'bs': 0}}}
+
+        def fetch_joblist():
+            # pbsnodesの実行中でなければBarrierを通過できない
+            started.wait()
+            self.rec.joblist = [{'rj_id': '1'}]
+
+        def get_tuner_nodes():
+            started.wait()
+            return nodes
+
+        self.rec._fetch_joblist = MagicMock(side_effect=fetch_joblist)
+        self.rec._get_tuner_nodes = MagicMock(side_effect=get_tuner_nodes)
+        self.rec.cache = MagicMock()
+
+        self.assertEqual(self.rec._fetch_all(), (tuners, nodes))
+        self.rec.cache.save.assert_called_once_with(
+            {'joblist': [{'rj_id': '1'}], 'tuners': tuners, 'nodes': nodes})
+
+    def test_get_job_list_targeted(self):
+        #
+        # キャッシュが有効期間切れの場合は指定されたジョブのみqstatで取得し、
+        # キャッシュにある他のジョブと合わせてチューナー数をチェックすることを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        cached = [
+            {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''},
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''}]
+        fetched = [
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'rj_title': 'changed', 'alert': ''}]
+        tuners = {'tt': 1, 'bs': 1}
+
+        def fetch_joblist(jids=None):
+            self.rec.joblist = deepcopy(fetched)
+
+        self.rec._fetch_joblist = MagicMock(side_effect=fetch_joblist)
+        self.rec._get_tuner_nodes = MagicMock()
+        self.rec.cache = MagicMock()
+
+        def load(stale=False):
+            if stale:
+                return {'joblist': deepcopy(cached), 'tuners': tuners}
+            return None
+        self.rec.cache.load.side_effect = load
+
+        joblist = self.rec.get_job_list('2')
+        self.rec._fetch_joblist.assert_called_once_with(['2'])
+        self.rec._get_tuner_nodes.assert_not_called()
+        self.assertEqual(joblist, [dict(fetched[0], alert='Out of Tuners. Max: 1')])
+
+        # 数字以外のジョブIDはqstatに渡さない
+        self.rec._fetch_joblist.reset_mock()
+        self.assertEqual(self.rec.get_job_list('-x'), [])
+        self.rec._fetch_joblist.assert_not_called()
+
+        # キャッシュがない場合は全ジョブを取得する
+        self.rec.cache.load.side_effect = None
+        self.rec.cache.load.return_value = None
+        self.rec._get_tuner_nodes.return_value = {'node1': {
+            'available': tuners, 'assigned': {'tt': 0, 'bs': 0}}}
+        joblist = self.rec.get_job_list('2')
+        self.rec._fetch_joblist.assert_called_once_with()
+        self.assertEqual(joblist, [fetched[0]])
+
+    def test_get_job_list_targeted_removed(self):
+        #
+        # 削除したジョブはキャッシュから除かれ、
+        # ジョブID指定の取得でチューナー数のチェックに使われないことを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        joblist = [
+            {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''},
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''}]
+        tuners = {'tt': 1, 'bs': 1}
+
+        def fetch_joblist(jids=None):
+            self.rec.joblist = [deepcopy(i) for i in joblist
+                if jids is None or i['rj_id'] in jids]
+
+        self.rec._fetch_joblist = MagicMock(side_effect=fetch_joblist)
+        self.rec._get_tuner_nodes = MagicMock(return_value={'node1': {
+            'available': tuners, 'assigned': {'tt': 0, 'bs': 0}}})
+        self.rec._run_command = MagicMock()
+
+        with TemporaryDirectory() as tmpdir:
+            self.rec.cache = JobCache(
+                os.path.join(tmpdir, 'joblist.cache'), 60, stale_max=600)
+            with freeze_time('2020-08-16 20:00:00'):
+                self.rec.get_job_list()
+                self.assertTrue(self.rec.get_job_list('2')[0]['alert'])
+
+                self.rec.remove(['1'])
+                self.rec._fetch_joblist.reset_mock()
+                joblist = joblist[1:]
+                self.assertEqual(self.rec.get_job_list('2')[0]['alert'], '')
+                self.rec._fetch_joblist.assert_called_once_with(['2'])
+
+            # 取得からcache_stale_max秒を超えた場合は全ジョブを取得する
+            self.rec._fetch_joblist.reset_mock()
+            with freeze_time('2020-08-16 20:10:01'):
+                self.rec.get_job_list('2')
+            self.rec._fetch_joblist.assert_called_once_with()
+
+    def test_fetch_joblist_targeted(self):
+        #
+        # ジョブID指定でqstatを実行することを確認
+        #
+        qstat_out = dedent("""\
+            {
+                "Jobs":{
+                    "70.openpbs":{
+                        "Job_Name":"tt_wait.25",
+                        "job_state":"W",
+                        "ctime":"Sun Aug 16 17:11:02 2020",
+                        "Execution_Time":"Tue Aug 18 23:59:50 2020",
+                        "mtime":"Sun Aug 16 17:11:02 2020",
+                        "qtime":"Sun Aug 16 17:11:02 2020",
+                        "Resource_List":{
+                            "tt":"1",
+                            "walltime":"00:29:30"},
+                        "euser":"autumn",
+                        "egroup":"autumn"}}}""")
+        self.rec.get_channel_list = MagicMock(return_value={'25': 'NTV'})
+        proc = MagicMock()
+        proc.stdout = qstat_out
+        self.rec._run_command = MagicMock(return_value=proc)
+
+        self.rec._fetch_joblist(['70'])
+        self.rec._run_command.assert_called_once_with(
+            ['/work/pbs/bin/qstat', '-f', '-F', 'json', '70'], log=False)
+        self.assertEqual([i['rj_id'] for i in self.rec.joblist], ['70'])
+
+        # 存在しないジョブIDが含まれqstatがエラー終了した
+        self.rec._run_command = MagicMock(side_effect=CalledProcessError(
+            153, 'qstat', output=qstat_out,
+            stderr='qstat: Unknown Job Id 71.openpbs'))
+        self.rec._fetch_joblist(['70', '71'])
+        self.assertEqual([i['rj_id'] for i in self.rec.joblist], ['70'])
+
+        # 全てのジョブIDが存在しない
+        self.rec._run_command = MagicMock(side_effect=CalledProcessError(
+            153, 'qstat', output='',
+            stderr='qstat: Unknown Job Id 71.openpbs'))
+        self.rec._fetch_joblist(['71'])
+        self.assertEqual(self.rec.joblist, [])
+
+    def test_cache_invalidate(self):
+        #
+        # ジョブを変更する操作の後はキャッシュが無効化されることを確認
+        #
+        joblist = [{
+            'rj_id': '1',
+            'rj_title': 'origin',
+            'channel': '15',
+            'rec_begin': datetime(2020, 8, 16, 0, 0, 0),
+            'walltime': timedelta(seconds=1770)}]
+        proc = MagicMock()
+        proc.stdout = '1.example.org'
+        self.rec._run_command = MagicMock(return_value=proc)
+        self.rec.get_job_list = MagicMock(return_value=joblist)
+        self.rec.cache = MagicMock()
+
+        self.rec.add('15', 'origin',
+            datetime(2020, 8, 16, 0, 0, 0), timedelta(seconds=1770))
+        self.assertEqual(self.rec.cache.invalidate.call_count, 1)
+
+        self.rec.remove(['1'])
+        self.assertEqual(self.rec.cache.invalidate.call_count, 2)
+
+        self.rec.change_begin(joblist, begin=datetime(2020, 8, 16, 0, 5, 0))
+        self.assertEqual(self.rec.cache.invalidate.call_count, 3)
+
+        self.rec.change_rectime(joblist, rectime=timedelta(seconds=1800))
+        self.assertEqual(self.rec.cache.invalidate.call_count, 4)
+
+        self.rec.change_name(joblist, 'changed')
+        self.assertEqual(self.rec.cache.invalidate.call_count, 5)
+
     def test_get_tuner_num(self):
         #
         # pbsnodesコマンドの出力に応じてカスタムリソース'bs'、'tt'が
@@ -576,7 +974,7 @@ class RecordJobOpenpbsTest(TestCase):
     def test_check_tuner_resource(self):
         #
         # 同時録画数がチューナー数を超えた場合に
-        # 当該ジョブのalert属性に警告文がつくことを確認
+        # 超過した時点で開始するジョブのalert属性にのみ警告文がつくことを確認
         #
         message = 'Out of Tuners. Max: 2'
         self.rec._get_tuner_num = MagicMock(return_value={'tt': 2, 'bs': 2})
@@ -653,7 +1051,7 @@ class RecordJobOpenpbsTest(TestCase):
                 'rec_end':   datetime(2020, 8, 16, 23, 59, 59),
                 'tuner': 'bs',
                 'alert': ''}]
-        expected_exceeded_tt = [message, message, message, '', '', '']
+        expected_exceeded_tt = ['', '', message, '', '', '']
 
         self.rec.joblist = joblist_exceeded_tt
         self.rec._check_tuner_resource()
@@ -693,7 +1091,7 @@ class RecordJobOpenpbsTest(TestCase):
                 'rec_end':   datetime(2020, 8, 16, 22, 59, 59),
                 'tuner': 'bs',
                 'alert': ''}]
-        expected_exceeded_bs = ['', '', '', message, message, message]
+        expected_exceeded_bs = ['', '', '', '', '', message]
 
         self.rec.joblist = joblist_exceeded_bs
         self.rec._check_tuner_resource()
@@ -748,7 +1146,7 @@ class RecordJobOpenpbsTest(TestCase):
                 'rec_end':   datetime(2020, 8, 16, 22, 59, 59),
                 'tuner': 'tt',
                 'alert': ''}]
-        expected_boundary_exceeded = [message, message, message]
+        expected_boundary_exceeded = ['', '', message]
 
         self.rec.joblist = joblist_boundary_exceeded
         self.rec._check_tuner_resource()
@@ -804,10 +1202,252 @@ class RecordJobOpenpbsTest(TestCase):
                 'rec_end':   datetime(2020, 8, 16, 22, 30, 00),
                 'tuner': 'tt',
                 'alert': ''}]
-        expected_with_notrecjob_exceeded = ['', message, message, message]
+        expected_with_notrecjob_exceeded = ['', '', '', message]
 
         self.rec.joblist = joblist_with_notrecjob_exceeded
         self.rec._check_tuner_resource()
 
         alerts = [i.get('alert') for i in self.rec.joblist]
         self.assertEqual(alerts, expected_with_notrecjob_exceeded)
+
+    def test_get_tuner_nodes(self):
+        #
+        # pbsnodesコマンドの出力からホストごとのチューナー数と
+        # 割り当て済みのチューナー数が取得されることを確認
+        #
+        proc = MagicMock()
+        self.rec._run_command = MagicMock(return_value=proc)
+        proc.stdout = dedent("""\
+            {
+                "nodes":{
+                    "node1":{
+                        "state":"job-busy",
+                        "resources_available":{
+                            "host":"node1",
+                            "bs":2,
+                            "tt":2},
+                        "resources_assigned":{
+                            "tt":1}},
+                    "node2":{
+                        "state":"offline",
+                        "resources_available":{
+                            "bs":2,
+                            "tt":2}},
+                    "node3[0]":{
+                        "state":"free",
+                        "resources_available":{
+                            "host":"node3",
+                            "tt":1}},
+                    "node3[1]":{
+                        "state":"free",
+                        "resources_available":{
+                            "host":"node3",
+                            "bs":1,
+                            "tt":1}}}}""")
+        expected = {
+            'node1': {
+                'available': {'tt': 2, 'bs': 2},
+                'assigned': {'tt': 1, 'bs': 0}},
+            'node3': {
+                'available': {'tt': 2, 'bs': 1},
+                'assigned': {'tt': 0, 'bs': 0}}}
+        self.assertEqual(self.rec._get_tuner_nodes(), expected)
+        self.assertEqual(self.rec._get_tuner_num(), {'tt': 4, 'bs': 3})
+
+    def test_check_node_resource(self):
+        #
+        # ホストごとのチューナー数でチェックし、
+        # 警告文にチューナーが不足するホストと時刻が含まれることを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        tuners = {'tt': 3, 'bs': 0}
+        nodes = {
+            'node1': {
+                'available': {'tt': 1, 'bs': 0},
+                'assigned': {'tt': 1, 'bs': 0}},
+            'node2': {
+                'available': {'tt': 2, 'bs': 0},
+                'assigned': {'tt': 0, 'bs': 0}}}
+
+        # node1で実行中のジョブに加えてnode1に固定されたジョブがある
+        # 合計では3チューナー以内だがnode1のチューナーが不足する
+        self.rec.joblist = [
+            {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'exec_host': 'node1', 'alert': ''},
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'exec_host': 'node1', 'alert': ''},
+            {'rj_id': '3', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''}]
+        self.rec._check_tuner_resource(tuners, nodes)
+        alerts = [i.get('alert') for i in self.rec.joblist]
+        self.assertEqual(alerts, [
+            '', 'Out of Tuners on node1 at 2020/08/16 22:00. Max: 1', ''])
+
+        # rj以外のジョブがnode1のチューナーを使用している
+        # 実行中のジョブで説明できない割り当て済みのチューナーは使用できない
+        self.rec.joblist = [
+            {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''},
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'alert': ''},
+            {'rj_id': '3', 'tuner': 'tt', 'rec_begin': t23, 'rec_end': t23,
+                'alert': ''}]
+        self.rec._check_tuner_resource(tuners, nodes)
+        alerts = [i.get('alert') for i in self.rec.joblist]
+        self.assertEqual(alerts, [
+            '', '', 'Out of Tuners on node2 at 2020/08/16 23:00. Max: 2'])
+
+        # ホストごとの情報がない場合は合計のチューナー数でチェックする
+        self.rec.joblist = [
+            {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'exec_host': 'node1', 'alert': ''},
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'exec_host': 'node1', 'alert': ''}]
+        self.rec._check_tuner_resource(tuners)
+        alerts = [i.get('alert') for i in self.rec.joblist]
+        self.assertEqual(alerts, ['', ''])
+
+    def test_add_async(self):
+        #
+        # 非同期版でも同期版と同じqsubコマンドを実行することを確認
+        #
+        joblist_origin = [{'rj_id': '110'}]
+        proc = MagicMock(stdout='110.example.org')
+        self.rec._run_command_async = AsyncMock(return_value=proc)
+        self.rec.get_job_list_async = AsyncMock(return_value=joblist_origin)
+        begin = datetime(2020, 8, 19, 20, 29, 30)
+        rectime = timedelta(seconds=1770)
+
+        joblist = asyncio.run(self.rec.add_async('15', 'test_tt', begin, rectime))
+
+        qsub, jobexec = self.rec._qsub_command('15', 'test_tt', begin, rectime)
+        self.rec._run_command_async.assert_awaited_once_with(
+            command=qsub, _input=jobexec)
+        self.rec.get_job_list_async.assert_awaited_once_with('110')
+        self.assertEqual(joblist, joblist_origin)
+
+    def test_add_many_async(self):
+        #
+        # qsubが最大workers個まで並行して実行されることを確認
+        #
+        begin = datetime(2020, 8, 19, 20, 29, 30)
+        rectime = timedelta(seconds=1770)
+        jobs = [('15', 'job{}'.format(i), begin, rectime) for i in range(6)]
+        running = []
+        peak = []
+
+        async def run_command(command, _input):
+            running.append(command)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(command)
+            title = command[2].split('.')[0]
+            if title == 'job3':
+                raise CalledProcessError(1, command)
+            return MagicMock(stdout='{}.example.org'.format(title[3:]))
+
+        self.rec._run_command_async = AsyncMock(side_effect=run_command)
+        self.rec.get_job_list_async = AsyncMock(
+            return_value=[{'rj_id': '0'}, {'rj_id': '1'}, {'rj_id': '9'}])
+
+        joblist, results = asyncio.run(self.rec.add_many_async(jobs, workers=3))
+
+        self.assertEqual(max(peak), 3)
+        self.rec.get_job_list_async.assert_awaited_once_with()
+        self.assertEqual(joblist, [{'rj_id': '0'}, {'rj_id': '1'}])
+        self.assertEqual(
+            [i[0] for i in results], ['0', '1', '2', '', '4', '5'])
+        self.assertTrue(results[3][1])
+
+    def test_remove_async(self):
+        #
+        # 分割したqdelの結果がまとめて返ることを確認
+        #
+        self.rec._run_command_async = AsyncMock(side_effect=[
+            MagicMock(),
+            CalledProcessError(
+                15, ['/work/pbs/bin/qdel', '4'],
+                stderr='qdel: Job has finished 4.openpbs\n')])
+        self.rec.get_job_list_async = AsyncMock(return_value=[
+            {'rj_id': '1'}, {'rj_id': '2'}, {'rj_id': '3'}, {'rj_id': '4'}])
+        self.rec.qdel_chunk = 3
+
+        joblist, result = asyncio.run(
+            self.rec.remove_async(['1', '2', '3', '4', '5']))
+        self.assertEqual(self.rec._run_command_async.call_args_list, [
+            call(['/work/pbs/bin/qdel', '1', '2', '3']),
+            call(['/work/pbs/bin/qdel', '4'])])
+        self.assertEqual(len(joblist), 4)
+        self.assertEqual(result, {
+            '1': '', '2': '', '3': '',
+            '4': 'qdel: Job has finished 4.openpbs',
+            '5': 'No such JOB ID'})
+
+    def test_change_async(self):
+        #
+        # 非同期版の変更系メソッドのqalterの引数、戻り値を確認
+        #
+        begin = datetime(2020, 8, 16, 0, 0, 0)
+        walltime = timedelta(seconds=1770)
+        joblist = [{
+            'rj_id': '1', 'rj_title': 'test', 'channel': '15',
+            'rec_begin': begin, 'rec_end': begin + walltime,
+            'walltime': walltime, 'alert': ''}]
+        self.rec._run_command_async = AsyncMock()
+        self.rec.get_job_list_async = AsyncMock(return_value=joblist)
+        self.use_snapshot()
+
+        result = asyncio.run(self.rec.change_begin_async(
+            joblist, delta=timedelta(seconds=300)))
+        self.rec._run_command_async.assert_awaited_with(
+            ['/work/pbs/bin/qalter', '-a', '202008160005.00', '1'])
+        self.assertEqual(
+            result[0]['rec_begin'], begin + timedelta(seconds=300))
+        self.rec.get_job_list_async.assert_not_awaited()
+
+        result = asyncio.run(self.rec.change_rectime_async(
+            joblist, rectime=timedelta(seconds=600), verify=True))
+        self.rec._run_command_async.assert_awaited_with(
+            ['/work/pbs/bin/qalter', '-l', 'walltime=600.0', '1'])
+        self.rec.get_job_list_async.assert_awaited_once_with('1')
+
+        result = asyncio.run(self.rec.change_name_async(joblist, 'new'))
+        self.rec._run_command_async.assert_awaited_with(
+            ['/work/pbs/bin/qalter', '-N', 'new.15', '1'])
+        self.assertEqual(result[0]['rj_title'], 'new')
+
+    def test_fetch_all_async(self):
+        #
+        # qstatとpbsnodesが並行して実行されることを確認
+        #
+        tuners = {'tt': 2, 'bs': 2}
+        nodes = {'node1': {
+            'available': {'tt': 2, 'bs': 2},
+            'assigned': {'tt': 0, 'bs': 0}}}
+
+        async def main():
+            events = [asyncio.Event(), asyncio.Event()]
+
+            async def wait(i):
+                # もう一方が開始していなければ待ち続ける
+                events[i].set()
+                await asyncio.wait_for(events[1 - i].wait(), 5)
+
+            async def fetch_joblist():
+                await wait(0)
+                self.rec.joblist = [{'rj_id': '1'}]
+
+            async def get_tuner_nodes():
+                await wait(1)
+                return nodes
+
+            self.rec._fetch_joblist_async = AsyncMock(side_effect=fetch_joblist)
+            self.rec._get_tuner_nodes_async = AsyncMock(
+                side_effect=get_tuner_nodes)
+            return await self.rec._fetch_all_async()
+
+        self.rec.cache = MagicMock()
+        self.assertEqual(asyncio.run(main()), (tuners, nodes))
+        self.rec.cache.save.assert_called_once_with(
+            {'joblist': [{'rj_id': '1'}], 'tuners': tuners, 'nodes': nodes})
@@ -0,0 +1,230 @@
+from datetime import datetime, timedelta
+from subprocess import CalledProcessError
+from unittest import TestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+import asyncio
+from rjsched.Job import Job
+from rjsched.RecordJobOpenpbsCluster import RecordJobOpenpbsCluster
+from rjsched.TunerTimeline import TunerTimeline
+
+def job(jid, begin, tuner='tt', title='test'):
+    return Job({
+        'rj_id': jid,
+        'rj_title': title,
+        'tuner': tuner,
+        'rec_begin': begin,
+        'rec_end': begin + timedelta(seconds=1770),
+        'walltime': timedelta(seconds=1770),
+        'alert': ''})
+
+class RecordJobOpenpbsClusterTest(TestCase):
+    def setUp(self):
+        super(RecordJobOpenpbsClusterTest, self).setUp()
+        config = {
+            'recpt1_path':    '/usr/local/bin/recpt1',
+            'recpt1ctl_path': '/usr/local/bin/recpt1ctl',
+            'recdir':         '/home/dummy/rec',
+            'channel_file':   '/home/dummy/.rj/channel.yml',
+            'pbsexec_dir':    '/work/pbs/bin',
+            'joblog_dir':     '/home/dummy/log',
+            'pbs_servers': [
+                {'name': 'pbs1'},
+                {'name': 'pbs2', 'pbsexec_dir': '/opt/pbs/bin'}]}
+        self.rec = RecordJobOpenpbsCluster(config)
+        self.begin = datetime(2020, 8, 19, 20, 0, 0)
+        self.joblists = {
+            'pbs1': [
+                job('10', self.begin),
+                job('11', self.begin + timedelta(hours=2))],
+            'pbs2': [
+                job('10', self.begin + timedelta(hours=1), 'bs')],
+        }
+        for name, rec in self.rec.servers.items():
+            rec.get_job_list = MagicMock(return_value=self.joblists[name])
+            rec.get_job_list_async = AsyncMock(
+                return_value=self.joblists[name])
+            rec.timeline = TunerTimeline({'tt': 1, 'bs': 1})
+        self.maxDiff = None
+
+    def test_servers(self):
+        #
+        # サーバーごとにpbsexec_dir、PBS_SERVER、キャッシュファイルを分ける
+        #
+        pbs1 = self.rec.servers['pbs1']
+        pbs2 = self.rec.servers['pbs2']
+        self.assertEqual(pbs1.qstat[0], '/work/pbs/bin/qstat')
+        self.assertEqual(pbs2.qstat[0], '/opt/pbs/bin/qstat')
+        self.assertEqual(pbs1.env, {'PBS_SERVER': 'pbs1'})
+        self.assertEqual(pbs2.env, {'PBS_SERVER': 'pbs2'})
+        self.assertNotEqual(pbs1.cache.path, pbs2.cache.path)
+
+        with self.assertRaises(ValueError):
+            RecordJobOpenpbsCluster({'pbs_servers': []})
+
+    def test_get_job_list(self):
+        #
+        # 全サーバーのジョブを録画開始時刻順にまとめる
+        #
+        joblist = self.rec.get_job_list()
+        self.assertEqual(
+            [i['rj_id'] for i in joblist], ['10@pbs1', '10@pbs2', '11@pbs1'])
+        self.assertEqual(joblist[1]['server'], 'pbs2')
+        self.assertEqual(self.rec.capacity, {
+            'pbs1': {'tt': 1, 'bs': 1}, 'pbs2': {'tt': 1, 'bs': 1}})
+        self.assertEqual(self.rec.timeline.capacity, {'tt': 2, 'bs': 2})
+
+        joblist = asyncio.run(self.rec.get_job_list_async())
+        self.assertEqual(
+            [i['rj_id'] for i in joblist], ['10@pbs1', '10@pbs2', '11@pbs1'])
+
+    def test_get_job_list_jid(self):
+        #
+        # サーバー名つきのジョブIDはそのサーバーのみに問い合わせる
+        #
+        pbs1 = self.rec.servers['pbs1']
+        pbs2 = self.rec.servers['pbs2']
+        pbs2.get_job_list.return_value = [self.joblists['pbs2'][0]]
+
+        joblist = self.rec.get_job_list('10@pbs2')
+        self.assertEqual([i['rj_id'] for i in joblist], ['10@pbs2'])
+        pbs2.get_job_list.assert_called_once_with('10')
+        pbs1.get_job_list.assert_not_called()
+
+        self.assertEqual(self.rec.get_job_list('10@unknown'), [])
+
+        # サーバー名がない場合は全サーバーに問い合わせる
+        pbs1.get_job_list.return_value = [self.joblists['pbs1'][0]]
+        joblist = self.rec.get_job_list('10')
+        self.assertEqual(
+            [i['rj_id'] for i in joblist], ['10@pbs1', '10@pbs2'])
+
+    def test_get_job_list_error(self):
+        #
+        # 応答しないサーバーを除いてまとめる
+        #
+        pbs2 = self.rec.servers['pbs2']
+        pbs2.get_job_list.side_effect = CalledProcessError(1, ['qstat'])
+        with patch('sys.stderr'):
+            joblist = self.rec.get_job_list()
+        self.assertEqual(
+            [i['rj_id'] for i in joblist], ['10@pbs1', '11@pbs1'])
+        self.assertEqual(self.rec.online, ['pbs1'])
+
+        # 全サーバーが応答しない場合はエラー
+        self.rec.servers['pbs1'].get_job_list.side_effect = OSError()
+        with patch('sys.stderr'):
+            with self.assertRaises(OSError):
+                self.rec.get_job_list()
+
+    def test_get_job_list_error_again(self):
+        #
+        # 前回応答したサーバーが応答しなくなった場合は、
+        # そのサーバーのチューナー数を合計から除き、振り分け先にもしない
+        #
+        self.rec.get_job_list()
+        self.assertEqual(self.rec.timeline.capacity, {'tt': 2, 'bs': 2})
+
+        pbs1 = self.rec.servers['pbs1']
+        pbs1.get_job_list.side_effect = CalledProcessError(1, ['qstat'])
+        with patch('sys.stderr'):
+            joblist = self.rec.get_job_list()
+        self.assertEqual([i['rj_id'] for i in joblist], ['10@pbs2'])
+        self.assertEqual(self.rec.capacity, {'pbs2': {'tt': 1, 'bs': 1}})
+        self.assertEqual(self.rec.timeline.capacity, {'tt': 1, 'bs': 1})
+
+        # pbs1の方が空いているが、応答したpbs2にサブミットする
+        pbs2 = self.rec.servers['pbs2']
+        pbs2.add = MagicMock(return_value=[job('20', self.begin)])
+        with patch('sys.stderr'):
+            joblist = self.rec.add(
+                '101', 'test', self.begin + timedelta(hours=1),
+                timedelta(seconds=1770))
+        self.assertEqual([i['rj_id'] for i in joblist], ['20@pbs2'])
+
+        pbs1.get_job_list_async.side_effect = OSError()
+        pbs1.get_job_list.side_effect = None
+        self.rec.get_job_list()
+        with patch('sys.stderr'):
+            asyncio.run(self.rec.get_job_list_async())
+        self.assertEqual(self.rec.online, ['pbs2'])
+        self.assertEqual(self.rec.capacity, {'pbs2': {'tt': 1, 'bs': 1}})
+
+    def test_add(self):
+        #
+        # 空きチューナーのあるサーバーにサブミットする
+        #
+        for name, rec in self.rec.servers.items():
+            rec.add = MagicMock(return_value=[job('20', self.begin)])
+
+        # pbs1は地上波チューナーを使用中
+        joblist = self.rec.add(
+            '15', 'test', self.begin + timedelta(minutes=10),
+            timedelta(seconds=1770))
+        self.assertEqual([i['rj_id'] for i in joblist], ['20@pbs2'])
+        self.rec.servers['pbs1'].add.assert_not_called()
+
+        # 空きが同じ場合は先のサーバー
+        joblist = self.rec.add(
+            '15', 'test', self.begin + timedelta(hours=5),
+            timedelta(seconds=1770))
+        self.assertEqual([i['rj_id'] for i in joblist], ['20@pbs1'])
+
+    def test_add_many(self):
+        #
+        # 振り分けたジョブも含めて空きチューナーを数える
+        #
+        begin = self.begin + timedelta(hours=5)
+        jobs = [
+            ('15', 'a', begin, timedelta(seconds=1770)),
+            ('16', 'b', begin, timedelta(seconds=1770)),
+            ('17', 'c', begin, timedelta(seconds=1770)),
+        ]
+        self.rec.servers['pbs1'].add_many = MagicMock(return_value=(
+            [job('20', begin, title='a')], [('20', ''), ('', 'qsub failed')]))
+        self.rec.servers['pbs2'].add_many = MagicMock(return_value=(
+            [job('30', begin, title='b')], [('30', '')]))
+
+        joblist, results = self.rec.add_many(jobs, 2)
+        self.rec.servers['pbs1'].add_many.assert_called_once_with(
+            [jobs[0], jobs[2]], 2)
+        self.rec.servers['pbs2'].add_many.assert_called_once_with(
+            [jobs[1]], 2)
+        self.assertEqual(
+            [i['rj_id'] for i in joblist], ['20@pbs1', '30@pbs2'])
+        self.assertEqual(
+            results, [('20@pbs1', ''), ('30@pbs2', ''), ('', 'qsub failed')])
+
+    def test_remove(self):
+        #
+        # サーバーごとにまとめて削除する
+        #
+        self.rec.servers['pbs1'].remove = MagicMock(return_value=(
+            [self.joblists['pbs1'][1]], {'11': ''}))
+        self.rec.servers['pbs2'].remove = MagicMock(return_value=(
+            [self.joblists['pbs2'][0]], {'10': ''}))
+
+        joblist, result = self.rec.remove(['11', '10@pbs2', '10', '99@x'])
+        self.rec.servers['pbs1'].remove.assert_called_once_with(['11'])
+        self.rec.servers['pbs2'].remove.assert_called_once_with(['10'])
+        self.assertEqual(
+            [i['rj_id'] for i in joblist], ['10@pbs2', '11@pbs1'])
+        self.assertEqual(result, {
+            '11@pbs1': '',
+            '10@pbs2': '',
+            # 両方のサーバーにある
+            '10': 'ambiguous JOB ID, use ID@server',
+            '99@x': 'No such JOB ID'})
+
+    def test_change(self):
+        #
+        # ジョブのサーバーでサーバーのジョブIDを指定して変更する
+        #
+        pbs2 = self.rec.servers['pbs2']
+        changed = self.joblists['pbs2'][0].replace(channel='16')
+        pbs2.change_channel = MagicMock(return_value=[changed])
+
+        joblist = self.rec.change_channel(
+            self.rec._qualify('pbs2', self.joblists['pbs2']), '16')
+        self.assertEqual(pbs2.change_channel.call_args[0][0][0]['rj_id'], '10')
+        self.assertEqual(joblist[0]['rj_id'], '10@pbs2')
+        self.assertEqual(joblist[0]['channel'], '16')
@@ -0,0 +1,454 @@
+from datetime import datetime, timedelta
+from subprocess import CalledProcessError, CompletedProcess
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from unittest import TestCase
+from unittest.mock import patch
+from fnmatch import fnmatch
+import os
+from freezegun import freeze_time
+from rjsched import RecordJobSystemd
+from rjsched.UnitIndex import UnitIndex
+
+UNIT_A = 'RJ.15.news.20200819202930.tt'
+UNIT_B = 'RJ.101.movie.20200819210000.bs'
+UNIT_C = 'RJ.16.removed.20200818200000.tt'
+
+class RecordJobSystemdTest(TestCase):
+    def setUp(self):
+        super(RecordJobSystemdTest, self).setUp()
+        config = {
+            'recpt1_path':    '/usr/local/bin/recpt1',
+            'recpt1ctl_path': '/usr/local/bin/recpt1ctl',
+            'recdir':         '/home/dummy/rec',
+            'channel_file':   '/home/dummy/.rj/channel.yml',}
+        self.rec = RecordJobSystemd.RecordJobSystemd(config)
+        self.rec.get_channel_list = lambda: {'15': 'MX', '101': 'NHKBS1'}
+        self.tmpdir = TemporaryDirectory()
+        self.rec.unitdir = self.tmpdir.name
+        self.indexdir = TemporaryDirectory()
+        self.rec.index = UnitIndex(
+            os.path.join(self.indexdir.name, 'systemd.index'),
+            self.tmpdir.name)
+        self.maxDiff = None
+
+        begin = datetime(2020, 8, 19, 20, 29, 30)
+        for unit, ch, title, begin, repeat in (
+                (UNIT_A, '15', 'news', begin, ''),
+                (UNIT_B, '101', 'movie', begin + timedelta(minutes=30),
+                    'weekly'),
+                (UNIT_C, '16', 'removed', begin - timedelta(days=1), '')):
+            path = os.path.join(self.tmpdir.name, unit)
+            self.rec._create_timer(path + '.timer', title, begin, repeat)
+            self.rec._create_service(
+                path + '.service', ch, title, timedelta(seconds=1770), repeat)
+        # ジョブ以外のユニットファイルは無視する
+        with open(os.path.join(self.tmpdir.name, 'other.service'), 'w') as f:
+            f.write('[Service]\nEnvironment="FOO=1"\n')
+
+        self.state = {
+            UNIT_A + '.timer': dedent("""\
+                Id={}.timer
+                ActiveState=active
+                NextElapseUSecRealtime=n/a
+                LastTriggerUSec=n/a
+                """).format(UNIT_A),
+            UNIT_A + '.service': dedent("""\
+                Id={}.service
+                ActiveState=inactive
+                MainPID=0
+                Environment=RJ_ch=15 RJ_walltime=1770
+                """).format(UNIT_A),
+            UNIT_B + '.timer': dedent("""\
+                Id={}.timer
+                ActiveState=active
+                NextElapseUSecRealtime=Wed 2020-08-26 20:59:30 JST
+                LastTriggerUSec=Wed 2020-08-19 20:59:30 JST
+                """).format(UNIT_B),
+            UNIT_B + '.service': dedent("""\
+                Id={}.service
+                ActiveState=inactive
+                MainPID=0
+                Environment=RJ_ch=101 RJ_walltime=1770
+                """).format(UNIT_B),
+            # rj removeで停止したジョブはユニットファイルのみ残る
+            UNIT_C + '.timer': dedent("""\
+                Id={}.timer
+                ActiveState=inactive
+                NextElapseUSecRealtime=n/a
+                LastTriggerUSec=n/a
+                """).format(UNIT_C),
+            UNIT_C + '.service': dedent("""\
+                Id={}.service
+                ActiveState=inactive
+                MainPID=0
+                Environment=RJ_ch=16 RJ_walltime=1770
+                """).format(UNIT_C),
+        }
+        self.commands = []
+
+    def tearDown(self):
+        super(RecordJobSystemdTest, self).tearDown()
+        self.tmpdir.cleanup()
+        self.indexdir.cleanup()
+
+    def run_systemctl(self, command, **kwargs):
+        self.commands.append(command)
+        # ワイルドカード指定にも対応する
+        stdout = '\n'.join(
+            self.state[i] for i in command if i in self.state) or '\n'.join(
+                self.state[k] for k in self.state
+                    if any(fnmatch(k, i) for i in command if '*' in i))
+        return CompletedProcess(command, 0, stdout, '')
+
+    def test_parse_show(self):
+        #
+        # systemctl showの出力をユニット毎の辞書にする
+        #
+        stdout = self.state[UNIT_A + '.timer'] + '\n' \
+            + self.state[UNIT_A + '.service']
+        self.assertEqual(self.rec._parse_show(stdout), [
+            {'Id': UNIT_A + '.timer',
+                'ActiveState': 'active',
+                'NextElapseUSecRealtime': 'n/a',
+                'LastTriggerUSec': 'n/a'},
+            {'Id': UNIT_A + '.service',
+                'ActiveState': 'inactive',
+                'MainPID': '0',
+                'Environment': 'RJ_ch=15 RJ_walltime=1770'},
+        ])
+
+    def test_scan_unit_files(self):
+        #
+        # ユニットファイルから必要な項目のみ読み込む
+        #
+        jobs = self.rec._scan_unit_files()
+        self.assertEqual(sorted(jobs), sorted([UNIT_A, UNIT_B, UNIT_C]))
+        self.assertEqual(jobs[UNIT_A], {
+            'tuner': 'tt',
+            'timer': {
+                'Description': 'RJ:ONESHOT: timer unit for news',
+                'OnCalendar': '2020-08-19 20:29:30',
+                'Names': UNIT_A + '.timer',
+                'FragmentPath': os.path.join(
+                    self.tmpdir.name, UNIT_A + '.timer')},
+            'service': {
+                'Description': 'RJ: service unit for news',
+                'Environment': 'RJ_ch=15 RJ_walltime=1770',
+                'Names': UNIT_A + '.service',
+                'FragmentPath': os.path.join(
+                    self.tmpdir.name, UNIT_A + '.service')},
+        })
+
+        # ユニット名を指定した場合はそのユニットのみ読み込む
+        jobs = self.rec._scan_unit_files([UNIT_B, 'RJ.1.none.20200101000000.tt'])
+        self.assertEqual(list(jobs), [UNIT_B])
+        self.assertEqual(jobs[UNIT_B]['tuner'], 'bs')
+
+    @freeze_time('2020-08-19 12:00:00')
+    def test_get_job_info(self):
+        #
+        # 動作中のジョブのみ、開始時刻順に返す
+        #
+        with patch.object(
+                RecordJobSystemd, 'run', side_effect=self.run_systemctl):
+            joblist = self.rec.get_job_info()
+
+        # systemctl showは実行時の状態のみ問い合わせる
+        self.assertEqual(len(self.commands), 1)
+        self.assertEqual(self.commands[0][:4], [
+            'systemctl', '--user', '--no-pager', 'show'])
+        self.assertTrue(self.commands[0][4].startswith('--property='))
+        self.assertEqual(len(self.commands[0]), 5 + 6)
+
+        self.assertEqual(
+            [i['rj_title'] for i in joblist], ['news', 'movie'])
+        news, movie = joblist
+        # NextElapseUSecRealtimeがn/aの場合はOnCalendarの時刻
+        self.assertEqual(news['rec_begin'], datetime(2020, 8, 19, 20, 29, 30))
+        self.assertEqual(news['rec_end'], datetime(2020, 8, 19, 20, 59, 0))
+        self.assertEqual(news['channel'], '15')
+        self.assertEqual(news['station_name'], 'MX')
+        self.assertEqual(news['walltime'], timedelta(seconds=1770))
+        self.assertEqual(news['repeat'], 'ONESHOT')
+        self.assertEqual(movie['rec_begin'], datetime(2020, 8, 26, 20, 59, 30))
+        self.assertEqual(movie['repeat'], 'WEEKLY')
+        self.assertEqual(movie['tuner'], 'bs')
+
+    def test_get_job_info_chunk(self):
+        #
+        # systemctl showはユニット数に応じて分割して実行する
+        #
+        self.rec.show_chunk = 4
+        with patch.object(
+                RecordJobSystemd, 'run', side_effect=self.run_systemctl):
+            joblist = self.rec.get_job_info()
+
+        self.assertEqual(len(self.commands), 2)
+        self.assertEqual(len(joblist), 2)
+
+    def test_get_job_info_fallback(self):
+        #
+        # unitdirを読めない場合はワイルドカード指定のsystemctl showを使う
+        #
+        self.rec.unitdir = os.path.join(self.tmpdir.name, 'none')
+        stdout = dedent("""\
+            Id={0}.timer
+            Names={0}.timer
+            Description=RJ:ONESHOT: timer unit for news
+            ActiveState=active
+            NextElapseUSecRealtime=Wed 2020-08-19 20:29:30 JST
+
+            Id={0}.service
+            Names={0}.service
+            Description=RJ: service unit for news
+            ActiveState=inactive
+            Environment=RJ_ch=15 RJ_walltime=1770
+            """).format(UNIT_A)
+        proc = CompletedProcess([], 0, stdout, '')
+        with patch.object(RecordJobSystemd, 'run', return_value=proc) as run:
+            joblist = self.rec.get_job_info()
+
+        self.assertEqual(run.call_args[0][0], [
+            'systemctl', '--user', '--all', '--no-pager', 'show',
+            'RJ.*.timer', 'RJ.*.service'])
+        self.assertEqual([i['rj_title'] for i in joblist], ['news'])
+        self.assertEqual(
+            joblist[0]['rec_begin'], datetime(2020, 8, 19, 20, 29, 30))
+
+    def test_add_many(self):
+        #
+        # ユニットファイルを全て作成してから、daemon-reloadと
+        # start/enableをそれぞれ一度だけ実行する
+        #
+        begin = datetime(2020, 8, 20, 20, 0, 0)
+        jobs = [
+            ('15', 'a', begin, timedelta(seconds=1770)),
+            ('101', 'b', begin, timedelta(seconds=1770), 'daily'),
+        ]
+        commands = []
+
+        def run_systemctl(command, **kwargs):
+            commands.append(command)
+            return CompletedProcess(command, 0, '', '')
+
+        self.rec.get_job_info = lambda: [
+            {'rj_id_long': self.rec._gen_unitname_jobid(*i[:3])[1]}
+                for i in jobs]
+        with patch.object(RecordJobSystemd, 'run', side_effect=run_systemctl):
+            joblist, results = self.rec.add_many(jobs)
+
+        timers = [
+            'RJ.15.a.20200820200000.tt.timer',
+            'RJ.101.b.20200820200000.bs.timer']
+        self.assertEqual(commands, [
+            ['systemctl', '--user', 'daemon-reload'],
+            ['systemctl', '--user', 'start'] + timers,
+            ['systemctl', '--user', 'enable'] + timers,
+        ])
+        for i in timers:
+            self.assertTrue(
+                os.path.exists(os.path.join(self.tmpdir.name, i)))
+        self.assertEqual(results, [(i['rj_id_long'], '') for i in joblist])
+        self.assertEqual(len(joblist), 2)
+
+    def test_add_many_error(self):
+        #
+        # まとめて実行したstartが失敗した場合は
+        # ユニットごとに実行し直してエラーを振り分ける
+        #
+        begin = datetime(2020, 8, 20, 20, 0, 0)
+        jobs = [
+            ('15', 'a', begin, timedelta(seconds=1770)),
+            ('16', 'b', begin, timedelta(seconds=1770)),
+        ]
+        failed = 'RJ.16.b.20200820200000.tt.timer'
+        commands = []
+
+        def run_systemctl(command, **kwargs):
+            commands.append(command)
+            if command[2] == 'start' and failed in command:
+                raise CalledProcessError(
+                    1, command, output='Failed to start {}\n'.format(failed))
+            return CompletedProcess(command, 0, '', '')
+
+        self.rec.get_job_info = lambda: [
+            {'rj_id_long': self.rec._gen_unitname_jobid(*i[:3])[1]}
+                for i in jobs]
+        with patch.object(RecordJobSystemd, 'run', side_effect=run_systemctl):
+            joblist, results = self.rec.add_many(jobs)
+
+        self.assertEqual(commands[-1], [
+            'systemctl', '--user', 'enable',
+            'RJ.15.a.20200820200000.tt.timer'])
+        self.assertEqual(len(joblist), 1)
+        self.assertTrue(results[0][0])
+        self.assertEqual(results[1], ('', 'Failed to start {}'.format(failed)))
+
+    def test_remove(self):
+        #
+        # 全ジョブのstop/disableをそれぞれ一度だけ実行し、
+        # (削除したジョブ情報リスト, ジョブIDごとの結果)を返す
+        #
+        unit_a = self.rec._gen_unitname_jobid(
+            '15', 'news', datetime(2020, 8, 19, 20, 29, 30))[1]
+        unit_b = self.rec._gen_unitname_jobid(
+            '101', 'movie', datetime(2020, 8, 19, 20, 59, 30))[1]
+        jobs = {
+            unit_a[:8]: {
+                'rj_id': unit_a[:8], 'rj_id_long': unit_a,
+                'timer': {'Names': UNIT_A + '.timer'},
+                'service': {'Names': UNIT_A + '.service'}},
+            unit_b: {
+                'rj_id': unit_b[:8], 'rj_id_long': unit_b,
+                'timer': {'Names': UNIT_B + '.timer'},
+                'service': {'Names': UNIT_B + '.service'}},
+        }
+        self.rec.get_job_info = lambda jid: [jobs[jid]] if jid in jobs else []
+        commands = []
+
+        def run_systemctl(command, **kwargs):
+            commands.append(command)
+            return CompletedProcess(command, 0, '', '')
+
+        with patch.object(RecordJobSystemd, 'run', side_effect=run_systemctl):
+            joblist, result = self.rec.remove(
+                [unit_a[:8], unit_b, 'XXXXXXXX'])
+
+        self.assertEqual(commands, [
+            ['systemctl', '--user', 'stop',
+                UNIT_A + '.timer', UNIT_B + '.timer',
+                UNIT_A + '.service', UNIT_B + '.service'],
+            ['systemctl', '--user', 'disable',
+                UNIT_A + '.timer', UNIT_B + '.timer'],
+        ])
+        self.assertEqual(joblist, [jobs[unit_a[:8]], jobs[unit_b]])
+        self.assertEqual(result, {
+            unit_a[:8]: '', unit_b[:8]: '', 'XXXXXXXX': 'No such JOB ID'})
+
+        # stopに失敗したジョブはエラーとする
+        def run_failed(command, **kwargs):
+            if UNIT_B + '.timer' in command:
+                raise CalledProcessError(1, command, output='Failed\n')
+            return CompletedProcess(command, 0, '', '')
+
+        with patch.object(RecordJobSystemd, 'run', side_effect=run_failed):
+            joblist, result = self.rec.remove(unit_b)
+        self.assertEqual(result, {unit_b[:8]: 'Failed'})
+
+    def test_batch(self):
+        #
+        # batch()の中の変更ではdaemon-reloadを一度だけ実行する
+        #
+        job = {
+            'rj_title': 'news',
+            'repeat': 'ONESHOT',
+            'rec_begin': datetime(2020, 8, 19, 20, 29, 30),
+            'timer': {'FragmentPath': os.path.join(
+                self.tmpdir.name, UNIT_A + '.timer')},
+        }
+        with patch.object(RecordJobSystemd, 'run') as run:
+            with self.rec.batch() as errors:
+                self.rec.change_begin(job, datetime(2020, 8, 19, 21, 0, 0))
+                self.rec.change_begin_delta(job, timedelta(minutes=1))
+                with self.rec.batch():
+                    self.rec.change_begin_delta(job, timedelta(minutes=2))
+                run.assert_not_called()
+
+        run.assert_called_once_with(
+            ['systemctl', '--user', 'daemon-reload'], check=True)
+        self.assertEqual(errors, {})
+        with open(job['timer']['FragmentPath']) as f:
+            self.assertIn('OnCalendar=2020-08-19 20:31:30\n', f.read())
+
+        # batch()の外では変更ごとに実行する
+        with patch.object(RecordJobSystemd, 'run') as run:
+            self.rec.change_begin(job, datetime(2020, 8, 19, 21, 0, 0))
+            self.rec.change_begin(job, datetime(2020, 8, 19, 21, 0, 0))
+        self.assertEqual(run.call_count, 2)
+
+    def test_get_job_info_jid(self):
+        #
+        # ジョブIDを指定した場合は対応するユニットのみ問い合わせる
+        #
+        rj_id_long = self.rec._gen_unitname_jobid(
+            '101', 'movie', datetime(2020, 8, 19, 21, 0, 0))[1]
+        with patch.object(
+                RecordJobSystemd, 'run', side_effect=self.run_systemctl):
+            joblist = self.rec.get_job_info(jid=rj_id_long[0:8])
+            self.assertEqual(self.commands[0][5:], [
+                UNIT_B + '.timer', UNIT_B + '.service'])
+            # チューナー数超過の確認用に全ジョブの状態を1回で問い合わせる
+            self.assertEqual(self.commands[1], self.rec.sctl_show_schedule)
+            self.assertEqual(len(self.commands), 2)
+            self.assertEqual([i['rj_title'] for i in joblist], ['movie'])
+
+            joblist = self.rec.get_job_info(jid=rj_id_long)
+            self.assertEqual([i['rj_title'] for i in joblist], ['movie'])
+
+            # 存在しないジョブIDはsystemctlを実行しない
+            self.commands = []
+            self.assertEqual(self.rec.get_job_info(jid='0123abcd'), [])
+            self.assertEqual(self.commands, [])
+
+    def test_get_job_info_jid_overlap(self):
+        #
+        # ジョブIDを指定した場合も、指定外のジョブとの重複で
+        # チューナー数を超過すれば警告する
+        #
+        UNIT_D = 'RJ.16.drama.20200819203000.tt'
+        path = os.path.join(self.tmpdir.name, UNIT_D)
+        self.rec._create_timer(
+            path + '.timer', 'drama', datetime(2020, 8, 19, 20, 30, 0))
+        self.rec._create_service(
+            path + '.service', '16', 'drama', timedelta(seconds=1770))
+        self.state[UNIT_D + '.timer'] = dedent("""\
+            Id={}.timer
+            ActiveState=active
+            NextElapseUSecRealtime=Wed 2020-08-19 20:30:00 JST
+            LastTriggerUSec=n/a
+            """).format(UNIT_D)
+        self.state[UNIT_D + '.service'] = dedent("""\
+            Id={}.service
+            ActiveState=inactive
+            MainPID=0
+            Environment=RJ_ch=16 RJ_walltime=1770
+            """).format(UNIT_D)
+        rj_id = self.rec._gen_unitname_jobid(
+            '16', 'drama', datetime(2020, 8, 19, 20, 30, 0))[1][0:8]
+
+        with patch.object(
+                RecordJobSystemd, 'run', side_effect=self.run_systemctl):
+            # 全ジョブ取得時と同じ警告になる
+            self.rec.tuner_tt_num = 1
+            joblist = self.rec.get_job_info()
+            self.assertEqual(
+                [(i['rj_title'], i.get('alert')) for i in joblist],
+                [('news', None), ('drama', 'Not enough tuners'),
+                    ('movie', None)])
+            joblist = self.rec.get_job_info(jid=rj_id)
+            self.assertEqual(
+                [(i['rj_title'], i.get('alert')) for i in joblist],
+                [('drama', 'Not enough tuners')])
+
+            self.rec.tuner_tt_num = 2
+            joblist = self.rec.get_job_info(jid=rj_id)
+            self.assertEqual(
+                [(i['rj_title'], i.get('alert')) for i in joblist],
+                [('drama', None)])
+
+    def test_index_add(self):
+        #
+        # add()で作成したジョブは対応表に追加する
+        #
+        self.rec.index.units()
+        with patch.object(RecordJobSystemd, 'run'):
+            rj_id_long = self.rec.add(
+                '15', 'added', datetime(2020, 8, 21, 20, 0, 0),
+                timedelta(seconds=1770))
+
+        with patch.object(self.rec.index, 'rebuild') as rebuild:
+            self.assertEqual(
+                self.rec.index.lookup([rj_id_long]),
+                ['RJ.15.added.20200821200000.tt'])
+            rebuild.assert_not_called()
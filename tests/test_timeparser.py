@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+from rjsched.TimeParser import (
+    parse_asctime, parse_oncalendar, parse_systemd_time, parse_walltime)
+
+class TimeParserTest(TestCase):
+    def test_parse_asctime(self):
+        #
+        # datetime.strptime()と同じ結果になることを確認
+        #
+        fmt = "%a %b %d %H:%M:%S %Y"
+        for i in [
+            'Sun Aug 16 20:00:00 2020',
+            'Wed Jan  1 00:00:00 2020',
+            'Thu Dec 31 23:59:59 2020',]:
+            self.assertEqual(parse_asctime(i), datetime.strptime(i, fmt))
+
+        for i in [
+            '', 'Sun Aug 16 20:00 2020', 'Sun Foo 16 20:00:00 2020',
+            'Sun Aug 32 20:00:00 2020', 'Sun Aug 16 24:00:00 2020', None]:
+            with self.assertRaises(ValueError):
+                parse_asctime(i)
+
+    def test_parse_systemd_time(self):
+        #
+        # タイムゾーン名は無視する
+        #
+        expected = datetime(2020, 8, 16, 20, 0, 0)
+        self.assertEqual(
+            parse_systemd_time('Sun 2020-08-16 20:00:00 JST'), expected)
+        self.assertEqual(
+            parse_systemd_time('Sun 2020-08-16 20:00:00 UTC'), expected)
+
+        for i in ['', 'Sun 2020/08/16 20:00:00 JST', 'n/a']:
+            with self.assertRaises(ValueError):
+                parse_systemd_time(i)
+
+    def test_parse_oncalendar(self):
+        #
+        # datetime.strptime()と同じ結果になることを確認
+        #
+        fmt = '%Y-%m-%d %H:%M:%S'
+        for i in ['2020-08-16 20:00:00', '2021-01-01 00:00:00']:
+            self.assertEqual(parse_oncalendar(i), datetime.strptime(i, fmt))
+
+        for i in [
+            '', 'Sun 2020-08-16 20:00:00', '2020-08-16', 'Sun *-*-* 20:00:00',
+            '2020-13-16 20:00:00', None]:
+            with self.assertRaises(ValueError):
+                parse_oncalendar(i)
+
+    def test_parse_walltime(self):
+        self.assertEqual(parse_walltime('00:29:30'), timedelta(seconds=1770))
+        self.assertEqual(parse_walltime('100:00:00'), timedelta(hours=100))
+
+        for i in ['', '29:30', '00:aa:00', None]:
+            with self.assertRaises(ValueError):
+                parse_walltime(i)
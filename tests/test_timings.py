@@ -0,0 +1,57 @@
+from unittest import TestCase
+from unittest.mock import patch
+import io
+import rjsched
+from rjsched.Timings import Timings
+
+class TimingsTest(TestCase):
+    def setUp(self):
+        super(TimingsTest, self).setUp()
+        self.timings = Timings()
+
+    def test_disabled(self):
+        #
+        # 計測を開始していなければ何も記録しない
+        #
+        with self.timings.phase('foo'):
+            pass
+        self.timings.command(['qstat'], 0.1)
+        self.assertEqual(self.timings.phases, [])
+        self.assertEqual(self.timings.commands, [])
+
+        out = io.StringIO()
+        self.timings.report(out)
+        self.assertEqual(out.getvalue(), '')
+
+    def test_phase(self):
+        #
+        # 入れ子の段階と外部コマンドの待ち時間を記録する
+        #
+        self.timings.start(memory=False)
+        with self.timings.phase('list'):
+            with self.timings.phase('render'):
+                pass
+        self.timings.command(['/opt/pbs/bin/qstat', '-f'], 0.25)
+
+        self.assertEqual(
+            [i[:2] for i in self.timings.phases], [['list', 0], ['render', 1]])
+
+        out = io.StringIO()
+        self.timings.report(out)
+        summary = out.getvalue()
+        self.assertIn('  list', summary)
+        self.assertIn('    render', summary)
+        self.assertIn('commands (1)', summary)
+        self.assertIn('qstat -f', summary)
+        self.assertIn('250.0 ms', summary)
+
+    def test_run_command(self):
+        #
+        # _run_command()の実行時間が記録される
+        #
+        self.timings.start(memory=False)
+        rec = rjsched.RecordJob({})
+        with patch('rjsched.timings', self.timings):
+            rec._run_command(['echo', 'foo'], log=False)
+        self.assertEqual(len(self.timings.commands), 1)
+        self.assertEqual(self.timings.commands[0][0], ['echo', 'foo'])
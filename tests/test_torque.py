@@ -0,0 +1,284 @@
+from unittest import TestCase
+from rjsched import RecordJobTorque
+from unittest.mock import patch, MagicMock
+from datetime import datetime, timedelta
+from textwrap import dedent
+from freezegun import freeze_time
+from subprocess import CalledProcessError, TimeoutExpired
+import time
+
+QSTAT = dedent("""\
+    Job Id: 101.torque.example.org
+        Job_Name = 15.news
+        Job_Owner = autumn@torque.example.org
+        job_state = W
+        queue = tt
+        server = torque.example.org
+        ctime = Sun Aug 16 12:00:00 2020
+        Execution_Time = Sun Aug 16 22:00:00 2020
+        mtime = Sun Aug 16 12:00:00 2020
+        qtime = Sun Aug 16 12:00:00 2020
+        Resource_List.walltime = 00:29:30
+        Variable_List = PBS_O_QUEUE=tt,PBS_O_HOME=/home/autumn
+        euser = autumn
+        egroup = video
+
+    Job Id: 100.torque.example.org
+        Job_Name = 181.anime title
+        Job_Owner = autumn@torque.example.org
+        job_state = R
+        queue = bs
+        ctime = Sun Aug 16 12:00:00 2020
+        exec_host = node1/0
+        mtime = Sun Aug 16 20:00:05 2020
+        qtime = Sun Aug 16 12:00:00 2020
+        Resource_List.walltime = 01:00:00
+        start_time = Sun Aug 16 20:00:00 2020
+
+    Job Id: 102.torque.example.org
+        Job_Name = STDIN
+        Job_Owner = winter@torque.example.org
+        job_state = Q
+        queue = batch
+        ctime = Sun Aug 16 12:00:00 2020
+        mtime = Sun Aug 16 12:00:00 2020
+        qtime = Sun Aug 16 12:00:00 2020
+        Resource_List.walltime = 00:10:00
+    """)
+
+PBSNODES = dedent("""\
+    node1
+         state = free
+         np = 2
+         properties = tt
+         ntype = cluster
+
+    node2
+         state = job-exclusive
+         np = 1
+         properties = bs
+
+    node3
+         state = down,offline
+         np = 4
+         properties = tt
+
+    """)
+
+class RecordJobTorqueTest(TestCase):
+    def setUp(self):
+        super(RecordJobTorqueTest, self).setUp()
+        config = {
+            'recpt1_path':    '/usr/local/bin/recpt1',
+            'recpt1ctl_path': '/usr/local/bin/recpt1ctl',
+            'recdir':         '/home/dummy/rec',
+            'channel_file':   '/home/dummy/.rj/channel.yml',
+            'pbsexec_dir':    '/work/torque/bin',
+            'joblog_dir':     '/home/dummy/log',}
+        self.rec = RecordJobTorque.RecordJobTorque(config)
+        self.rec.get_channel_list = MagicMock(
+            return_value={'15': 'TT15', '181': 'BS181'})
+        self.maxDiff = None
+
+    def tearDown(self):
+        super(RecordJobTorqueTest, self).tearDown()
+
+    def test_classname(self):
+        self.assertEqual(str(self.rec), 'RecordJobTorque')
+
+    def test_parse_qstat(self):
+        #
+        # ジョブごとに必要な属性のみが取り出されることを確認
+        #
+        jobs = list(self.rec._parse_qstat(iter(QSTAT.splitlines(True))))
+        self.assertEqual([i[0] for i in jobs], ['101', '100', '102'])
+        self.assertEqual(jobs[0][1], {
+            'Job_Name': '15.news',
+            'Job_Owner': 'autumn@torque.example.org',
+            'job_state': 'W',
+            'queue': 'tt',
+            'ctime': 'Sun Aug 16 12:00:00 2020',
+            'Execution_Time': 'Sun Aug 16 22:00:00 2020',
+            'mtime': 'Sun Aug 16 12:00:00 2020',
+            'qtime': 'Sun Aug 16 12:00:00 2020',
+            'Resource_List.walltime': '00:29:30',
+            'euser': 'autumn',
+            'egroup': 'video'})
+
+    @freeze_time('2020-08-16 20:03:00')
+    def test_build_joblist(self):
+        #
+        # qstat -f -1の出力からOpenPBSバックエンドと同じキーの
+        # ジョブ情報が組み立てられることを確認
+        #
+        self.rec._build_joblist(iter(QSTAT.splitlines(True)))
+        created = datetime(2020, 8, 16, 12, 0, 0)
+        expected = [
+            {
+                'rj_id': '100',
+                'channel': '181',
+                'rj_title': 'anime title',
+                'station_name': 'BS181',
+                'walltime': timedelta(hours=1),
+                'rec_begin': datetime(2020, 8, 16, 20, 0, 0),
+                'rec_end': datetime(2020, 8, 16, 21, 0, 0),
+                'record_state': 'Recording',
+                'elapse': timedelta(minutes=3),
+                'exec_host': 'node1',
+                'tuner': 'bs',
+                'user': 'autumn',
+                'group': None,
+                'qtime': created,
+                'ctime': created,
+                'mtime': datetime(2020, 8, 16, 20, 0, 5),
+                'alert': ''},
+            {
+                'rj_id': '102',
+                'channel': '0',
+                'rj_title': 'STDIN',
+                'station_name': '',
+                'walltime': timedelta(minutes=10),
+                'rec_begin': datetime(2020, 8, 16, 20, 3, 0),
+                'rec_end': datetime(2020, 8, 16, 20, 13, 0),
+                'record_state': 'Queued',
+                'elapse': None,
+                'tuner': 'not_rec_job',
+                'user': 'winter',
+                'group': None,
+                'qtime': created,
+                'ctime': created,
+                'mtime': created,
+                'alert': ''},
+            {
+                'rj_id': '101',
+                'channel': '15',
+                'rj_title': 'news',
+                'station_name': 'TT15',
+                'walltime': timedelta(minutes=29, seconds=30),
+                'rec_begin': datetime(2020, 8, 16, 22, 0, 0),
+                'rec_end': datetime(2020, 8, 16, 22, 29, 30),
+                'record_state': 'Waiting',
+                'elapse': None,
+                'tuner': 'tt',
+                'user': 'autumn',
+                'group': 'video',
+                'qtime': created,
+                'ctime': created,
+                'mtime': created,
+                'alert': ''}]
+        self.assertEqual([dict(i) for i in self.rec.joblist], expected)
+
+    def test_parse_pbsnodes(self):
+        #
+        # 稼動中のノードのチューナー数がキュー名ごとに集計されることを確認
+        #
+        tuners = self.rec._parse_pbsnodes(iter(PBSNODES.splitlines(True)))
+        self.assertEqual(tuners, {'tt': 2, 'bs': 1})
+
+    def test_check_tuner_resource(self):
+        #
+        # 同時録画数がチューナー数を超えたジョブに警告がつき、
+        # 実行終了したジョブは集計されないことを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        self.rec.joblist = [
+            {'rj_id': '1', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'record_state': 'Completed', 'alert': ''},
+            {'rj_id': '2', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'record_state': 'Waiting', 'alert': ''},
+            {'rj_id': '3', 'tuner': 'tt', 'rec_begin': t22, 'rec_end': t23,
+                'record_state': 'Waiting', 'alert': ''}]
+        self.rec._check_tuner_resource({'tt': 1, 'bs': 1})
+        alerts = [i.get('alert') for i in self.rec.joblist]
+        self.assertEqual(alerts, ['', '', 'Out of Tuners. Max: 1'])
+
+    def test_command_not_modified(self):
+        #
+        # ジョブID指定のqstat、qalterを繰り返し実行しても
+        # コマンドラインが伸びていかないことを確認
+        #
+        qstat = ['/work/torque/bin/qstat', '-f', '-1']
+        commands = []
+
+        def stream(command):
+            commands.append(command)
+            return iter(QSTAT.splitlines(True))
+
+        self.rec._stream_command = MagicMock(side_effect=stream)
+        self.rec.get_job_list('101')
+        self.rec.get_job_list('102')
+        self.assertEqual(commands, [
+            qstat + ['101'], ['/work/torque/bin/pbsnodes', '-a'],
+            qstat + ['102'], ['/work/torque/bin/pbsnodes', '-a']])
+        self.assertEqual(self.rec.qstat, qstat)
+
+        # 数字以外のジョブIDはqstatに渡さない
+        commands.clear()
+        self.rec._check_tuner_resource = MagicMock()
+        self.assertEqual(self.rec.get_job_list('-x'), [])
+        self.assertEqual(commands, [])
+
+        job = [{'rj_id': '101', 'rec_begin': datetime(2020, 8, 16, 22, 0, 0)}]
+        with patch.object(RecordJobTorque, 'Popen') as popen:
+            self.rec.mod_begintime(job, time_delta=timedelta(minutes=1))
+            self.rec.mod_begintime(job, time_delta=timedelta(minutes=2))
+        self.assertEqual(popen.call_args_list[0][0][0], [
+            '/work/torque/bin/qalter', '-a', '202008162201.00', '101'])
+        self.assertEqual(popen.call_args_list[1][0][0], [
+            '/work/torque/bin/qalter', '-a', '202008162202.00', '101'])
+        self.assertEqual(self.rec.qalter, ['/work/torque/bin/qalter', '-a'])
+
+    def test_stream_command(self):
+        #
+        # コマンドの出力が1行ずつ返ることを確認
+        #
+        lines = list(self.rec._stream_command(
+            ['printf', 'Job Id: 1.example\\n    queue = tt\\n']))
+        self.assertEqual(lines, ['Job Id: 1.example\n', '    queue = tt\n'])
+
+        # コマンドがない場合はOSError
+        with self.assertRaises(OSError):
+            list(self.rec._stream_command(['/nonexistent/qstat']))
+
+    def test_stream_command_timeout(self):
+        #
+        # 出力の途中で止まったコマンドはcomm_timeout秒でkillされ、
+        # TimeoutExpiredとなることを確認
+        #
+        self.rec.comm_timeout = 0.5
+        lines = []
+        begin = time.monotonic()
+        with self.assertRaises(TimeoutExpired):
+            for line in self.rec._stream_command(
+                    ['sh', '-c', 'echo "Job Id: 1.example"; exec sleep 10']):
+                lines.append(line)
+        self.assertLess(time.monotonic() - begin, 5)
+        self.assertEqual(lines, ['Job Id: 1.example\n'])
+
+    def test_stream_command_error(self):
+        #
+        # 終了ステータスが0以外の場合は標準エラー出力とともに
+        # CalledProcessErrorとなることを確認
+        #
+        command = ['sh', '-c', 'echo out; echo "qstat: error" >&2; exit 3']
+        lines = []
+        with self.assertRaises(CalledProcessError) as cm:
+            for line in self.rec._stream_command(command):
+                lines.append(line)
+        self.assertEqual(lines, ['out\n'])
+        self.assertEqual(cm.exception.returncode, 3)
+        self.assertEqual(cm.exception.stderr, 'qstat: error\n')
+
+        # 全ジョブのqstatが失敗した場合は空のジョブ情報リストとせず送出する
+        def stream(command):
+            yield from QSTAT.splitlines(True)
+            raise CalledProcessError(1, command, stderr='qstat: error')
+
+        self.rec._stream_command = MagicMock(side_effect=stream)
+        with self.assertRaises(CalledProcessError):
+            self.rec._fetch_joblist()
+
+        # ジョブID指定の場合は存在しないジョブとして扱う
+        self.rec._fetch_joblist('999')
+        self.assertEqual(self.rec.joblist, [])
@@ -0,0 +1,210 @@
+from datetime import datetime
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import json
+import os
+import tsverify
+
+def packet(pid, cc, payload=True, tei=False, pcr=None, discontinuity=False):
+    """
+    188バイトのTSパケットを作成する
+    pcrを指定した場合はadaptation fieldにPCRを入れる
+    """
+    afc = 0x1 if payload else 0x0
+    adaptation = b''
+    if pcr is not None or discontinuity:
+        afc |= 0x2
+        flags = 0x80 if discontinuity else 0x00
+        field = b''
+        if pcr is not None:
+            flags |= 0x10
+            base, ext = divmod(pcr, 300)
+            field = bytes([
+                (base >> 25) & 0xFF, (base >> 17) & 0xFF, (base >> 9) & 0xFF,
+                (base >> 1) & 0xFF, ((base & 0x1) << 7) | 0x7E | (ext >> 8),
+                ext & 0xFF])
+        body = bytes([flags]) + field
+        if not payload:
+            body += b'\xff' * (183 - len(body))
+        adaptation = bytes([len(body)]) + body
+    header = bytes([
+        0x47,
+        (0x80 if tei else 0x00) | (pid >> 8),
+        pid & 0xFF,
+        (afc << 4) | (cc & 0xF)])
+    data = header + adaptation
+    return data + b'\xff' * (188 - len(data))
+
+def stream(seconds, pcr_pid=0x100, pids=(0x100, 0x110)):
+    """
+    0.1秒ごとにPCRを入れた正常なTSを作成する
+    """
+    packets = []
+    counters = {pid: 0 for pid in pids}
+    for i in range(int(seconds * 10) + 1):
+        for pid in pids:
+            pcr = i * tsverify.PCR_HZ // 10 if pid == pcr_pid else None
+            packets.append(packet(pid, counters[pid], pcr=pcr))
+            counters[pid] = (counters[pid] + 1) & 0xF
+    return b''.join(packets)
+
+class TsVerifyTest(TestCase):
+    def setUp(self):
+        super(TsVerifyTest, self).setUp()
+        self.maxDiff = None
+
+    def tearDown(self):
+        super(TsVerifyTest, self).tearDown()
+
+    def test_parse_filename(self):
+        #
+        # 録画ファイル名から番組名、チャンネル番号、録画開始時刻、
+        # ジョブIDが取り出されることを確認
+        #
+        self.assertEqual(
+            tsverify.parse_filename('/rec/news.ver2.15.20200816_2200.00.123.ts'),
+            {
+                'title': 'news.ver2',
+                'channel': '15',
+                'date': datetime(2020, 8, 16, 22, 0, 0),
+                'jobid': '123'})
+        self.assertIsNone(tsverify.parse_filename('/rec/news.ts'))
+        self.assertIsNone(
+            tsverify.parse_filename('/rec/news.15.20201316_2200.00.1.ts'))
+
+    def test_job_key(self):
+        #
+        # ゼロ埋めしたジョブIDも同じキーになり、
+        # 数字以外のジョブIDはNoneとなることを確認
+        #
+        self.assertEqual(tsverify.job_key('0012'), '12')
+        self.assertEqual(tsverify.job_key('12'), '12')
+        self.assertIsNone(tsverify.job_key('d39bb99c'))
+        self.assertIsNone(tsverify.job_key(None))
+
+    def test_scan_clean(self):
+        #
+        # 正常なTSではエラーがなく、PCRから録画時間が求まることを確認
+        #
+        data = stream(3)
+        result = tsverify.scan_packets(data, len(data))
+        self.assertEqual(result, {
+            'size': len(data),
+            'packets': 62,
+            'offset': 0,
+            'trailing_bytes': 0,
+            'sync_errors': 0,
+            'cc_errors': 0,
+            'tei_packets': 0,
+            'pids': 2,
+            'pcr_pid': 0x100,
+            'pcr_gaps': 0,
+            'duration': 3.0})
+
+    def test_scan_errors(self):
+        #
+        # 同期バイト、continuity_counter、TEIの異常が数えられることを確認
+        #
+        packets = [
+            packet(0x100, 0, pcr=0),
+            packet(0x100, 1),
+            # 再送パケットは許容する
+            packet(0x100, 1),
+            # 抜け
+            packet(0x100, 3),
+            # ペイロードのないパケットはカウンターが増えない
+            packet(0x100, 3, payload=False, pcr=tsverify.PCR_HZ),
+            packet(0x100, 4, tei=True),
+            # discontinuity_indicatorが立っていれば連続性を問わない
+            packet(0x100, 9, discontinuity=True),
+            packet(0x100, 10),
+            # 同期バイトの欠落
+            b'\x00' + packet(0x100, 11)[1:],
+            packet(0x1FFF, 5),
+            packet(0x1FFF, 0),
+        ]
+        # 先頭のゴミと末尾の半端なパケット
+        data = b'\x00\x01' + b''.join(packets) + b'\x47\x01'
+        result = tsverify.scan_packets(data, len(data))
+        self.assertEqual(result['offset'], 2)
+        self.assertEqual(result['packets'], 11)
+        self.assertEqual(result['trailing_bytes'], 2)
+        self.assertEqual(result['sync_errors'], 1)
+        self.assertEqual(result['cc_errors'], 1)
+        self.assertEqual(result['tei_packets'], 1)
+        self.assertEqual(result['pids'], 1)
+        self.assertEqual(result['duration'], 1.0)
+
+    def test_pcr_wrap(self):
+        #
+        # PCRが一周しても録画時間が求まることを確認
+        #
+        last = tsverify.PCR_WRAP - tsverify.PCR_HZ // 2
+        data = packet(0x100, 0, pcr=last) \
+            + packet(0x100, 1, pcr=tsverify.PCR_HZ // 2)
+        result = tsverify.scan_packets(data, len(data))
+        self.assertEqual(result['duration'], 1.0)
+        self.assertEqual(result['pcr_gaps'], 0)
+
+        # PCRが戻る、または大きく飛ぶ区間は録画時間に含めない
+        data = stream(2) + stream(3) \
+            + packet(0x100, 0, pcr=60 * tsverify.PCR_HZ)
+        result = tsverify.scan_packets(data, len(data))
+        self.assertEqual(result['duration'], 5.0)
+        self.assertEqual(result['pcr_gaps'], 2)
+
+    def test_verify_file(self):
+        #
+        # walltimeより録画時間が短い場合にNGとなり、
+        # 検査結果がverify.jsonに書き出されることを確認
+        #
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'news.15.20200816_2200.00.123.ts')
+            with open(path, 'wb') as f:
+                f.write(stream(30))
+
+            result = tsverify.verify_file(path, walltime=35)
+            self.assertTrue(result['ok'])
+            self.assertEqual(result['jobid'], '123')
+            self.assertTrue(tsverify.is_verified(path))
+            with open(path + tsverify.SUFFIX) as f:
+                self.assertEqual(json.load(f), result)
+
+            result = tsverify.verify_file(path, walltime=60, write=False)
+            self.assertFalse(result['ok'])
+            self.assertEqual(result['problems'], ['short: 30.0s of 60s'])
+
+            # 空のファイル
+            empty = os.path.join(tmpdir, 'empty.15.20200816_2200.00.124.ts')
+            open(empty, 'wb').close()
+            result = tsverify.verify_file(empty, write=False)
+            self.assertEqual(result['problems'], ['no packets'])
+
+            # 存在しないファイル
+            result = tsverify.verify_file(
+                os.path.join(tmpdir, 'none.ts'), write=False)
+            self.assertFalse(result['ok'])
+
+    def test_verify_files(self):
+        #
+        # プロセスプールで検査した結果がファイルの順に返り、
+        # ジョブIDに対応するwalltimeと比較されることを確認
+        # 録画ファイル名のゼロ埋めしたジョブIDでも引けること
+        #
+        with TemporaryDirectory() as tmpdir:
+            paths = []
+            for i, seconds in enumerate((5, 3, 4)):
+                path = os.path.join(
+                    tmpdir, 'title.15.20200816_2200.00.{:04d}.ts'.format(i))
+                with open(path, 'wb') as f:
+                    f.write(stream(seconds))
+                paths.append(path)
+
+            results = tsverify.verify_files(
+                paths, {'1': 20}, tolerance=1, workers=2)
+            self.assertEqual([i['file'] for i in results], paths)
+            self.assertEqual(
+                [i['duration'] for i in results], [5.0, 3.0, 4.0])
+            self.assertEqual([i['ok'] for i in results], [True, False, True])
+            for path in paths:
+                self.assertTrue(os.path.exists(path + tsverify.SUFFIX))
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+from rjsched.TunerPlacement import TunerPlacement
+
+def job(tuner, begin, end, exec_host=None):
+    j = {'tuner': tuner, 'rec_begin': begin, 'rec_end': end}
+    if exec_host:
+        j['exec_host'] = exec_host
+    return j
+
+class TunerPlacementTest(TestCase):
+    def setUp(self):
+        super(TunerPlacementTest, self).setUp()
+        self.maxDiff = None
+        self.t22 = datetime(2020, 8, 16, 22, 0, 0)
+        self.t23 = datetime(2020, 8, 16, 23, 0, 0)
+
+    def tearDown(self):
+        super(TunerPlacementTest, self).tearDown()
+
+    def test_first_fit(self):
+        #
+        # ノード名順に空きのあるノードに割り当てられ、
+        # どのノードにも空きがないジョブのみが返ることを確認
+        #
+        t22, t23 = self.t22, self.t23
+        joblist = [
+            job('tt', t22, t23),
+            job('tt', t22, t23),
+            job('tt', t22, t23),
+            job('bs', t22, t23),
+            job('not_rec_job', t22, t23),
+            # 境界値。終了時刻と同時刻に開始するジョブは重複とみなす
+            job('tt', t23, t23 + timedelta(hours=1)),
+            job('tt', t23 + timedelta(seconds=1), t23 + timedelta(hours=1)),
+        ]
+        placement = TunerPlacement({
+            'node2': {'tt': 1, 'bs': 0},
+            'node1': {'tt': 1, 'bs': 1}})
+        self.assertEqual(
+            placement.check(joblist),
+            [(2, ['node1', 'node2']), (5, ['node1', 'node2'])])
+        self.assertEqual(placement.placement, {
+            0: 'node1', 1: 'node2', 3: 'node1', 6: 'node1'})
+
+    def test_exec_host(self):
+        #
+        # 実行中のジョブは実行ノードに固定され、
+        # 合計では空きがあってもノードの空きがなければ返ることを確認
+        #
+        t22, t23 = self.t22, self.t23
+        joblist = [
+            job('tt', t22, t23, 'node1'),
+            job('tt', t22, t23, 'node1'),
+            job('tt', t22, t23),
+            # 録画ノード以外で実行中のジョブは固定しない
+            job('tt', t22, t23, 'dummy'),
+        ]
+        placement = TunerPlacement({
+            'node1': {'tt': 1},
+            'node2': {'tt': 2}})
+        self.assertEqual(placement.check(joblist), [(1, ['node1'])])
+        self.assertEqual(placement.placement, {
+            0: 'node1', 1: 'node1', 2: 'node2', 3: 'node2'})
+
+    def test_pinned_first(self):
+        #
+        # 同じ開始時刻では実行中のジョブが先に割り当てられることを確認
+        #
+        t22, t23 = self.t22, self.t23
+        joblist = [
+            job('tt', t22, t23),
+            job('tt', t22, t23, 'node1'),
+        ]
+        placement = TunerPlacement({
+            'node1': {'tt': 1},
+            'node2': {'tt': 1}})
+        self.assertEqual(placement.check(joblist), [])
+        self.assertEqual(placement.placement, {0: 'node2', 1: 'node1'})
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+from rjsched.TunerTimeline import TunerTimeline
+
+def job(tuner, begin, end):
+    return {'tuner': tuner, 'rec_begin': begin, 'rec_end': end}
+
+class TunerTimelineTest(TestCase):
+    def setUp(self):
+        super(TunerTimelineTest, self).setUp()
+        self.maxDiff = None
+
+    def tearDown(self):
+        super(TunerTimelineTest, self).tearDown()
+
+    def test_check(self):
+        #
+        # チューナー数を超過した時点で開始するジョブのみが返ることを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        joblist = [
+            job('tt', t22, t23),
+            job('tt', t22, t23),
+            job('tt', t22, t23),
+            job('bs', t22, t23),
+            job('not_rec_job', t22, t23),
+            # 境界値。終了時刻と同時刻に開始するジョブは重複とみなす
+            job('tt', t23, t23 + timedelta(hours=1)),
+            job('tt', t23 + timedelta(seconds=1), t23 + timedelta(hours=1)),
+        ]
+        timeline = TunerTimeline({'tt': 2, 'bs': 2})
+        self.assertEqual(timeline.check(joblist), [2, 5])
+        self.assertEqual(timeline.peak, {'tt': 4, 'bs': 1})
+
+    def test_unsorted(self):
+        #
+        # 開始時刻順に並んでいないジョブリストでも正しく集計されることを確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        joblist = [
+            job('tt', t22 + timedelta(minutes=10), t22 + timedelta(minutes=40)),
+            job('tt', t22, t22 + timedelta(minutes=30)),
+        ]
+        timeline = TunerTimeline({'tt': 1})
+        self.assertEqual(timeline.check(joblist), [0])
+
+    def test_timeline(self):
+        #
+        # 同時録画数の変化点と任意時刻の同時録画数を確認
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t2230 = datetime(2020, 8, 16, 22, 30, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        joblist = [
+            job('tt', t22, t23),
+            job('tt', t22, t2230),
+            job('tt', t2230 + timedelta(seconds=1), t23),
+        ]
+        timeline = TunerTimeline({'tt': 2})
+        self.assertEqual(timeline.check(joblist), [])
+        self.assertEqual(timeline.timeline['tt'], [
+            (t22, 2),
+            (t2230, 1),
+            (t2230 + timedelta(seconds=1), 2),
+            (t23, 0)])
+
+        self.assertEqual(timeline.at('tt', t22 - timedelta(seconds=1)), 0)
+        self.assertEqual(timeline.at('tt', t22), 2)
+        self.assertEqual(timeline.at('tt', t22 + timedelta(minutes=45)), 2)
+        # 終了時刻ちょうどは録画中として数える
+        self.assertEqual(timeline.at('tt', t2230), 2)
+        self.assertEqual(timeline.at('tt', t2230 + timedelta(seconds=1)), 2)
+        self.assertEqual(timeline.at('tt', t23), 2)
+        self.assertEqual(timeline.at('tt', t23 + timedelta(seconds=1)), 0)
+        self.assertEqual(timeline.at('bs', t22), 0)
+
+    def test_at_boundary(self):
+        #
+        # 終了時刻と同時刻に開始するジョブがある場合も、
+        # at()はcheck()と同じく重複として数える
+        #
+        t22 = datetime(2020, 8, 16, 22, 0, 0)
+        t23 = datetime(2020, 8, 16, 23, 0, 0)
+        t24 = datetime(2020, 8, 17, 0, 0, 0)
+        joblist = [
+            job('tt', t22, t23),
+            job('tt', t23, t24),
+        ]
+        timeline = TunerTimeline({'tt': 1})
+        self.assertEqual(timeline.check(joblist), [1])
+        self.assertEqual(timeline.at('tt', t23), 2)
+        self.assertEqual(timeline.at('tt', t23 + timedelta(seconds=1)), 1)
+        self.assertEqual(timeline.at('tt', t24), 1)
+        self.assertEqual(timeline.at('tt', t24 + timedelta(seconds=1)), 0)
+
+    def test_large(self):
+        #
+        # 大量のジョブでもチューナー数以内であれば警告がつかないことを確認
+        #
+        begin = datetime(2020, 1, 1, 0, 0, 0)
+        joblist = []
+        for i in range(20000):
+            b = begin + timedelta(minutes=30 * (i // 2))
+            joblist.append(job('tt', b, b + timedelta(minutes=29)))
+        timeline = TunerTimeline({'tt': 2})
+        self.assertEqual(timeline.check(joblist), [])
+        self.assertEqual(timeline.peak, {'tt': 2})
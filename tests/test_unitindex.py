@@ -0,0 +1,93 @@
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import hashlib
+import os
+from rjsched.UnitIndex import UnitIndex
+
+class UnitIndexTest(TestCase):
+    def setUp(self):
+        super(UnitIndexTest, self).setUp()
+        self.tmpdir = TemporaryDirectory()
+        self.unitdir = os.path.join(self.tmpdir.name, 'user')
+        self.path = os.path.join(self.tmpdir.name, 'rj', 'systemd.index')
+        os.mkdir(self.unitdir)
+        self.unit = 'RJ.15.news.20200819202930.tt'
+        self.create(self.unit)
+        self.index = UnitIndex(self.path, self.unitdir)
+
+    def tearDown(self):
+        super(UnitIndexTest, self).tearDown()
+        self.tmpdir.cleanup()
+
+    def create(self, unit):
+        for suffix in ('.timer', '.service'):
+            with open(os.path.join(self.unitdir, unit + suffix), 'w') as f:
+                f.write('')
+
+    def rj_id_long(self, unit):
+        return hashlib.sha256(unit.encode('utf-8')).hexdigest()
+
+    def test_lookup(self):
+        #
+        # 8文字のジョブIDとジョブIDのどちらでもユニット名を得る
+        #
+        rj_id_long = self.rj_id_long(self.unit)
+        self.assertEqual(self.index.lookup([rj_id_long[0:8]]), [self.unit])
+        self.assertEqual(self.index.lookup([rj_id_long]), [self.unit])
+        self.assertEqual(self.index.lookup(['0123abcd']), [])
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_reuse(self):
+        #
+        # unitdirが変更されていなければファイルの対応表を使う
+        #
+        self.index.units()
+        with patch.object(self.index, 'rebuild') as rebuild:
+            self.index.units()
+            rebuild.assert_not_called()
+
+    def test_rebuild(self):
+        #
+        # rj以外でユニットファイルが追加された場合は対応表を作り直す
+        #
+        self.index.units()
+        unit = 'RJ.16.other.20200819202930.tt'
+        self.create(unit)
+        os.utime(self.unitdir, ns=(0, 0))
+        self.assertEqual(
+            self.index.lookup([self.rj_id_long(unit)]), [unit])
+
+    def test_add(self):
+        #
+        # 対応表が最新の場合のみ追加したユニットを反映する
+        #
+        self.index.units()
+        unit = 'RJ.16.added.20200819202930.tt'
+        before = self.index.mtime()
+        self.create(unit)
+        os.utime(self.unitdir, ns=(before + 1, before + 1))
+        self.index.add(before, {self.rj_id_long(unit): unit})
+        with patch.object(self.index, 'rebuild') as rebuild:
+            self.assertEqual(
+                self.index.lookup([self.rj_id_long(unit)]), [unit])
+            rebuild.assert_not_called()
+
+        # 対応表が古い場合は更新せず、次回作り直す
+        unit2 = 'RJ.17.added.20200819202930.tt'
+        self.create(unit2)
+        os.utime(self.unitdir, ns=(before + 2, before + 2))
+        self.index.add(before, {self.rj_id_long(unit2): unit2})
+        with patch.object(self.index, 'rebuild', return_value={}) as rebuild:
+            self.index.units()
+            rebuild.assert_called_once_with()
+
+    def test_broken(self):
+        #
+        # 対応表のファイルが壊れている場合は作り直す
+        #
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{')
+        self.assertEqual(
+            self.index.lookup([self.rj_id_long(self.unit)]), [self.unit])
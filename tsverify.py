@@ -0,0 +1,285 @@
+"""
+録画ファイル(MPEG-TS)の整合性チェック
+
+録画ファイルをmmapで開き、188バイトのTSパケットをコピーせずに先頭から走査する。
+
+    sync:  パケット先頭の同期バイト(0x47)
+    CC:    PIDごとのcontinuity_counterの連続性
+    TEI:   transport_error_indicatorが立っているパケット
+    PCR:   最初にPCRを持つPIDのPCRから求めた録画時間
+
+録画ファイル名 "番組名.チャンネル番号.YYYYmmdd_HHMM.SS.ジョブID.ts" から
+ジョブIDを取り出し、ジョブのwalltimeと録画時間を比較する。
+結果は録画ファイルごとに "録画ファイル名.verify.json" に書き出す。
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import json
+import mmap
+import os
+import re
+import struct
+from rjsched.AtomicFile import write_atomic
+
+PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+NULL_PID = 0x1FFF
+PCR_HZ = 27000000
+PCR_WRAP = (1 << 33) * 300
+# PCRの間隔がこれを超える場合は受信断などの不連続とみなし、録画時間に含めない
+PCR_GAP = PCR_HZ
+# walltimeと録画時間の差の許容値(秒)
+# ジョブ開始から録画開始までのタイムラグを見込む
+TOLERANCE = 10
+SUFFIX = '.verify.json'
+
+HEADER = struct.Struct('>I184x')
+RE_RECORDING = re.compile(
+    r'(?P<title>.+)\.(?P<channel>\d+)\.'
+    r'(?P<date>\d{8}_\d{4}\.\d{2})\.(?P<jobid>\d+)\.ts$')
+
+def parse_filename(path):
+    """
+    録画ファイル名から番組名、チャンネル番号、録画開始時刻、ジョブIDを
+    取り出してdictで返す
+    録画ファイル名の形式でない場合はNoneを返す
+    """
+    m = RE_RECORDING.match(os.path.basename(path))
+    if not m:
+        return None
+    info = m.groupdict()
+    try:
+        info['date'] = datetime.strptime(info['date'], '%Y%m%d_%H%M.%S')
+    except ValueError:
+        return None
+    return info
+
+def job_key(jobid):
+    """
+    ジョブIDをwalltimeの対応表のキーにする
+    Torqueの録画ファイル名は"0012"のようにゼロ埋めされるため、
+    数値に戻して比較する
+    数字以外のジョブIDはNoneを返す
+    """
+    if not jobid or not jobid.isdigit():
+        return None
+    return str(int(jobid))
+
+def _find_sync(buf, size):
+    """
+    2パケット続けて同期バイトが現れる最初の位置を返す
+    見つからない場合はNoneを返す
+    """
+    for i in range(min(PACKET_SIZE, size)):
+        if buf[i] == SYNC_BYTE and (
+                i + PACKET_SIZE >= size or buf[i + PACKET_SIZE] == SYNC_BYTE):
+            return i
+    return None
+
+def _pcr(buf, offset):
+    """
+    パケットのadaptation fieldにPCRがあれば27MHz単位の値を返す
+    """
+    if buf[offset + 4] < 7 or not buf[offset + 5] & 0x10:
+        # adaptation_field_lengthが足りない、またはPCR_flagが立っていない
+        return None
+    b = buf[offset + 6:offset + 12]
+    base = (b[0] << 25) | (b[1] << 17) | (b[2] << 9) | (b[3] << 1) | (b[4] >> 7)
+    ext = ((b[4] & 0x01) << 8) | b[5]
+    return base * 300 + ext
+
+def scan_packets(buf, size):
+    """
+    TSパケットを走査し、集計結果をdictで返す
+
+    buf:  録画ファイルの内容 (mmap, bytesなど)
+    size: bufの長さ (int)
+    """
+    result = {
+        'size': size,
+        'packets': 0,
+        'offset': 0,
+        'trailing_bytes': 0,
+        'sync_errors': 0,
+        'cc_errors': 0,
+        'tei_packets': 0,
+        'pids': 0,
+        'pcr_pid': None,
+        'pcr_gaps': 0,
+        'duration': None,
+    }
+    start = _find_sync(buf, size)
+    if start is None:
+        result['sync_errors'] = 1 if size else 0
+        result['trailing_bytes'] = size
+        return result
+
+    packets = (size - start) // PACKET_SIZE
+    end = start + packets * PACKET_SIZE
+    result['offset'] = start
+    result['packets'] = packets
+    result['trailing_bytes'] = size - end
+
+    counters = {}
+    sync_errors = cc_errors = tei_packets = 0
+    pcr_pid = None
+    first_pcr = last_pcr = None
+    elapsed = 0
+    pcr_gaps = 0
+
+    view = memoryview(buf)[start:end]
+    try:
+        offset = start
+        for (header,) in HEADER.iter_unpack(view):
+            if header >> 24 != SYNC_BYTE:
+                sync_errors += 1
+                offset += PACKET_SIZE
+                continue
+            if header & 0x800000:
+                tei_packets += 1
+            pid = (header >> 8) & 0x1FFF
+            afc = (header >> 4) & 0x3
+            cc = header & 0xF
+
+            if afc & 0x2 and buf[offset + 4]:
+                if buf[offset + 5] & 0x80:
+                    # discontinuity_indicator
+                    counters.pop(pid, None)
+                if pcr_pid is None or pid == pcr_pid:
+                    pcr = _pcr(buf, offset)
+                    if pcr is not None:
+                        pcr_pid = pid
+                        if first_pcr is None:
+                            first_pcr = pcr
+                        else:
+                            delta = (pcr - last_pcr) % PCR_WRAP
+                            if delta > PCR_GAP:
+                                pcr_gaps += 1
+                            else:
+                                elapsed += delta
+                        last_pcr = pcr
+
+            if pid != NULL_PID and afc & 0x1:
+                # ペイロードを持つパケットのみcontinuity_counterが増える
+                # 同じ値が続くのは再送パケットとして許容する
+                last = counters.get(pid)
+                if last is not None and cc != last and cc != (last + 1) & 0xF:
+                    cc_errors += 1
+                counters[pid] = cc
+            elif pid != NULL_PID:
+                counters.setdefault(pid, cc)
+            offset += PACKET_SIZE
+    finally:
+        view.release()
+
+    result['sync_errors'] = sync_errors
+    result['cc_errors'] = cc_errors
+    result['tei_packets'] = tei_packets
+    result['pids'] = len(counters)
+    result['pcr_pid'] = pcr_pid
+    result['pcr_gaps'] = pcr_gaps
+    if first_pcr is not None:
+        result['duration'] = elapsed / PCR_HZ
+    return result
+
+def scan_file(path):
+    """
+    録画ファイルをmmapで開いて走査し、集計結果をdictで返す
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            # 空のファイルはmmapできない
+            return scan_packets(b'', 0)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            return scan_packets(buf, size)
+
+def judge(summary, tolerance=TOLERANCE):
+    """
+    集計結果に問題があればその内容のリストを返す
+    """
+    problems = []
+    if not summary['packets']:
+        problems.append('no packets')
+    for key in ('sync_errors', 'cc_errors', 'tei_packets'):
+        if summary[key]:
+            problems.append('{}: {}'.format(key, summary[key]))
+    if summary['duration'] is None:
+        if summary['packets']:
+            problems.append('no PCR')
+    elif summary['walltime'] is not None \
+            and summary['duration'] < summary['walltime'] - tolerance:
+        problems.append('short: {:.1f}s of {}s'.format(
+            summary['duration'], summary['walltime']))
+    return problems
+
+def verify_file(path, walltime=None, tolerance=TOLERANCE, write=True):
+    """
+    録画ファイルを検査し、結果をdictで返す
+    writeがTrueの場合は "録画ファイル名.verify.json" に書き出す
+
+    path:      録画ファイル (str)
+    walltime:  ジョブのwalltime(秒)。Noneの場合は録画時間を比較しない (int)
+    tolerance: walltimeより短い録画時間の許容値(秒) (int)
+    """
+    info = parse_filename(path) or {}
+    summary = {
+        'file': path,
+        'jobid': info.get('jobid'),
+        'walltime': walltime,
+        'checked': datetime.now().isoformat(timespec='seconds'),
+    }
+    try:
+        summary.update(scan_file(path))
+        summary['problems'] = judge(summary, tolerance)
+    except (OSError, ValueError) as err:
+        summary['problems'] = ['cannot read: {}'.format(err)]
+    summary['ok'] = not summary['problems']
+
+    if write:
+        write_summary(path + SUFFIX, summary)
+    return summary
+
+def write_summary(path, summary):
+    """
+    検査結果をJSONで書き込む
+    書き込みに失敗した場合は検査結果のproblemsに追加する
+    """
+    try:
+        write_atomic(
+            path, json.dumps(summary, indent=2, ensure_ascii=False) + '\n')
+    except OSError as err:
+        summary['problems'].append('cannot write summary: {}'.format(err))
+        summary['ok'] = False
+
+def is_verified(path):
+    """
+    録画ファイルより新しい検査結果があればTrueを返す
+    """
+    try:
+        return os.stat(path + SUFFIX).st_mtime >= os.stat(path).st_mtime
+    except OSError:
+        return False
+
+def _verify(args):
+    return verify_file(*args)
+
+def verify_files(paths, walltimes=None, tolerance=TOLERANCE, workers=None):
+    """
+    複数の録画ファイルをプロセスプールで並行して検査し、
+    検査結果のリストをpathsの順に返す
+
+    paths:     録画ファイルのリスト (list)
+    walltimes: {job_key()で変換したジョブID: walltime(秒)} (dict)
+    workers:   プロセス数。Noneの場合はCPU数 (int)
+    """
+    walltimes = walltimes or {}
+    tasks = []
+    for path in paths:
+        jobid = (parse_filename(path) or {}).get('jobid')
+        tasks.append((path, walltimes.get(job_key(jobid)), tolerance))
+    if len(tasks) < 2 or workers == 1:
+        return [_verify(i) for i in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_verify, tasks))